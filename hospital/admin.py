@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Patient, Doctor, Prescription, Test, Medicine, DoctorNotes, MedicalReport, PatientVisit, TestReport
+from .models import User, Patient, Doctor, Prescription, Test, Medicine, DoctorNotes, MedicalReport, PatientVisit, TestReport, PatientLoginJob
 
 
 @admin.register(User)
@@ -91,3 +91,11 @@ class TestReportAdmin(admin.ModelAdmin):
     list_filter = ['test_type', 'uploaded_at', 'test_date']
     search_fields = ['patient__patient_name', 'test_type']
     readonly_fields = ['uploaded_at']
+
+
+@admin.register(PatientLoginJob)
+class PatientLoginJobAdmin(admin.ModelAdmin):
+    list_display = ['patient', 'clinic', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['status', 'clinic']
+    search_fields = ['patient__patient_id', 'patient__patient_name']
+    readonly_fields = ['created_at', 'updated_at', 'last_error']
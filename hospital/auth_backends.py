@@ -0,0 +1,22 @@
+"""
+Authentication backend that loads the user together with their clinic.
+
+TenantMiddleware falls back to request.user.clinic when the URL has no
+clinic slug, and most views read it too; with the stock ModelBackend that
+is a second query on every authenticated request.
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class ClinicUserBackend(ModelBackend):
+    """ModelBackend whose get_user() (run once per request) joins the clinic"""
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('clinic').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
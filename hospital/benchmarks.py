@@ -0,0 +1,399 @@
+"""
+Repeatable benchmarks of the clinic-scoped hot endpoints.
+
+run_benchmarks() drives each scenario through the Django test client as the
+right user (receptionist or doctor of the clinic), against whatever data
+the database holds - normally a clinic made by `generate_synthetic_data`.
+Every request runs inside a transaction that is rolled back, so the POST
+scenarios leave the data as they found it and runs stay comparable.
+
+Each scenario reports latency percentiles (ms) and SQL query counts.
+compare_to_baseline() flags scenarios that got slower or run more queries
+than a stored run; `manage.py benchmark --baseline FILE` fails on those.
+
+compare_handlers() replays the async JSON endpoints concurrently through
+Django's real WSGI and ASGI handlers (`manage.py handler_benchmark`): a
+thread per concurrent request for WSGI, one event loop for ASGI.
+"""
+
+import asyncio
+import contextlib
+import io
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import django
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .metrics import QueryRecorder
+from .models import Doctor, Patient, PatientAdmission, Prescription
+from .tenant_databases import clinic_context, clinic_database
+
+PERCENTILES = (50, 95, 99)
+# A scenario regresses when its p95 grows by more than the tolerance AND by
+# at least this many milliseconds (tiny timings are mostly noise)
+MIN_REGRESSION_MS = 2.0
+
+
+class BenchmarkError(Exception):
+    """The clinic has no data to benchmark against"""
+
+
+class Scenario:
+    def __init__(self, name, role, url_name, method='GET', url_kwargs=None, params=None, data=None):
+        self.name = name
+        self.role = role
+        self.url_name = url_name
+        self.method = method
+        self.url_kwargs = url_kwargs or (lambda fixture: {})
+        self.params = params or {}
+        self.data = data or {}
+
+    def url(self, fixture):
+        return reverse(self.url_name, kwargs={'clinic_slug': fixture.clinic.slug, **self.url_kwargs(fixture)})
+
+
+def _prescription(fixture):
+    return {'prescription_id': fixture.prescription.pk}
+
+
+SCENARIOS = [
+    Scenario('patient_search', 'receptionist', 'patient_search', params=lambda f: {'q': f.search_term}),
+    Scenario('checkin_dashboard', 'receptionist', 'checkin_dashboard'),
+    Scenario('checkin_dashboard_search', 'receptionist', 'checkin_dashboard_search',
+             params=lambda f: {'q': f.search_term}),
+    Scenario('doctor_dashboard', 'doctor', 'doctor_dashboard'),
+    Scenario('doctor_dashboard_prescriptions_ajax', 'doctor', 'doctor_dashboard_prescriptions_ajax'),
+    Scenario('add_prescription_details', 'doctor', 'add_prescription_details', url_kwargs=_prescription),
+    Scenario('add_prescription_details:add_medicine', 'doctor', 'add_prescription_details', 'POST',
+             url_kwargs=_prescription, data={
+                 'action': 'add_medicine', 'medicine_type': 'tablet', 'medicine_name': 'Paracetamol',
+                 'dosage': '500mg', 'frequency_per_day': 2, 'duration': '5 days', 'schedule': 'morning_night',
+                 'qty': 10, 'food_instruction': 'after', 'instructions': '',
+             }),
+    Scenario('add_prescription_details:add_test', 'doctor', 'add_prescription_details', 'POST',
+             url_kwargs=_prescription, data={
+                 'action': 'add_test', 'test_type': 'blood', 'test_name': 'Complete Blood Count', 'description': '',
+             }),
+    Scenario('add_prescription_details:save_vitals', 'doctor', 'add_prescription_details', 'POST',
+             url_kwargs=_prescription, data={
+                 'action': 'save_vitals', 'bp': '120/80', 'pulse': '72', 'temp': '98.6', 'spo2': '98', 'sugar': '',
+             }),
+    Scenario('add_prescription_details:save_notes', 'doctor', 'add_prescription_details', 'POST',
+             url_kwargs=_prescription, data={
+                 'action': 'save_notes', 'checkin_purpose': 'Fever', 'observations': 'Fever for two days',
+                 'diagnosis': 'Viral fever', 'treatment_plan': 'Rest and fluids', 'notes': '',
+             }),
+    Scenario('print_prescription', 'doctor', 'print_prescription', url_kwargs=_prescription),
+    Scenario('api_master_medicines', 'doctor', 'api_master_medicines', params={'q': 'para'}),
+    Scenario('api_master_tests', 'doctor', 'api_master_tests'),
+    Scenario('search_prescription_templates', 'doctor', 'search_prescription_templates', params={'q': 'fe'}),
+    Scenario('admissions_dashboard', 'doctor', 'admissions_dashboard'),
+]
+
+SCENARIO_NAMES = [scenario.name for scenario in SCENARIOS]
+# The async views; compare_handlers() replays these
+ASYNC_SCENARIO_NAMES = [
+    'patient_search', 'checkin_dashboard_search', 'doctor_dashboard_prescriptions_ajax',
+    'api_master_medicines', 'api_master_tests', 'search_prescription_templates',
+]
+
+
+class BenchmarkFixture:
+    """The users and records of ``clinic`` the scenarios act on"""
+
+    def __init__(self, clinic):
+        self.clinic = clinic
+        User = get_user_model()
+
+        self.receptionist = User.objects.filter(clinic=clinic, role='receptionist', is_active=True).order_by('pk').first()
+        # The busiest doctor, so the dashboards have the most to show
+        self.doctor = (
+            Doctor.objects.filter(clinic=clinic)
+            .annotate(total=Count('prescriptions'))
+            .order_by('-total', 'pk')
+            .select_related('user')
+            .first()
+        )
+        if not self.receptionist or not self.doctor:
+            raise BenchmarkError(f"Clinic '{clinic.slug}' needs a receptionist and a doctor")
+
+        self.prescription = (
+            Prescription.objects.all_clinics()
+            .filter(clinic=clinic, doctor=self.doctor)
+            .order_by('-prescription_date', '-pk')
+            .first()
+        )
+        if not self.prescription:
+            raise BenchmarkError(f"Doctor {self.doctor.user.username} has no prescriptions in '{clinic.slug}'")
+
+        # Start of a real surname, so the searches have candidates to rank
+        name = (
+            Patient.objects.all_clinics().filter(clinic=clinic).order_by('pk')
+            .values_list('patient_name', flat=True).first()
+        ) or 'a'
+        self.search_term = name.split()[-1][:4]
+        self.has_admissions = PatientAdmission.objects.all_clinics().filter(clinic=clinic).exists()
+
+    def user_for(self, role):
+        return self.receptionist if role == 'receptionist' else self.doctor.user
+
+
+# ==================== RUNNING ====================
+
+def _percentile(sorted_values, percent):
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[rank - 1]
+
+
+def _summary(timings, queries, statuses):
+    timings = sorted(timings)
+    queries = sorted(queries)
+    result = {
+        'requests': len(timings),
+        'status': sorted(set(statuses)),
+        'mean_ms': round(sum(timings) / len(timings), 2),
+    }
+    for percent in PERCENTILES:
+        result[f'p{percent}_ms'] = round(_percentile(timings, percent), 2)
+    result['queries'] = queries[len(queries) // 2]
+    result['queries_max'] = queries[-1]
+    return result
+
+
+def run_scenario(scenario, fixture, client, iterations, warmup):
+    url = scenario.url(fixture)
+    using = clinic_database(fixture.clinic)
+    params = scenario.params(fixture) if callable(scenario.params) else scenario.params
+    timings, queries, statuses = [], [], []
+    for iteration in range(warmup + iterations):
+        recorder = QueryRecorder()
+        with transaction.atomic(using=using):
+            with recorder.active():
+                start = time.perf_counter()
+                if scenario.method == 'POST':
+                    response = client.post(url, scenario.data)
+                else:
+                    response = client.get(url, params)
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True, using=using)
+        if iteration >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(recorder.queries)
+            statuses.append(response.status_code)
+    return _summary(timings, queries, statuses)
+
+
+def run_benchmarks(clinic, iterations=20, warmup=2, only=None):
+    """Run the scenarios (all, or the names in ``only``); returns a JSON-able report"""
+    # Outside a request: route the clinic's queries as its requests are routed
+    with clinic_context(clinic):
+        fixture = BenchmarkFixture(clinic)
+    clients = {}
+    for role in ('receptionist', 'doctor'):
+        clients[role] = Client(HTTP_HOST='localhost')
+        clients[role].force_login(fixture.user_for(role))
+
+    results = {}
+    # Views still print debug output; keep it out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for scenario in SCENARIOS:
+            if only and scenario.name not in only:
+                continue
+            results[scenario.name] = run_scenario(scenario, fixture, clients[scenario.role], iterations, warmup)
+
+    with clinic_context(clinic):
+        dataset = {
+            'patients': Patient.objects.all_clinics().filter(clinic=clinic).count(),
+            'prescriptions': Prescription.objects.all_clinics().filter(clinic=clinic).count(),
+            'admissions': fixture.has_admissions,
+        }
+    return {
+        'clinic': clinic.slug,
+        'created_at': timezone.now().isoformat(),
+        'iterations': iterations,
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections[clinic_database(clinic)].vendor,
+        },
+        'dataset': dataset,
+        'scenarios': results,
+    }
+
+
+# ==================== BASELINES ====================
+
+def compare_to_baseline(report, baseline, tolerance=0.2):
+    """
+    Regressions of ``report`` against ``baseline`` (both run_benchmarks()
+    reports): p95 latency up by more than ``tolerance`` (and at least
+    MIN_REGRESSION_MS), or a higher median query count than before.
+    """
+    regressions = []
+    for name, current in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        allowed = before['p95_ms'] * (1 + tolerance)
+        if current['p95_ms'] > allowed and current['p95_ms'] - before['p95_ms'] >= MIN_REGRESSION_MS:
+            regressions.append(
+                f"{name}: p95 {current['p95_ms']}ms, baseline {before['p95_ms']}ms (+{tolerance:.0%} allowed)"
+            )
+        if current['queries'] > before['queries']:
+            regressions.append(f"{name}: {current['queries']} queries, baseline {before['queries']}")
+    return regressions
+
+
+# ==================== WSGI VS ASGI ====================
+
+def _wsgi_get(handler, path, query, cookie):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost', 'HTTP_COOKIE': cookie, 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    status = []
+    response = handler(environ, lambda line, headers, exc_info=None: status.append(int(line.split()[0])))
+    try:
+        for _chunk in response:
+            pass
+    finally:
+        response.close()
+    return status[0]
+
+
+async def _asgi_get(handler, path, query, cookie):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    body_sent = False
+    status = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client never disconnects; the handler cancels this wait when done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await handler(scope, receive, send)
+    return status[0]
+
+
+def _handler_summary(mode, concurrency, elapsed, timings, statuses):
+    timings = sorted(timings)
+    summary = {
+        'mode': mode,
+        'concurrency': concurrency,
+        'requests': len(timings),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(timings) / elapsed, 1) if elapsed else None,
+        'statuses': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+    }
+    for percent in PERCENTILES:
+        summary[f'p{percent}_ms'] = round(_percentile(timings, percent), 2)
+    return summary
+
+
+def _run_wsgi(requests, concurrency):
+    handler = WSGIHandler()
+
+    def one(request):
+        start = time.perf_counter()
+        status = _wsgi_get(handler, *request)
+        return (time.perf_counter() - start) * 1000, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, requests))
+    return time.perf_counter() - start, results
+
+
+async def _run_asgi(requests, concurrency):
+    handler = ASGIHandler()
+    pending = iter(requests)
+    results = []
+
+    async def worker():
+        for request in pending:
+            start = time.perf_counter()
+            # As an ASGI server would: each request's sync work shares one thread
+            async with ThreadSensitiveContext():
+                status = await _asgi_get(handler, *request)
+            results.append(((time.perf_counter() - start) * 1000, status))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, results
+
+
+def compare_handlers(clinic, requests=1000, concurrency=50, modes=('wsgi', 'asgi'), only=None):
+    """
+    Replay the async JSON endpoints (ASYNC_SCENARIO_NAMES, or ``only``)
+    round-robin, ``requests`` GETs per mode with ``concurrency`` in flight,
+    through WSGIHandler and ASGIHandler. Requests are not rolled back, so
+    only read-only scenarios belong here.
+    """
+    with clinic_context(clinic):
+        fixture = BenchmarkFixture(clinic)
+    cookies = {}
+    for role in ('receptionist', 'doctor'):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(fixture.user_for(role))
+        cookies[role] = '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+
+    scenarios = [s for s in SCENARIOS if s.name in (only or ASYNC_SCENARIO_NAMES) and s.method == 'GET']
+    if not scenarios:
+        raise BenchmarkError("No GET scenarios selected")
+    targets = []
+    for scenario in scenarios:
+        params = scenario.params(fixture) if callable(scenario.params) else scenario.params
+        targets.append((scenario.url(fixture), urlencode(params), cookies[scenario.role]))
+    replay = [targets[i % len(targets)] for i in range(requests)]
+
+    results = {}
+    for mode in modes:
+        # One untimed pass first: warms caches and indexes, checks the URLs
+        if mode == 'wsgi':
+            _run_wsgi(targets, 1)
+            elapsed, measured = _run_wsgi(replay, concurrency)
+        else:
+            asyncio.run(_run_asgi(targets, 1))
+            elapsed, measured = asyncio.run(_run_asgi(replay, concurrency))
+        results[mode] = _handler_summary(
+            mode, concurrency, elapsed, [t for t, _ in measured], [s for _, s in measured]
+        )
+
+    return {
+        'clinic': clinic.slug,
+        'created_at': timezone.now().isoformat(),
+        'scenarios': [scenario.name for scenario in scenarios],
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections[clinic_database(clinic)].vendor,
+        },
+        'results': results,
+    }
@@ -0,0 +1,85 @@
+"""
+Per-process slug -> Clinic resolution cache.
+
+Shared by TenantMiddleware and the views so a clinic-scoped request
+resolves its clinic without hitting the database in steady state.
+Entries expire after CLINIC_CACHE_TTL seconds and are dropped whenever
+a Clinic is saved or deleted (see hospital.signals).
+
+Cached Clinic instances are shared between requests - treat them as
+read-only and re-fetch the row before editing it.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_TTL = 300  # seconds
+
+_lock = threading.Lock()
+_entries = {}  # slug -> (expires_at, clinic)
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _ttl():
+    return getattr(settings, 'CLINIC_CACHE_TTL', DEFAULT_TTL)
+
+
+def get_clinic_by_slug(slug):
+    """Return the Clinic for ``slug`` (or None), using the process cache"""
+    if not slug:
+        return None
+
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(slug)
+        if entry and entry[0] > now:
+            _stats['hits'] += 1
+            return entry[1]
+        _stats['misses'] += 1
+
+    from hospital.models import Clinic
+    try:
+        clinic = Clinic.objects.get(slug=slug)
+    except Clinic.DoesNotExist:
+        return None
+
+    with _lock:
+        _entries[slug] = (now + _ttl(), clinic)
+    return clinic
+
+
+def invalidate_clinic(clinic=None, slug=None):
+    """Drop cached entries for a clinic (by instance or slug)"""
+    with _lock:
+        _stats['invalidations'] += 1
+        if slug:
+            _entries.pop(slug, None)
+        if clinic is not None:
+            # The slug may have changed, so also drop any entry holding this pk
+            for key, (_, cached) in list(_entries.items()):
+                if cached.pk == clinic.pk:
+                    del _entries[key]
+
+
+def clear_clinic_cache():
+    """Empty the cache (used by tests and after bulk clinic changes)"""
+    with _lock:
+        _entries.clear()
+
+
+def clinic_cache_stats():
+    """Return hit/miss counters and current size"""
+    with _lock:
+        stats = dict(_stats)
+        stats['size'] = len(_entries)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def reset_clinic_cache_stats():
+    with _lock:
+        for key in _stats:
+            _stats[key] = 0
@@ -0,0 +1,205 @@
+"""
+Read-replica routing for the dashboards and reports.
+
+Views marked with @replica_read (or named in settings.REPLICA_VIEWS) read
+from the 'replica' database alias on GET/HEAD requests; everything else,
+and every write, uses 'default'. Nothing changes while DATABASES has no
+'replica' entry.
+
+- Read-your-writes: after a POST/PUT/PATCH/DELETE, the browser gets a
+  short-lived cookie and reads from the primary for REPLICA_STICKY_SECONDS,
+  so a form submit is never followed by a dashboard that lacks it.
+- Lag: replica_lag() is checked at most every REPLICA_LAG_CHECK_INTERVAL
+  seconds per process; when the replica is further behind than
+  REPLICA_MAX_LAG seconds (or unreachable) reads fall back to the primary.
+
+Locally, point DB_REPLICA_NAME at a second SQLite file and keep it fed with
+`manage.py sync_sqlite_replica --every 5`, or use two PostgreSQL instances
+(DB_REPLICA_HOST / DB_REPLICA_PORT).
+"""
+
+import logging
+import os
+import threading
+import time
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'read_primary'
+SAFE_METHODS = frozenset(['GET', 'HEAD'])
+# Only the app's own tables: sessions, auth permissions etc. stay on the primary
+REPLICA_APPS = frozenset(['hospital'])
+# ... and so do the logins: authentication must not see a lagging password
+# or a deactivated account
+PRIMARY_MODELS = frozenset(['user'])
+
+DEFAULT_MAX_LAG = 10  # seconds
+DEFAULT_STICKY_SECONDS = 15
+DEFAULT_LAG_CHECK_INTERVAL = 5
+
+_local = Local()
+_lag_lock = threading.Lock()
+_lag = {'checked_at': None, 'lag': None}
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def replica_read(view_func):
+    """Let GET requests to this view read from the replica"""
+    # Outer decorators built with functools.wraps carry the attribute along
+    view_func.replica_read = True
+    return view_func
+
+
+def reads_from_replica():
+    return getattr(_local, 'use_replica', False)
+
+
+# ==================== LAG ====================
+
+def sqlite_sync_marker(replica_path):
+    """File whose mtime records when sync_sqlite_replica last copied the primary"""
+    return f"{replica_path}-synced"
+
+
+def _sqlite_mtime(path):
+    # With WAL, recent commits sit in the -wal file until a checkpoint
+    return max((os.path.getmtime(p) for p in (str(path), f"{path}-wal") if os.path.exists(p)), default=0)
+
+
+def measure_replica_lag():
+    """Seconds the replica is behind the primary, or None if unknown/unreachable"""
+    replica = settings.DATABASES[REPLICA]
+    try:
+        if replica['ENGINE'] == 'django.db.backends.sqlite3':
+            # A file copy (sync_sqlite_replica): behind by the primary's writes since the copy
+            marker = sqlite_sync_marker(replica['NAME'])
+            if not os.path.exists(marker):
+                return None
+            primary = settings.DATABASES['default']['NAME']
+            return max(0.0, _sqlite_mtime(primary) - os.path.getmtime(marker))
+        if connections[REPLICA].vendor == 'postgresql':
+            with connections[REPLICA].cursor() as cursor:
+                # NULL on a server that is not a standby (e.g. a second local instance)
+                cursor.execute("SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())")
+                lag = cursor.fetchone()[0]
+            return max(0.0, float(lag)) if lag is not None else 0.0
+        return 0.0
+    except (DatabaseError, OSError) as e:
+        logger.warning("Replica lag check failed: %s", e)
+        return None
+
+
+def replica_lag():
+    """measure_replica_lag(), re-measured at most every REPLICA_LAG_CHECK_INTERVAL seconds"""
+    interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', DEFAULT_LAG_CHECK_INTERVAL)
+    now = time.monotonic()
+    with _lag_lock:
+        if _lag['checked_at'] is not None and now - _lag['checked_at'] < interval:
+            return _lag['lag']
+        # Claim the check so concurrent requests keep using the last value
+        _lag['checked_at'] = now
+    lag = measure_replica_lag()
+    with _lag_lock:
+        _lag['lag'] = lag
+    return lag
+
+
+def replica_usable():
+    lag = replica_lag()
+    return lag is not None and lag <= getattr(settings, 'REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+
+
+# ==================== ROUTER ====================
+
+class ReplicaRouter:
+    """Reads of the current request go to the replica when the middleware allows it"""
+
+    def db_for_read(self, model, **hints):
+        if (
+            reads_from_replica()
+            and model._meta.app_label in REPLICA_APPS
+            and model._meta.model_name not in PRIMARY_MODELS
+        ):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # No opinion: writes fall through to 'default' (or the instance's database)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        return db != REPLICA
+
+
+# ==================== MIDDLEWARE ====================
+
+class ReplicaRoutingMiddleware:
+    """Switch replica views to the replica; keep writers on the primary for a while"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _local.use_replica = False
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.use_replica = False
+        return self._mark_writer(request, response)
+
+    async def __acall__(self, request):
+        _local.use_replica = False
+        try:
+            response = await self.get_response(request)
+        finally:
+            _local.use_replica = False
+        return self._mark_writer(request, response)
+
+    @staticmethod
+    def _mark_writer(request, response):
+        if request.method not in SAFE_METHODS and replica_configured():
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in SAFE_METHODS
+            and replica_configured()
+            and STICKY_COOKIE not in request.COOKIES
+            and self._is_replica_view(request, view_func)
+            and replica_usable()
+        ):
+            _local.use_replica = True
+        return None
+
+    @staticmethod
+    def _is_replica_view(request, view_func):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if url_name in getattr(settings, 'REPLICA_VIEWS', ()):
+            return True
+        return getattr(view_func, 'replica_read', False)
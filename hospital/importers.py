@@ -0,0 +1,279 @@
+"""
+Bulk patient import from CSV or XLSX.
+
+Rows are streamed and written in fixed-size batches, so memory stays flat
+no matter how large the file is. Each batch:
+
+- skips phone numbers already registered in the clinic (or seen earlier
+  in the file), compared by their digits, looked up through the search
+  index's phone tokens
+- reserves a block of patient IDs from PatientIdSequence
+- bulk_creates the Patients
+- adds the new patients to the search index (bulk_create skips signals)
+- queues a PatientLoginJob per patient when logins are wanted
+
+Used by `manage.py import_patients` and the clinic admin upload page.
+
+The login accounts are not created here: hashing their passwords at full
+cost would dominate the import, and a cheaper hash would stay weak for every
+patient who never logs in. The login queue (hospital.provisioning) creates
+them with the regular hasher - through create_user(), so the signals that
+copy Users into a clinic's own database run too. Callers start the worker
+(kick_worker) or run `manage.py process_login_jobs` afterwards.
+"""
+
+import csv
+import io
+import zipfile
+from datetime import date, datetime
+
+import openpyxl
+from django.db import router, transaction
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .models import Patient, PatientLoginJob, PatientSearchToken
+from .search import get_search_backend, phone_digits
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Accepted header spellings -> Patient field
+COLUMN_ALIASES = {
+    'patient_name': 'patient_name', 'name': 'patient_name', 'patient name': 'patient_name', 'full name': 'patient_name',
+    'phone_number': 'phone_number', 'phone': 'phone_number', 'mobile': 'phone_number', 'phone number': 'phone_number',
+    'age': 'age',
+    'gender': 'gender', 'sex': 'gender',
+    'address': 'address',
+    'date_of_birth': 'date_of_birth', 'dob': 'date_of_birth', 'date of birth': 'date_of_birth',
+    'weight': 'weight',
+}
+REQUIRED_COLUMNS = {'patient_name', 'phone_number'}
+
+GENDER_VALUES = {
+    'm': 'male', 'male': 'male',
+    'f': 'female', 'female': 'female',
+    'o': 'other', 'other': 'other',
+}
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y']
+
+
+class PatientImportError(ValueError):
+    """The file cannot be imported at all (bad format or missing columns)"""
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.logins_queued = 0
+        self.duplicates = 0
+        self.errors = []  # (row number, message)
+
+    @property
+    def skipped(self):
+        return self.duplicates + len(self.errors)
+
+    def __str__(self):
+        return (
+            f"{self.rows} rows: {self.created} patients created, "
+            f"{self.duplicates} duplicate phones skipped, {len(self.errors)} invalid rows"
+        )
+
+
+# ==================== READING ====================
+
+def read_rows(fileobj, filename=''):
+    """
+    Yield (row number, {field: raw value}) from a CSV or XLSX upload.
+    Row numbers are 1-based and count the header line.
+    """
+    if filename.lower().endswith('.xlsx'):
+        rows = _xlsx_rows(fileobj)
+    else:
+        rows = _csv_rows(fileobj)
+
+    header = next(rows, None)
+    if not header:
+        raise PatientImportError("The file is empty")
+    fields = [COLUMN_ALIASES.get(str(col or '').strip().lower()) for col in header]
+    missing = REQUIRED_COLUMNS - set(fields)
+    if missing:
+        raise PatientImportError(f"Missing required column(s): {', '.join(sorted(missing))}")
+
+    for number, values in enumerate(rows, start=2):
+        row = {field: value for field, value in zip(fields, values) if field}
+        if any(str(value).strip() for value in row.values() if value is not None):
+            yield number, row
+
+
+def _csv_rows(fileobj):
+    if isinstance(fileobj, io.TextIOBase):
+        text = fileobj
+    else:
+        # utf-8-sig drops the BOM Excel writes at the start of CSV exports
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', errors='replace', newline='')
+    return iter(csv.reader(text))
+
+
+def _xlsx_rows(fileobj):
+    try:
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile, KeyError):
+        raise PatientImportError("The file is not a valid XLSX workbook")
+    return workbook.active.iter_rows(values_only=True)
+
+
+# ==================== CLEANING ====================
+
+def clean_row(row):
+    """Return Patient field values for a raw row; raises ValueError"""
+    name = str(row.get('patient_name') or '').strip()
+    if not name:
+        raise ValueError("patient name is required")
+
+    phone = str(row.get('phone_number') or '').strip()
+    if isinstance(row.get('phone_number'), float):
+        phone = str(int(row['phone_number']))  # spreadsheets store numbers as floats
+    if not phone:
+        raise ValueError("phone number is required")
+    if not phone_digits(phone):
+        raise ValueError(f"invalid phone number '{phone}'")
+    if len(phone) > 15:
+        raise ValueError(f"phone number '{phone}' is too long")
+
+    date_of_birth = _parse_date(row.get('date_of_birth'))
+
+    age = row.get('age')
+    if age in (None, ''):
+        if not date_of_birth:
+            raise ValueError("age or date of birth is required")
+        today = date.today()
+        age = today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+    try:
+        age = int(float(age))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid age '{age}'")
+
+    gender = str(row.get('gender') or '').strip().lower()
+    if gender and gender not in GENDER_VALUES:
+        raise ValueError(f"invalid gender '{gender}'")
+
+    weight = row.get('weight')
+    if weight in (None, ''):
+        weight = None
+    else:
+        try:
+            weight = float(weight)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid weight '{weight}'")
+
+    return {
+        'patient_name': name[:100],
+        'phone_number': phone,
+        'age': age,
+        'gender': GENDER_VALUES.get(gender, ''),
+        'address': str(row.get('address') or '').strip(),
+        'date_of_birth': date_of_birth,
+        'weight': weight,
+    }
+
+
+def _parse_date(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date of birth '{value}'")
+
+
+# ==================== IMPORTING ====================
+
+class PatientImporter:
+    """
+    Import patients into ``clinic``.
+
+    progress(result) is called after every batch with the running ImportResult.
+    """
+
+    def __init__(self, clinic, registered_by=None, create_logins=True,
+                 batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        self.clinic = clinic
+        self.registered_by = registered_by
+        self.create_logins = create_logins
+        self.batch_size = batch_size
+        self.progress = progress
+        self._seen_phones = set()
+
+    def run(self, rows):
+        """Import (row number, raw row) pairs from read_rows()"""
+        result = ImportResult()
+        batch = []
+        for number, row in rows:
+            result.rows += 1
+            try:
+                batch.append(clean_row(row))
+            except ValueError as e:
+                result.errors.append((number, str(e)))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch, result)
+                batch = []
+        if batch:
+            self._import_batch(batch, result)
+        return result
+
+    def import_file(self, fileobj, filename=''):
+        return self.run(read_rows(fileobj, filename))
+
+    def _import_batch(self, batch, result):
+        # Dedupe by phone digits ('98765 43210' == '9876543210') against the
+        # clinic and earlier rows of the file. The search index keeps every
+        # patient's phone digits reversed (hospital.search)
+        reversed_digits = {phone_digits(values['phone_number'])[::-1] for values in batch}
+        existing = {
+            token[::-1] for token in PatientSearchToken.objects.filter(
+                clinic=self.clinic, kind='phone', token__in=reversed_digits,
+            ).values_list('token', flat=True)
+        }
+        fresh = []
+        for values in batch:
+            phone = phone_digits(values['phone_number'])
+            if phone in existing or phone in self._seen_phones:
+                result.duplicates += 1
+                continue
+            self._seen_phones.add(phone)
+            fresh.append(values)
+
+        if fresh:
+            with transaction.atomic(using=router.db_for_write(Patient)):
+                patient_ids = Patient.allocate_patient_ids(self.clinic, len(fresh))
+                patients = [
+                    Patient(
+                        clinic=self.clinic,
+                        patient_id=patient_id,
+                        registered_by=self.registered_by,
+                        **values,
+                    )
+                    for patient_id, values in zip(patient_ids, fresh)
+                ]
+                for patient in patients:
+                    patient.default_password = patient.generate_default_password()
+
+                Patient.objects.bulk_create(patients)
+                get_search_backend().index_patients(patients)
+
+                if self.create_logins:
+                    jobs = PatientLoginJob.objects.bulk_create([
+                        PatientLoginJob(clinic=self.clinic, patient=patient) for patient in patients
+                    ])
+                    result.logins_queued += len(jobs)
+            result.created += len(patients)
+
+        if self.progress:
+            self.progress(result)
@@ -0,0 +1,196 @@
+"""
+Live check-in queue: visit events pushed to the dashboards over SSE.
+
+Saving a PatientVisit (check-in, status update, completing the
+prescription) publishes a 'created' or 'status_changed' event for its
+clinic once the transaction commits (see hospital.signals). The
+checkin_queue_stream view turns the clinic's events into a
+text/event-stream: first a snapshot of today's open visits, then one
+event per change, with a comment line every LIVE_QUEUE_HEARTBEAT seconds
+to keep proxies from closing the connection. A stream ends after
+LIVE_QUEUE_STREAM_SECONDS; EventSource reconnects by itself and gets a
+fresh snapshot, so a missed event never sticks.
+
+Streams hold their connection open, so serve the site with an ASGI
+server (santkrupa_hospital/asgi.py, e.g. `uvicorn
+santkrupa_hospital.asgi:application`); under WSGI a stream occupies a
+worker thread for its whole lifetime. live_queue_enabled() therefore
+only turns the streams on for requests served through ASGI, unless
+LIVE_QUEUE_ENABLED says otherwise; without them the dashboards are
+reloaded by hand as before.
+
+The default broker is in-process: only events published by the same
+process reach a stream. With several worker processes point
+LIVE_QUEUE_BROKER at a broker every process shares - any class with
+publish(clinic_id, event) and an async context manager
+subscribe(clinic_id) yielding an asyncio.Queue.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER = 'hospital.live_queue.InProcessBroker'
+DEFAULT_HEARTBEAT = 15  # seconds
+DEFAULT_STREAM_SECONDS = 300
+RETRY_MS = 3000
+# Events a slow stream may fall behind before it is told to resync
+MAX_PENDING_EVENTS = 500
+
+# Visits that are still waiting or being seen
+OPEN_STATUSES = ('checked_in', 'in_consultation')
+RESYNC = {'type': 'resync'}
+
+_broker = None
+_broker_lock = threading.Lock()
+_event_ids = itertools.count(1)
+
+
+def live_queue_enabled(request):
+    """
+    Whether pages served for ``request`` open the event stream.
+    settings.LIVE_QUEUE_ENABLED: None (default) = only under ASGI, or
+    True / False to force it.
+    """
+    enabled = getattr(settings, 'LIVE_QUEUE_ENABLED', None)
+    if enabled is None:
+        return isinstance(request, ASGIRequest)
+    return bool(enabled)
+
+
+# ==================== BROKER ====================
+
+class InProcessBroker:
+    """Per-process pub/sub: publish from any thread, subscribe on an event loop"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # clinic_id -> {(loop, queue)}
+
+    def publish(self, clinic_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(clinic_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # The stream's loop has closed; it unsubscribes on its way out
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, clinic_id):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(MAX_PENDING_EVENTS))
+        with self._lock:
+            self._subscribers.setdefault(clinic_id, set()).add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(clinic_id, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(clinic_id, None)
+
+
+def _offer(queue, event):
+    """Queue ``event``; a stream that fell too far behind starts over from a snapshot"""
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(RESYNC)
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'LIVE_QUEUE_BROKER', DEFAULT_BROKER))()
+        return _broker
+
+
+# ==================== EVENTS ====================
+
+def visit_payload(visit, patient):
+    check_in = timezone.localtime(visit.check_in_date) if visit.check_in_date else None
+    return {
+        'visit_id': visit.pk,
+        'status': visit.status,
+        'status_display': visit.get_status_display(),
+        'patient_pk': patient.pk,
+        'patient_id': patient.patient_id,
+        'patient_name': patient.patient_name,
+        'check_in_date': check_in.strftime('%Y-%m-%d %H:%M') if check_in else '',
+        'check_in_time': check_in.strftime('%I:%M %p') if check_in else '',
+        'is_today': bool(check_in) and check_in.date() == timezone.localdate(),
+    }
+
+
+def publish_visit_event(visit, kind):
+    """Send a 'created' / 'status_changed' event for ``visit`` to its clinic's streams"""
+    if not visit.clinic_id:
+        return
+    try:
+        event = {'type': kind, 'visit': visit_payload(visit, visit.patient)}
+        get_broker().publish(visit.clinic_id, event)
+    except Exception:
+        # A live update is never worth failing the check-in for
+        logger.exception("Could not publish live queue event for visit %s", visit.pk)
+
+
+def queue_snapshot(clinic):
+    """Today's open visits of ``clinic``, oldest first"""
+    from .models import PatientVisit
+    from .tenant_databases import clinic_context
+
+    today = timezone.localdate()
+    with clinic_context(clinic):
+        visits = (
+            PatientVisit.objects.filter(clinic=clinic, check_in_date__date=today, status__in=OPEN_STATUSES)
+            .select_related('patient').order_by('check_in_date')
+        )
+        return {'type': 'snapshot', 'visits': [visit_payload(visit, visit.patient) for visit in visits]}
+
+
+# ==================== STREAM ====================
+
+def format_sse(event, retry=None):
+    lines = [f"id: {next(_event_ids)}", f"event: {event['type']}"]
+    if retry:
+        lines.append(f"retry: {retry}")
+    lines.append(f"data: {json.dumps(event)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+async def event_stream(clinic):
+    """The text/event-stream body for one connection to ``clinic``'s queue"""
+    snapshot = sync_to_async(queue_snapshot)
+    heartbeat = getattr(settings, 'LIVE_QUEUE_HEARTBEAT', DEFAULT_HEARTBEAT)
+    lifetime = getattr(settings, 'LIVE_QUEUE_STREAM_SECONDS', DEFAULT_STREAM_SECONDS)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lifetime
+
+    # Subscribe first so nothing committed while the snapshot loads is lost
+    async with get_broker().subscribe(clinic.pk) as queue:
+        yield format_sse(await snapshot(clinic), retry=RETRY_MS)
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event['type'] == RESYNC['type']:
+                event = await snapshot(clinic)
+            yield format_sse(event)
@@ -0,0 +1,357 @@
+"""
+Concurrent load generator that replays a clinic day over HTTP.
+
+Unlike hospital.benchmarks (one request at a time through the test client),
+this drives a running server - `runserver` or gunicorn on localhost - from
+several threads at once. Every virtual user repeats the whole front-desk to
+doctor workflow, each step a real request with its own session and CSRF
+token:
+
+    receptionist  register patient -> patient search -> check-in
+    doctor        dashboard -> create prescription -> add medicines (AJAX)
+                  -> complete prescription
+    patient       log in -> download the prescription PDF
+
+Patient logins are created in the background (process_login_jobs). Until a
+new patient has one, the PDF is downloaded by the doctor instead and the
+run counts it under 'patient_login_pending'.
+
+The report gives throughput (requests and workflows per second), latency
+percentiles and error counts per step, and lock contention: responses that
+failed with SQLite's "database is locked", the usual first casualty of its
+single writer.
+"""
+
+import http.cookiejar
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+
+from django.urls import reverse
+
+PERCENTILES = (50, 95, 99)
+REQUEST_TIMEOUT = 60  # seconds
+LOCK_MARKERS = (b'database is locked', b'database table is locked')
+
+STEPS = [
+    'login',
+    'register_patient',
+    'patient_search',
+    'patient_checkin',
+    'doctor_dashboard',
+    'create_prescription',
+    'add_medicine',
+    'complete_prescription',
+    'patient_login',
+    'download_prescription',
+]
+
+MEDICINES = [
+    ('tablet', 'Paracetamol', '500mg', 'morning_night'),
+    ('tablet', 'Cetirizine', '10mg', 'night'),
+    ('capsule', 'Amoxicillin', '500mg', 'morning_afternoon_night'),
+    ('syrup', 'Ambroxol', '5ml', 'morning_night'),
+    ('tablet', 'Pantoprazole', '40mg', 'morning'),
+]
+
+# Shown by register_patient on the reception dashboard
+REGISTERED_RE = re.compile(r'Login Username: (\S+) \| Password: (\w+)')
+PRESCRIPTION_RE = re.compile(r'/prescription/(\d+)/')
+
+
+class WorkflowError(Exception):
+    """A step did not get the response the workflow needs to carry on"""
+
+
+class Response:
+    def __init__(self, status, body, url, elapsed):
+        self.status = status
+        self.body = body
+        self.url = url
+        self.elapsed = elapsed
+
+    @property
+    def locked(self):
+        return self.status >= 500 and any(marker in self.body for marker in LOCK_MARKERS)
+
+    def text(self):
+        return self.body.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Session:
+    """A browser: cookies, CSRF token and redirects, over urllib"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, path, params=None, data=None, ajax=False):
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        headers = {}
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['X-CSRFToken'] = self.csrf_token()
+        if ajax:
+            headers['X-Requested-With'] = 'XMLHttpRequest'
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(urllib.request.Request(url, body, headers), timeout=REQUEST_TIMEOUT) as response:
+                return Response(response.status, response.read(), response.geturl(), time.perf_counter() - start)
+        except urllib.error.HTTPError as e:
+            return Response(e.code, e.read(), url, time.perf_counter() - start)
+        except (urllib.error.URLError, OSError) as e:
+            # No response at all (refused, reset, timed out): status 0
+            return Response(0, str(e).encode(), url, time.perf_counter() - start)
+
+
+# ==================== STATISTICS ====================
+
+def _percentile(sorted_values, percent):
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[rank - 1]
+
+
+class LoadStats:
+    """Thread-safe tally of every request and workflow"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = defaultdict(int)
+        self.locked = defaultdict(int)
+        self.counters = Counter()
+
+    def record(self, step, response, ok):
+        with self._lock:
+            self.timings[step].append(response.elapsed * 1000)
+            self.statuses[step][response.status] += 1
+            if not ok:
+                self.errors[step] += 1
+            if response.locked:
+                self.locked[step] += 1
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def report(self, elapsed):
+        with self._lock:
+            steps = {}
+            for step in STEPS:
+                timings = sorted(self.timings.get(step, ()))
+                if not timings:
+                    continue
+                row = {
+                    'requests': len(timings),
+                    'errors': self.errors[step],
+                    'locked': self.locked[step],
+                    'status': {str(status): n for status, n in sorted(self.statuses[step].items())},
+                    'mean_ms': round(sum(timings) / len(timings), 1),
+                }
+                for percent in PERCENTILES:
+                    row[f'p{percent}_ms'] = round(_percentile(timings, percent), 1)
+                steps[step] = row
+
+            requests = sum(row['requests'] for row in steps.values())
+            errors = sum(row['errors'] for row in steps.values())
+            workflows = self.counters['workflows_completed']
+            return {
+                'elapsed_s': round(elapsed, 2),
+                'requests': requests,
+                'requests_per_s': round(requests / elapsed, 2) if elapsed else 0,
+                'workflows_completed': workflows,
+                'workflows_failed': self.counters['workflows_failed'],
+                'workflows_per_s': round(workflows / elapsed, 3) if elapsed else 0,
+                'error_rate': round(errors / requests, 4) if requests else 0,
+                'lock_errors': sum(row['locked'] for row in steps.values()),
+                'patient_login_pending': self.counters['patient_login_pending'],
+                'steps': steps,
+            }
+
+
+# ==================== WORKFLOW ====================
+
+class ClinicDay:
+    """One virtual user: a receptionist and a doctor working through patients"""
+
+    def __init__(self, base_url, clinic_slug, receptionist, doctor, password, stats,
+                 medicines_per_prescription=3, think_time=0.0, seed=None):
+        self.base_url = base_url
+        self.slug = clinic_slug
+        self.receptionist = receptionist
+        self.doctor = doctor
+        self.password = password
+        self.stats = stats
+        self.medicines_per_prescription = medicines_per_prescription
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        self.reception_session = None
+        self.doctor_session = None
+
+    def url(self, name, **kwargs):
+        return reverse(name, kwargs={'clinic_slug': self.slug, **kwargs})
+
+    def step(self, name, session, path, params=None, data=None, ajax=False, check=None):
+        response = session.request(path, params, data, ajax)
+        ok = 200 <= response.status < 400
+        if ok and check is not None:
+            try:
+                ok = bool(check(response))
+            except ValueError:  # not the JSON the step expects
+                ok = False
+        self.stats.record(name, response, ok)
+        if not ok:
+            raise WorkflowError(f"{name}: HTTP {response.status} at {response.url}")
+        if self.think_time:
+            time.sleep(self.random.uniform(0, 2 * self.think_time))
+        return response
+
+    def login(self, username, password, step='login', required=True):
+        """A logged-in Session, or None if not ``required`` and the login was refused"""
+        session = Session(self.base_url)
+        login_url = self.url('login')
+        # The login page sets the CSRF cookie the POST needs
+        session.request(login_url)
+        response = self.step(step, session, login_url, data={'username': username, 'password': password})
+        # A refused login renders the login page again
+        if '/login/' in response.url:
+            if required:
+                raise WorkflowError(f"{step}: {username} could not log in")
+            return None
+        return session
+
+    def run_once(self):
+        if self.reception_session is None:
+            self.reception_session = self.login(self.receptionist, self.password)
+        if self.doctor_session is None:
+            self.doctor_session = self.login(self.doctor, self.password)
+        reception, doctor = self.reception_session, self.doctor_session
+
+        # Reception: register, find the new patient, check them in
+        phone = f"9{self.random.randrange(10 ** 9):09d}"
+        response = self.step('register_patient', reception, self.url('register_patient'), data={
+            'patient_name': f"Load Test {phone[-4:]}",
+            'gender': self.random.choice(['male', 'female']),
+            'age': self.random.randint(1, 90),
+            'address': 'Load test',
+            'phone_number': phone,
+            'confirm_new': '1',
+        }, check=lambda r: REGISTERED_RE.search(r.text()))
+        patient_code, patient_password = REGISTERED_RE.search(response.text()).groups()
+
+        response = self.step('patient_search', reception, self.url('patient_search'), params={'q': patient_code},
+                             ajax=True, check=lambda r: r.json().get('results'))
+        patient_pk = response.json()['results'][0]['id']
+
+        self.step('patient_checkin', reception, self.url('patient_checkin'), data={
+            'patient_id': patient_code,
+            'purpose': 'Checkup',
+            'notes': '',
+        }, check=lambda r: '/patient-checkin/' not in r.url)
+
+        # Doctor: dashboard, prescription, medicines over AJAX, complete
+        self.step('doctor_dashboard', doctor, self.url('doctor_dashboard'))
+        response = self.step('create_prescription', doctor, self.url('create_prescription', patient_id=patient_pk),
+                             data={}, check=lambda r: PRESCRIPTION_RE.search(r.url))
+        prescription_id = int(PRESCRIPTION_RE.search(response.url).group(1))
+
+        details_url = self.url('add_prescription_details', prescription_id=prescription_id)
+        for medicine_type, name, dosage, schedule in self.random.sample(MEDICINES, self.medicines_per_prescription):
+            self.step('add_medicine', doctor, details_url, ajax=True, data={
+                'action': 'add_medicine',
+                'medicine_type': medicine_type,
+                'medicine_name': name,
+                'dosage': dosage,
+                'frequency_per_day': 2,
+                'duration': '5 days',
+                'schedule': schedule,
+                'qty': 10,
+                'food_instruction': 'after',
+                'instructions': '',
+            }, check=lambda r: r.json().get('success'))
+
+        self.step('complete_prescription', doctor, self.url('complete_prescription', prescription_id=prescription_id),
+                  data={}, check=lambda r: '/complete/' not in r.url)
+
+        # Patient: log in and download the PDF (the doctor's copy until the login exists)
+        patient = self.login(patient_code, patient_password, step='patient_login', required=False)
+        if patient is not None:
+            download_url = self.url('download_prescription_patient', prescription_id=prescription_id)
+        else:
+            self.stats.count('patient_login_pending')
+            patient = doctor
+            download_url = self.url('download_prescription', prescription_id=prescription_id)
+        self.step('download_prescription', patient, download_url,
+                  check=lambda r: r.body.startswith(b'%PDF'))
+
+    def run(self, deadline, iterations=None):
+        for _ in (itertools.count() if iterations is None else range(iterations)):
+            if time.monotonic() >= deadline:
+                break
+            try:
+                self.run_once()
+            except WorkflowError:
+                self.stats.count('workflows_failed')
+                # Start the next patient from fresh sessions
+                self.reception_session = self.doctor_session = None
+            else:
+                self.stats.count('workflows_completed')
+
+
+def run_load_test(base_url, clinic_slug, receptionists, doctors, password, users=4, duration=60,
+                  iterations=None, ramp_up=0.0, medicines_per_prescription=3, think_time=0.0, seed=None):
+    """
+    Run ``users`` concurrent ClinicDay users for ``duration`` seconds (or
+    ``iterations`` workflows each); returns a JSON-able report.
+    """
+    stats = LoadStats()
+    deadline = time.monotonic() + duration
+    seeds = random.Random(seed)
+    threads = []
+    start = time.perf_counter()
+    for n in range(users):
+        user = ClinicDay(
+            base_url, clinic_slug,
+            receptionists[n % len(receptionists)], doctors[n % len(doctors)],
+            password, stats, medicines_per_prescription, think_time, seeds.random(),
+        )
+        thread = threading.Thread(target=user.run, args=(deadline, iterations), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if ramp_up and n < users - 1:
+            time.sleep(ramp_up / users)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    report = stats.report(elapsed)
+    return {
+        'base_url': base_url,
+        'clinic': clinic_slug,
+        'users': users,
+        'medicines_per_prescription': medicines_per_prescription,
+        'think_time_s': think_time,
+        **report,
+    }
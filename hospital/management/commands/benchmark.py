@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.benchmarks import SCENARIO_NAMES, BenchmarkError, compare_to_baseline, run_benchmarks
+from hospital.models import Clinic
+
+
+class Command(BaseCommand):
+    help = "Benchmark the clinic-scoped hot endpoints; report latency and query counts as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', default='synthetic-1', help="Clinic slug (default: synthetic-1)")
+        parser.add_argument('--iterations', type=int, default=20, help="Measured requests per scenario (default: 20)")
+        parser.add_argument('--warmup', type=int, default=2, help="Unmeasured requests first (default: 2)")
+        parser.add_argument('--only', action='append', choices=SCENARIO_NAMES, metavar='SCENARIO',
+                            help="Run only this scenario (repeatable)")
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+        parser.add_argument('--baseline', help="Fail if the run regressed against this saved report")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed p95 slowdown against the baseline (default: 0.2 = 20%%)")
+
+    def handle(self, *args, **options):
+        try:
+            clinic = Clinic.objects.get(slug=options['clinic'])
+        except Clinic.DoesNotExist:
+            raise CommandError(
+                f"Clinic '{options['clinic']}' not found (create one with generate_synthetic_data)"
+            )
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1")
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as fileobj:
+                    baseline = json.load(fileobj)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline: {e}")
+
+        try:
+            report = run_benchmarks(clinic, options['iterations'], options['warmup'], options['only'])
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                fileobj.write(output + '\n')
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            regressions = compare_to_baseline(report, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.models import Clinic, Doctor
+from hospital.prescription_export import (
+    EXPORT_FORMATS, prescriptions_for_export, stream_merged_pdf, stream_zip,
+)
+from hospital.prescription_pdf import DEFAULT_PAGE_SIZE, PAGE_SIZES
+from hospital.tenant_databases import clinic_database
+
+
+def _date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}' (expected YYYY-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = "Export a clinic's prescriptions for a date range as a ZIP of PDFs or one merged PDF"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write")
+        parser.add_argument('--clinic', required=True, help="Clinic slug")
+        parser.add_argument('--from', dest='date_from', required=True, help="First day (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='date_to', required=True, help="Last day (YYYY-MM-DD)")
+        parser.add_argument('--doctor', type=int, help="Doctor ID (default: all doctors)")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default=EXPORT_FORMATS[0])
+        parser.add_argument('--size', choices=list(PAGE_SIZES), default=DEFAULT_PAGE_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            clinic = Clinic.objects.get(slug=options['clinic'])
+        except Clinic.DoesNotExist:
+            raise CommandError(f"Clinic '{options['clinic']}' not found")
+
+        doctor = None
+        if options['doctor']:
+            doctor = Doctor.objects.using(clinic_database(clinic)).filter(clinic=clinic, id=options['doctor']).first()
+            if not doctor:
+                raise CommandError(f"Doctor {options['doctor']} not found in this clinic")
+
+        items = prescriptions_for_export(
+            clinic, _date(options['date_from']), _date(options['date_to']), doctor=doctor
+        )
+        total = items.count()
+        started = time.monotonic()
+
+        stream = stream_merged_pdf if options['format'] == 'pdf' else stream_zip
+        with open(options['output'], 'wb') as output:
+            for chunk in stream(items.iterator(), options['size']):
+                output.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {total} prescriptions to {options['output']} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,70 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from hospital.synthetic import CLOSING_HOUR, ROWS_PER_PATIENT, SyntheticDataGenerator
+
+
+def _now(value):
+    """--now: YYYY-MM-DD (the end of that clinic day) or YYYY-MM-DDTHH:MM, local time"""
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid --now '{value}' (expected YYYY-MM-DD or YYYY-MM-DDTHH:MM)")
+    if len(value) == 10:
+        moment = datetime.combine(moment.date(), time(CLOSING_HOUR))
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+class Command(BaseCommand):
+    help = "Generate reproducible synthetic clinics, patients and clinical history for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinics', type=int, default=3, help="Number of clinics (default: 3)")
+        parser.add_argument('--patients', type=int, default=1000, help="Patients per clinic (default: 1000)")
+        parser.add_argument('--rows', type=int,
+                            help=f"Approximate total rows to write instead of --patients "
+                                 f"(about {ROWS_PER_PATIENT} rows per patient)")
+        parser.add_argument('--doctors', type=int, default=4, help="Doctors per clinic (default: 4)")
+        parser.add_argument('--days', type=int, default=365, help="Days of history (default: 365)")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed (default: 1)")
+        parser.add_argument('--prefix', default='synthetic', help="Clinic slug prefix (default: synthetic)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Patients per transaction (default: 1000)")
+        parser.add_argument('--now', help="Date or date-time the history runs up to, e.g. 2026-06-30 "
+                                          "(default: the current time); fixes every generated date")
+
+    def handle(self, *args, **options):
+        if options['clinics'] < 1 or options['doctors'] < 1 or options['days'] < 1:
+            raise CommandError("--clinics, --doctors and --days must be at least 1")
+        patients = options['patients']
+        if options['rows']:
+            patients = max(1, -(-options['rows'] // (options['clinics'] * ROWS_PER_PATIENT)))
+
+        self.stdout.write(
+            f"Generating {options['clinics']} clinic(s) x {patients} patients "
+            f"(~{options['clinics'] * patients * ROWS_PER_PATIENT:,} rows, seed {options['seed']})"
+        )
+
+        def progress(clinic, done, result):
+            self.stdout.write(f"  {clinic.slug}: {done}/{patients} patients - {result}")
+
+        generator = SyntheticDataGenerator(
+            clinics=options['clinics'],
+            patients=patients,
+            doctors=options['doctors'],
+            days=options['days'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            progress=progress,
+            now=_now(options['now']) if options['now'] else None,
+        )
+        try:
+            result = generator.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for name, count in sorted(result.counts.items()):
+            self.stdout.write(f"  {name}: {count:,}")
+        self.stdout.write(self.style.SUCCESS(f"Generated {result}"))
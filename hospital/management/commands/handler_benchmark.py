@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.benchmarks import ASYNC_SCENARIO_NAMES, BenchmarkError, compare_handlers
+from hospital.models import Clinic
+
+MODES = ['wsgi', 'asgi']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare WSGI and ASGI throughput of the async JSON endpoints by replaying them "
+        "concurrently through Django's WSGIHandler and ASGIHandler; report as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', default='synthetic-1', help="Clinic slug (default: synthetic-1)")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per mode (default: 1000)")
+        parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight (default: 50)")
+        parser.add_argument('--mode', action='append', choices=MODES, help="Run only this mode (repeatable)")
+        parser.add_argument('--only', action='append', choices=ASYNC_SCENARIO_NAMES, metavar='SCENARIO',
+                            help="Replay only this endpoint (repeatable)")
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            clinic = Clinic.objects.get(slug=options['clinic'])
+        except Clinic.DoesNotExist:
+            raise CommandError(
+                f"Clinic '{options['clinic']}' not found (create one with generate_synthetic_data)"
+            )
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1")
+
+        try:
+            report = compare_handlers(
+                clinic, options['requests'], options['concurrency'], options['mode'] or MODES, options['only']
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                fileobj.write(output + '\n')
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.importers import DEFAULT_BATCH_SIZE, PatientImporter, PatientImportError
+from hospital.models import Clinic
+from hospital.tenant_databases import clinic_context
+
+
+class Command(BaseCommand):
+    help = "Bulk import patients into a clinic from a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or XLSX file with a header row")
+        parser.add_argument('--clinic', required=True, help="Clinic slug")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--no-logins', action='store_true',
+                            help="Don't create patient login accounts")
+        parser.add_argument('--show-errors', type=int, default=20,
+                            help="Number of invalid rows to list (default: 20)")
+
+    def handle(self, *args, **options):
+        try:
+            clinic = Clinic.objects.get(slug=options['clinic'])
+        except Clinic.DoesNotExist:
+            raise CommandError(f"Clinic '{options['clinic']}' not found")
+
+        started = time.monotonic()
+
+        def progress(result):
+            elapsed = time.monotonic() - started
+            rate = result.rows / elapsed if elapsed else 0
+            self.stdout.write(f"  {result.rows} rows read, {result.created} created ({rate:.0f} rows/s)")
+
+        importer = PatientImporter(
+            clinic,
+            create_logins=not options['no_logins'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        try:
+            # Patients and their login jobs go to the clinic's database
+            with clinic_context(clinic), open(options['path'], 'rb') as fileobj:
+                result = importer.import_file(fileobj, options['path'])
+        except (OSError, PatientImportError) as e:
+            raise CommandError(str(e))
+
+        for number, message in result.errors[:options['show_errors']]:
+            self.stdout.write(self.style.WARNING(f"  row {number}: {message}"))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result} in {time.monotonic() - started:.1f}s"
+        ))
+        if result.logins_queued:
+            self.stdout.write(
+                f"{result.logins_queued} patient logins queued; run `manage.py process_login_jobs` to create them"
+            )
@@ -0,0 +1,82 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.loadtest import run_load_test
+from hospital.models import Clinic, Doctor
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a clinic day (register, check-in, prescribe, download PDF) against a running "
+        "server at the given concurrency; report throughput, errors and lock contention as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Server to load (default: http://127.0.0.1:8000)")
+        parser.add_argument('--clinic', default='synthetic-1', help="Clinic slug (default: synthetic-1)")
+        parser.add_argument('--password', required=True, help="Password of the clinic's receptionists and doctors")
+        parser.add_argument('--set-password', action='store_true',
+                            help="Set --password on the clinic's receptionists and doctors first (test data only)")
+        parser.add_argument('--users', type=int, default=4, help="Concurrent virtual users (default: 4)")
+        parser.add_argument('--duration', type=float, default=60, help="Seconds to run (default: 60)")
+        parser.add_argument('--iterations', type=int, help="Stop each user after this many workflows")
+        parser.add_argument('--ramp-up', type=float, default=0, help="Seconds over which the users start (default: 0)")
+        parser.add_argument('--medicines', type=int, default=3, help="Medicines added per prescription (default: 3)")
+        parser.add_argument('--think', type=float, default=0, help="Mean pause between steps, seconds (default: 0)")
+        parser.add_argument('--seed', type=int, help="Random seed")
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            clinic = Clinic.objects.get(slug=options['clinic'])
+        except Clinic.DoesNotExist:
+            raise CommandError(
+                f"Clinic '{options['clinic']}' not found (create one with generate_synthetic_data)"
+            )
+        if options['users'] < 1:
+            raise CommandError("--users must be at least 1")
+        if not 1 <= options['medicines'] <= 5:
+            raise CommandError("--medicines must be between 1 and 5")
+
+        User = get_user_model()
+        receptionists = User.objects.filter(clinic=clinic, role='receptionist', is_active=True).order_by('pk')
+        doctors = User.objects.filter(
+            pk__in=Doctor.objects.filter(clinic=clinic).values('user_id'), is_active=True
+        ).order_by('pk')
+        if not receptionists or not doctors:
+            raise CommandError(f"Clinic '{clinic.slug}' needs a receptionist and a doctor")
+
+        if options['set_password']:
+            for user in [*receptionists, *doctors]:
+                user.set_password(options['password'])
+                user.save(update_fields=['password'])
+
+        self.stderr.write(
+            f"{options['users']} users against {options['url']} for "
+            f"{options['iterations'] or 'unlimited'} workflows / {options['duration']:g}s ..."
+        )
+        report = run_load_test(
+            options['url'], clinic.slug,
+            [user.username for user in receptionists], [user.username for user in doctors],
+            options['password'],
+            users=options['users'],
+            duration=options['duration'],
+            iterations=options['iterations'],
+            ramp_up=options['ramp_up'],
+            medicines_per_prescription=options['medicines'],
+            think_time=options['think'],
+            seed=options['seed'],
+        )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                fileobj.write(output + '\n')
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+        if report['requests'] and not report['workflows_completed']:
+            raise CommandError("No workflow completed; check --url, --password and the server log")
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from hospital.models import Clinic
+from hospital.tenant_databases import (
+    TenantCopyError, clinic_database, clinic_row_counts, copy_clinic, delete_clinic_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy a clinic's rows to another database alias (e.g. its own clinic_<slug> database from "
+        "DB_CLINIC_DATABASES) and check the counts. Run it while the clinic is not being used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', required=True, help="Clinic slug")
+        parser.add_argument('--to', required=True, dest='target', help="Target database alias")
+        parser.add_argument('--from', dest='source',
+                            help="Source database alias (default: 'default', or the clinic's own "
+                                 "database when moving it back to 'default')")
+        parser.add_argument('--delete-source', action='store_true',
+                            help="Delete the clinic's rows from the source once the copy checks out")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per insert batch (default: 2000)")
+
+    def handle(self, *args, **options):
+        try:
+            clinic = Clinic.objects.using(DEFAULT_DB_ALIAS).get(slug=options['clinic'])
+        except Clinic.DoesNotExist:
+            raise CommandError(f"Clinic '{options['clinic']}' not found")
+
+        target = options['target']
+        source = options['source'] or (clinic_database(clinic) if target == DEFAULT_DB_ALIAS else DEFAULT_DB_ALIAS)
+        for alias in (source, target):
+            if alias not in settings.DATABASES:
+                raise CommandError(f"Unknown database alias '{alias}' (see DB_CLINIC_DATABASES)")
+
+        self.stderr.write(f"Migrating '{target}' ...")
+        call_command('migrate', database=target, verbosity=0)
+
+        self.stderr.write(f"Copying '{clinic.slug}' from '{source}' to '{target}' ...")
+        try:
+            copied = copy_clinic(
+                clinic, source, target, options['batch_size'],
+                progress=lambda model, count: self.stderr.write(f"  {model}: {count}"),
+            )
+        except TenantCopyError as e:
+            raise CommandError(str(e))
+
+        before, after = clinic_row_counts(clinic, source), clinic_row_counts(clinic, target)
+        mismatched = [name for name in before if before[name] != after[name]]
+        if mismatched:
+            raise CommandError(
+                "Row counts differ after the copy (was the clinic in use?): "
+                + ", ".join(f"{name} {before[name]} -> {after[name]}" for name in mismatched)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {sum(copied.values())} rows; counts match in '{target}'"
+        ))
+
+        if options['delete_source']:
+            delete_clinic_rows(clinic, source)
+            self.stdout.write(f"Deleted the clinic's rows from '{source}'")
+
+        if settings.TENANT_DATABASES.get(clinic.slug, DEFAULT_DB_ALIAS) != target:
+            self.stdout.write(self.style.WARNING(
+                f"'{clinic.slug}' is still served from '{clinic_database(clinic)}': "
+                + (f"add {clinic.slug}=<name> to DB_CLINIC_DATABASES" if target != DEFAULT_DB_ALIAS
+                   else f"remove {clinic.slug} from DB_CLINIC_DATABASES")
+                + " and restart"
+            ))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.models import Clinic
+from hospital.provisioning import enqueue_missing_logins, process_jobs
+
+
+class Command(BaseCommand):
+    help = "Create queued patient login accounts (optionally queueing every patient without one)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', help="Clinic slug (default: all clinics)")
+        parser.add_argument('--enqueue-missing', action='store_true',
+                            help="First queue a job for every patient without a login")
+        parser.add_argument('--limit', type=int, help="Stop after this many jobs")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep polling the queue instead of exiting when it is empty")
+        parser.add_argument('--sleep', type=float, default=5,
+                            help="Seconds between polls with --loop (default: 5)")
+
+    def handle(self, *args, **options):
+        clinic = None
+        if options['clinic']:
+            try:
+                clinic = Clinic.objects.get(slug=options['clinic'])
+            except Clinic.DoesNotExist:
+                raise CommandError(f"Clinic '{options['clinic']}' not found")
+
+        if options['enqueue_missing']:
+            queued = enqueue_missing_logins(clinic=clinic)
+            self.stdout.write(f"Queued {queued} patients without a login")
+
+        while True:
+            started = time.monotonic()
+            result = process_jobs(limit=options['limit'], clinic=clinic)
+            if result.processed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{result} in {time.monotonic() - started:.1f}s"
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
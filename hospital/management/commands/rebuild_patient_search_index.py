@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.models import Clinic
+from hospital.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the reception patient search index (all clinics or one clinic)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', help="Clinic slug (default: all clinics)")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        clinic = None
+        if options['clinic']:
+            try:
+                clinic = Clinic.objects.get(slug=options['clinic'])
+            except Clinic.DoesNotExist:
+                raise CommandError(f"Clinic '{options['clinic']}' not found")
+
+        backend = get_search_backend()
+        total = backend.rebuild(clinic=clinic, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {total} patients with {backend.__class__.__name__}"
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.models import Clinic
+from hospital.rollups import rebuild_visit_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the VisitDailyStats check-in rollup from PatientVisit history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', help="Clinic slug (default: all clinics)")
+
+    def handle(self, *args, **options):
+        clinic = None
+        if options['clinic']:
+            try:
+                clinic = Clinic.objects.get(slug=options['clinic'])
+            except Clinic.DoesNotExist:
+                raise CommandError(f"Clinic '{options['clinic']}' not found")
+
+        buckets = rebuild_visit_daily_stats(clinic=clinic)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} daily check-in buckets"))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.models import Clinic, Prescription
+from hospital.prescription_counts import recount_prescriptions, stale_prescriptions
+from hospital.tenant_databases import clinic_context
+
+
+class Command(BaseCommand):
+    help = (
+        "Check Prescription.medicines_count / tests_count against the Medicine and Test rows "
+        "and fix the ones that drifted (e.g. after bulk_create or raw SQL)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', help="Clinic slug (default: all clinics)")
+        parser.add_argument('--dry-run', action='store_true', help="Report stale prescriptions without fixing them")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['clinic']:
+            try:
+                clinics = [Clinic.objects.get(slug=options['clinic'])]
+            except Clinic.DoesNotExist:
+                raise CommandError(f"Clinic '{options['clinic']}' not found")
+        else:
+            clinics = list(Clinic.objects.order_by('slug'))
+
+        total = 0
+        for clinic in clinics:
+            # A clinic with its own database is counted there
+            with clinic_context(clinic):
+                prescriptions = Prescription.objects.all_clinics().filter(clinic=clinic)
+                stale = list(stale_prescriptions(prescriptions).order_by('pk').values_list('pk', flat=True))
+                if stale and not options['dry_run']:
+                    batch_size = options['batch_size']
+                    for start in range(0, len(stale), batch_size):
+                        recount_prescriptions(prescriptions.filter(pk__in=stale[start:start + batch_size]))
+            if stale:
+                self.stdout.write(f"{clinic.slug}: {len(stale)} stale")
+            total += len(stale)
+
+        if options['dry_run']:
+            self.stdout.write(f"{total} prescriptions with stale counts (dry run, nothing changed)")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed the counts of {total} prescriptions"))
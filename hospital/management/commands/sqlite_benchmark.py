@@ -0,0 +1,47 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.sqlite_production import DJANGO_DEFAULT_OPTIONS, benchmark_sqlite
+
+MODES = ['default', 'configured', 'configured+queue']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent SQLite throughput with Django's default connection options, "
+        "the configured DATABASES options, and those plus the in-process write queue"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Check-in writer threads (default: 8)")
+        parser.add_argument('--readers', type=int, default=8, help="Dashboard reader threads (default: 8)")
+        parser.add_argument('--duration', type=float, default=5, help="Seconds per mode (default: 5)")
+        parser.add_argument('--mode', action='append', choices=MODES, help="Run only this mode (repeatable)")
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES['default']
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("The default database is not SQLite")
+        if options['writers'] < 1 or options['readers'] < 0:
+            raise CommandError("Need at least one writer")
+
+        configured = database.get('OPTIONS', {})
+        results = {}
+        for mode in options['mode'] or MODES:
+            self.stderr.write(f"{mode} ...")
+            results[mode] = benchmark_sqlite(
+                DJANGO_DEFAULT_OPTIONS if mode == 'default' else configured,
+                writers=options['writers'],
+                readers=options['readers'],
+                duration=options['duration'],
+                write_queue=mode.endswith('+queue'),
+            )
+
+        self.stdout.write(json.dumps({
+            'writers': options['writers'],
+            'readers': options['readers'],
+            'duration_s': options['duration'],
+            'results': results,
+        }, indent=2))
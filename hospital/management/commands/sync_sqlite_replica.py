@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.db_routers import REPLICA, sqlite_sync_marker
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary database onto the SQLite 'replica' alias (a local stand-in "
+        "for replication when trying out the read-replica router)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, help="Keep copying every N seconds until interrupted")
+
+    def handle(self, *args, **options):
+        if REPLICA not in settings.DATABASES:
+            raise CommandError("No 'replica' database configured (set DB_REPLICA_NAME)")
+        primary, replica = settings.DATABASES['default'], settings.DATABASES[REPLICA]
+        for database in (primary, replica):
+            if database['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError("Both 'default' and 'replica' must be SQLite")
+        if str(primary['NAME']) == str(replica['NAME']):
+            raise CommandError("'replica' points at the primary database file")
+
+        while True:
+            start = time.perf_counter()
+            self.copy(primary['NAME'], replica['NAME'])
+            self.stderr.write(f"Copied {primary['NAME']} -> {replica['NAME']} in {time.perf_counter() - start:.2f}s")
+            if not options['every']:
+                break
+            try:
+                time.sleep(options['every'])
+            except KeyboardInterrupt:
+                break
+
+    @staticmethod
+    def copy(source_path, target_path):
+        started = time.time()
+        # The backup API gives a consistent snapshot while the primary is in use
+        source = sqlite3.connect(str(source_path))
+        target = sqlite3.connect(str(target_path))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        # The replica holds everything committed before the copy started
+        marker = sqlite_sync_marker(target_path)
+        with open(marker, 'w'):
+            pass
+        os.utime(marker, (started, started))
@@ -4,11 +4,14 @@ Custom managers for multi-tenant queries.
 Auto-filter all queries by current clinic.
 """
 
-import threading
+from asgiref.local import Local
 from django.db import models
 from django.core.exceptions import ImproperlyConfigured
 
-_thread_locals = threading.local()
+# Per request: asgiref's Local follows the request into async views and the
+# threads their ORM calls run on, where threading.local would leak between
+# requests sharing the event loop
+_thread_locals = Local()
 
 
 def get_current_clinic():
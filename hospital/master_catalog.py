@@ -0,0 +1,57 @@
+"""
+Versioned master data (medicines and tests) for the prescription page.
+
+Every clinic carries a catalog_version that is bumped on any MasterMedicine
+or MasterTest write (signal handlers in hospital.signals). It is read
+straight from the database, so all worker processes agree on it, and it
+drives:
+
+- ETag / If-None-Match on api_master_medicines and api_master_tests, so a
+  repeated lookup is answered with a 304
+- api_master_catalog, a snapshot of the whole catalog that the prescription
+  page downloads once (URL carries the version, so the browser keeps it
+  until the catalog changes) and filters in the browser
+"""
+
+from django.db.models import F
+
+from .medicine_index import search_medicines
+from .models import Clinic, MasterTest
+
+# How long the browser may reuse a snapshot whose URL names the current version
+SNAPSHOT_MAX_AGE = 24 * 60 * 60
+
+
+def catalog_version(clinic):
+    """The clinic's current catalog version (not the cached Clinic's copy)"""
+    return Clinic.objects.filter(pk=clinic.pk).values_list('catalog_version', flat=True).first() or 0
+
+
+def bump_catalog_version(clinic_id):
+    # update() rather than save(): no Clinic signals, no clinic cache flush
+    if clinic_id:
+        Clinic.objects.filter(pk=clinic_id).update(catalog_version=F('catalog_version') + 1)
+
+
+def catalog_etag(clinic, version, user_id=None):
+    """Medicine order depends on the doctor, so the user is part of the tag"""
+    return f"catalog-{clinic.pk}-{version}-{user_id or 0}"
+
+
+def test_payload(test):
+    """What api_master_tests returns for one test"""
+    return {
+        "id": test.id,
+        "test_name": test.test_name,
+        "test_type": test.get_test_type_display(),
+    }
+
+
+def catalog_snapshot(clinic, version, user_id=None):
+    """Every active medicine (this doctor's usual ones first) and test"""
+    tests = MasterTest.objects.filter(clinic=clinic, is_active=True).order_by('test_name')
+    return {
+        "version": version,
+        "medicines": search_medicines(clinic, '', user_id=user_id, limit=None, version=version),
+        "tests": [dict(test_payload(test), type_code=test.test_type) for test in tests],
+    }
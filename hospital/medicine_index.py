@@ -0,0 +1,236 @@
+"""
+Per-process, per-clinic autocomplete index for master medicines.
+
+api_master_medicines answers from memory instead of running an icontains
+query on every keystroke. Each clinic's index holds:
+
+- the JSON payload of every active MasterMedicine
+- a sorted suffix array of the normalized names, so any substring match
+  (what icontains did) is a bisect
+- prescription counts per (doctor user, medicine name) from the Medicine
+  history, used to put each doctor's usual medicines first
+
+An index is built on first use and kept in step with MasterMedicine and
+Medicine writes by the signal handlers in hospital.signals. Other worker
+processes pick up changes when their copy expires after
+MEDICINE_INDEX_TTL seconds, or straight away when the caller passes the
+clinic's current catalog_version (hospital.master_catalog).
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Clinic, MasterMedicine, Medicine
+from .search import normalize_text
+
+DEFAULT_TTL = 600  # seconds
+DEFAULT_LIMIT = 20
+# Recent answers kept per clinic; keystroke prefixes repeat all day
+RESULT_CACHE_SIZE = 2000
+
+# Match quality - higher is better
+RANK_NAME_EXACT = 3
+RANK_NAME_PREFIX = 2
+RANK_WORD_PREFIX = 1
+RANK_SUBSTRING = 0
+
+_lock = threading.Lock()
+_indexes = {}  # clinic_id -> (expires_at, MedicineIndex)
+
+
+def _ttl():
+    return getattr(settings, 'MEDICINE_INDEX_TTL', DEFAULT_TTL)
+
+
+def medicine_payload(medicine):
+    """What api_master_medicines returns for one medicine"""
+    return {
+        "id": medicine.id,
+        "name": medicine.medicine_name,
+        "type": medicine.medicine_type,
+        "default_dosage": medicine.default_dosage,
+        "frequency_per_day": medicine.frequency_per_day,
+        "default_schedule": medicine.default_schedule,
+        "default_duration": medicine.default_duration,
+        "food_instruction": medicine.food_instruction,
+        "display": f"{medicine.medicine_name} ({medicine.default_dosage}) - {medicine.medicine_type}",
+    }
+
+
+class MedicineIndex:
+    def __init__(self, clinic_id):
+        self.clinic_id = clinic_id
+        self.catalog_version = 0  # Clinic.catalog_version the index was built from
+        self._lock = threading.Lock()
+        self._entries = {}    # id -> (normalized name, payload)
+        self._suffixes = []   # sorted (suffix of normalized name, id, RANK_* of that position)
+        self._results = OrderedDict()    # (term, user id, limit) -> payloads, most recent last
+        self._usage = Counter()          # (doctor user id, normalized name) -> prescriptions
+        self._clinic_usage = Counter()   # normalized name -> prescriptions
+
+    # ---------- building ----------
+
+    def load(self, catalog_version=None):
+        # Read before the medicines: a write in between only makes the index look older.
+        # A version the caller has just read (the ETag's) is as good and saves the query.
+        if catalog_version is None:
+            catalog_version = Clinic.objects.filter(pk=self.clinic_id).values_list(
+                'catalog_version', flat=True
+            ).first() or 0
+        self.catalog_version = catalog_version
+        for medicine in MasterMedicine.objects.filter(clinic_id=self.clinic_id, is_active=True):
+            self._add(medicine, keep_sorted=False)
+        self._suffixes.sort()
+        history = (
+            Medicine.objects.all_clinics()
+            .filter(clinic_id=self.clinic_id)
+            .values('prescription__doctor__user_id', 'medicine_name')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        for row in history.iterator():
+            self._count(row['prescription__doctor__user_id'], row['medicine_name'], row['total'])
+        return self
+
+    def _add(self, medicine, keep_sorted=True):
+        name = normalize_text(medicine.medicine_name)
+        self._entries[medicine.id] = (name, medicine_payload(medicine))
+        for start in range(len(name)):
+            if name[start] == ' ':
+                continue  # normalized queries never start with a space
+            if start == 0:
+                rank = RANK_NAME_PREFIX
+            elif name[start - 1] == ' ':
+                rank = RANK_WORD_PREFIX
+            else:
+                rank = RANK_SUBSTRING
+            if keep_sorted:
+                insort(self._suffixes, (name[start:], medicine.id, rank))
+            else:
+                self._suffixes.append((name[start:], medicine.id, rank))
+
+    def _remove(self, medicine_id):
+        entry = self._entries.pop(medicine_id, None)
+        if not entry:
+            return
+        name = entry[0]
+        for start in range(len(name)):
+            position = bisect_left(self._suffixes, (name[start:], medicine_id))
+            if position < len(self._suffixes) and self._suffixes[position][:2] == (name[start:], medicine_id):
+                del self._suffixes[position]
+
+    def _count(self, user_id, medicine_name, amount=1):
+        name = normalize_text(medicine_name)
+        if user_id:
+            self._usage[(user_id, name)] += amount
+        self._clinic_usage[name] += amount
+
+    # ---------- incremental updates ----------
+
+    def update_medicine(self, medicine):
+        with self._lock:
+            self._results.clear()
+            self._remove(medicine.id)
+            if medicine.is_active:
+                self._add(medicine)
+
+    def remove_medicine(self, medicine_id):
+        with self._lock:
+            self._results.clear()
+            self._remove(medicine_id)
+
+    def record_prescribed(self, user_id, medicine_name):
+        with self._lock:
+            self._results.clear()
+            self._count(user_id, medicine_name)
+
+    # ---------- searching ----------
+
+    def search(self, query, user_id=None, limit=DEFAULT_LIMIT):
+        """Payloads matching ``query`` (substring), best matches first; every match if ``limit`` is None"""
+        term = normalize_text(query)
+        key = (term, user_id, limit)
+        with self._lock:
+            results = self._results.get(key)
+            if results is not None:
+                self._results.move_to_end(key)
+                return results
+
+            results = self._search(term, user_id, limit)
+            self._results[key] = results
+            if len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+            return results
+
+    def _search(self, term, user_id, limit):
+        if term:
+            ranks = {}
+            suffixes = self._suffixes
+            low = bisect_left(suffixes, (term,))
+            high = bisect_left(suffixes, (term + '\uffff',), low)
+            for position in range(low, high):
+                _, medicine_id, rank = suffixes[position]
+                if rank > ranks.get(medicine_id, -1):
+                    ranks[medicine_id] = rank
+            for medicine_id, rank in ranks.items():
+                if rank == RANK_NAME_PREFIX and self._entries[medicine_id][0] == term:
+                    ranks[medicine_id] = RANK_NAME_EXACT
+        else:
+            ranks = dict.fromkeys(self._entries, RANK_SUBSTRING)
+
+        entries, usage, clinic_usage = self._entries, self._usage, self._clinic_usage
+
+        def sort_key(medicine_id):
+            name = entries[medicine_id][0]
+            return (-ranks[medicine_id], -usage.get((user_id, name), 0), -clinic_usage.get(name, 0), name)
+
+        if limit is None:
+            best = sorted(ranks, key=sort_key)
+        else:
+            best = heapq.nsmallest(limit, ranks, key=sort_key)
+        return [entries[medicine_id][1] for medicine_id in best]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ==================== PROCESS CACHE ====================
+
+def get_medicine_index(clinic_id, version=None):
+    """
+    The clinic's index, building it on first use, after it expired or when
+    it is older than catalog ``version``
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _indexes.get(clinic_id)
+        if entry and entry[0] > now and (version is None or entry[1].catalog_version >= version):
+            return entry[1]
+
+    index = MedicineIndex(clinic_id).load(version)
+    with _lock:
+        _indexes[clinic_id] = (now + _ttl(), index)
+    return index
+
+
+def loaded_medicine_index(clinic_id):
+    """The clinic's index if this process has one (for incremental updates)"""
+    with _lock:
+        entry = _indexes.get(clinic_id)
+    return entry[1] if entry else None
+
+
+def search_medicines(clinic, query, user_id=None, limit=DEFAULT_LIMIT, version=None):
+    return get_medicine_index(clinic.pk, version).search(query, user_id=user_id, limit=limit)
+
+
+def clear_medicine_indexes():
+    """Drop every index (used by tests and after bulk master data changes)"""
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,272 @@
+"""
+Per-view request metrics and query budgets.
+
+RequestMetricsMiddleware records, for every request, the number of SQL
+queries, the time spent in SQL, the time spent rendering templates (through
+the TimedDjangoTemplates backend) and the total time, keyed by the resolved
+URL name. The last METRICS_WINDOW requests of each URL name are kept per
+process; request_metrics() turns them into p50/p95/p99 for /ops/metrics/.
+
+Query budgets are declared on the view:
+
+    @query_budget(8)
+    def checkin_dashboard(request, clinic_slug=None):
+        ...
+
+or overridden in settings.QUERY_BUDGETS = {'<url name>': max queries}. A
+request over its budget is logged; with QUERY_BUDGET_STRICT = True (set
+it in tests) it raises QueryBudgetExceeded instead, failing the test.
+assert_max_queries() checks an arbitrary block of code the same way.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 1000  # requests kept per URL name
+PERCENTILES = (50, 95, 99)
+# Kept with a QueryBudgetExceeded so the failure shows what ran
+MAX_REPORTED_QUERIES = 50
+
+_lock = threading.Lock()
+_samples = defaultdict(deque)  # url name -> deque of (total, sql, render, queries)
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view (or block) ran more SQL queries than its budget allows"""
+
+    def __init__(self, label, budget, queries, statements=()):
+        self.label = label
+        self.budget = budget
+        self.queries = queries
+        self.statements = list(statements)
+        message = f"{label} ran {queries} queries (budget {budget})"
+        if self.statements:
+            message += ":\n" + "\n".join(f"  {sql}" for sql in self.statements)
+        super().__init__(message)
+
+
+def _window():
+    return getattr(settings, 'METRICS_WINDOW', DEFAULT_WINDOW)
+
+
+# ==================== RECORDING ====================
+
+class QueryRecorder:
+    """Counts and times the SQL run on every database connection while active"""
+
+    def __init__(self, keep_statements=False):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.statements = [] if keep_statements else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            if self.statements is not None and len(self.statements) < MAX_REPORTED_QUERIES:
+                self.statements.append(sql)
+
+    @contextmanager
+    def active(self):
+        previous = getattr(_local, 'recorder', None)
+        _local.recorder = self
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self))
+                yield self
+        finally:
+            _local.recorder = previous
+
+
+def record_sample(url_name, total, sql, render, queries):
+    with _lock:
+        samples = _samples[url_name]
+        samples.append((total, sql, render, queries))
+        while len(samples) > _window():
+            samples.popleft()
+
+
+# ==================== TEMPLATE TIMING ====================
+
+class TimedTemplate:
+    """Wraps a backend template; adds its render time to the active recorder"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        recorder = getattr(_local, 'recorder', None)
+        if recorder is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            recorder.render_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend that reports template render time to the metrics"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+# ==================== BUDGETS ====================
+
+def query_budget(max_queries):
+    """Declare the most SQL queries one request to this view may run"""
+    def decorator(view_func):
+        # Outer decorators built with functools.wraps carry the attribute along
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def budget_for(url_name, view_func):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    if url_name in budgets:
+        return budgets[url_name]
+    return getattr(view_func, 'query_budget', None)
+
+
+def check_budget(label, budget, recorder):
+    if budget is None or recorder.queries <= budget:
+        return
+    if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(label, budget, recorder.queries, recorder.statements or ())
+    logger.warning("%s ran %d queries (budget %d)", label, recorder.queries, budget)
+
+
+@contextmanager
+def assert_max_queries(max_queries, label='block'):
+    """
+    Test helper: fail if the block runs more than ``max_queries`` queries.
+
+        with assert_max_queries(6, 'checkin_dashboard'):
+            client.get(url)
+    """
+    recorder = QueryRecorder(keep_statements=True)
+    with recorder.active():
+        yield recorder
+    if recorder.queries > max_queries:
+        raise QueryBudgetExceeded(label, max_queries, recorder.queries, recorder.statements)
+
+
+# ==================== MIDDLEWARE ====================
+
+class RequestMetricsMiddleware:
+    """Record queries, SQL time, render time and total time per URL name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = self._recorder()
+        start = time.perf_counter()
+        with recorder.active():
+            response = self.get_response(request)
+        return self._record(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        recorder = self._recorder()
+        start = time.perf_counter()
+        # The async ORM runs its queries on the request's sync thread, so
+        # hook that thread's connections (enter and exit both run there)
+        stack = ExitStack()
+        await sync_to_async(stack.enter_context)(recorder.active())
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._record(request, response, recorder, time.perf_counter() - start)
+
+    @staticmethod
+    def _recorder():
+        return QueryRecorder(keep_statements=getattr(settings, 'QUERY_BUDGET_STRICT', False))
+
+    @staticmethod
+    def _record(request, response, recorder, total):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        url_name = match.url_name or match.view_name or match._func_path
+        record_sample(url_name, total, recorder.sql_time, recorder.render_time, recorder.queries)
+        check_budget(url_name, budget_for(url_name, match.func), recorder)
+        return response
+
+
+# ==================== REPORTING ====================
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[rank - 1]
+
+
+def request_metrics():
+    """Per URL name: request count, budget and p50/p95/p99 of each measure"""
+    with _lock:
+        snapshot = {name: list(samples) for name, samples in _samples.items()}
+
+    resolver = get_resolver()
+    rows = []
+    for url_name, samples in sorted(snapshot.items()):
+        if not samples:
+            continue
+        row = {'url_name': url_name, 'requests': len(samples)}
+        for position, measure in enumerate(('total_ms', 'sql_ms', 'render_ms', 'queries')):
+            values = sorted(sample[position] for sample in samples)
+            for percent in PERCENTILES:
+                value = _percentile(values, percent)
+                row[f'{measure}_p{percent}'] = value if measure == 'queries' else round(value * 1000, 1)
+        row['budget'] = budget_for(url_name, _find_view(resolver.url_patterns, url_name))
+        row['over_budget'] = row['budget'] is not None and row['queries_p99'] > row['budget']
+        rows.append(row)
+    return rows
+
+
+def _find_view(patterns, url_name):
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            view = _find_view(pattern.url_patterns, url_name)
+            if view:
+                return view
+        elif getattr(pattern, 'name', None) == url_name:
+            return pattern.callback
+    return None
+
+
+def reset_request_metrics():
+    with _lock:
+        _samples.clear()
@@ -4,20 +4,17 @@ Tenant middleware for multi-tenant context management.
 Extracts clinic from URL and sets in thread-local storage.
 """
 
-import threading
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
 
-_thread_locals = threading.local()
+from .clinic_cache import get_clinic_by_slug
+# The current clinic is kept in hospital.managers, where the database
+# routers read it too (re-exported here for existing callers)
+from .managers import get_current_clinic, set_current_clinic  # noqa: F401
 
-
-def get_current_clinic():
-    """Get current clinic from thread-local storage"""
-    return getattr(_thread_locals, 'clinic', None)
-
-
-def set_current_clinic(clinic):
-    """Set current clinic in thread-local storage"""
-    _thread_locals.clinic = clinic
+_thread_locals = Local()
 
 
 def get_current_user():
@@ -35,50 +32,73 @@ class TenantMiddleware:
     Middleware to extract and set clinic context.
     
     Clinic is extracted from:
-    1. URL parameter (clinic_slug)
+    1. URL parameter (clinic_slug), via the per-process clinic cache
     2. User's clinic association (if authenticated)
+
+    A signed-in user other than a super admin gets a 403 for another
+    clinic's URLs.
     """
     
+    # Runs without a thread hop in front of the async (ASGI) views
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
     
     def __call__(self, request):
-        # Extract clinic from URL
-        clinic_slug = None
-        if request.resolver_match:
-            clinic_slug = request.resolver_match.kwargs.get('clinic_slug')
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._start(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish()
+
+    async def __acall__(self, request):
+        self._start(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish()
+
+    @staticmethod
+    def _start(request):
+        # URL kwargs are not resolved yet at this point; the clinic is
+        # filled in by process_view() once the view is known.
+        set_current_clinic(None)
+        request.clinic = None
+        
+        # Store user in thread-local
+        set_current_user(request.user)
+
+    @staticmethod
+    def _finish():
+        # Clean up thread-local storage
+        set_current_clinic(None)
+        set_current_user(AnonymousUser())
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Resolve clinic from the URL slug (clinic cache) or the user"""
+        clinic_slug = view_kwargs.get('clinic_slug')
         
         # Try to get clinic from URL
         if clinic_slug:
-            try:
-                from hospital.models import Clinic
-                clinic = Clinic.objects.get(slug=clinic_slug)
-                set_current_clinic(clinic)
-                request.clinic = clinic
-            except Exception as e:
-                set_current_clinic(None)
-                request.clinic = None
+            clinic = get_clinic_by_slug(clinic_slug)
+            # Signed-in users only see their own clinic (super admins see all)
+            user = request.user
+            if (clinic and user.is_authenticated and user.role != 'super_admin'
+                    and user.clinic_id != clinic.pk):
+                raise PermissionDenied("This account does not belong to this clinic")
         
         # If user is authenticated, use their clinic
         elif request.user.is_authenticated:
-            if hasattr(request.user, 'clinic'):
-                set_current_clinic(request.user.clinic)
-                request.clinic = request.user.clinic
-            else:
-                set_current_clinic(None)
-                request.clinic = None
+            clinic = getattr(request.user, 'clinic', None)
         else:
-            set_current_clinic(None)
-            request.clinic = None
-        
-        # Store user in thread-local
-        set_current_user(request.user)
-        
-        try:
-            response = self.get_response(request)
-        finally:
-            # Clean up thread-local storage
-            set_current_clinic(None)
-            set_current_user(AnonymousUser())
+            clinic = None
         
-        return response
+        set_current_clinic(clinic)
+        request.clinic = clinic
+        return None
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:49
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = 'hospital_patient_fts'
+
+_NON_ALNUM_RE = re.compile(r'[^0-9a-z]+')
+
+
+# Copies of hospital.search.normalize_text / patient_tokens as they were
+# when this migration was written, so later changes to the search module
+# do not change what this migration does
+
+def normalize_text(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return _NON_ALNUM_RE.sub(' ', value.lower()).strip()
+
+
+def patient_tokens(patient):
+    tokens = set()
+    for word in normalize_text(patient.patient_name).split():
+        tokens.add(('name', word[:100]))
+
+    digits = ''.join(ch for ch in (patient.phone_number or '') if ch.isdigit())
+    if digits:
+        tokens.add(('phone', digits[::-1]))
+
+    pid = (patient.patient_id or '').lower()
+    if pid:
+        tokens.add(('pid', pid))
+        serial = pid.rsplit('-', 1)[-1]
+        if serial != pid:
+            tokens.add(('pid', serial))
+    return tokens
+
+
+def create_fts_table(apps, schema_editor):
+    """SQLite only: FTS5 trigram table used by SQLiteFTS5SearchBackend"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(name, clinic_id UNINDEXED, tokenize='trigram')"
+        )
+    except Exception:
+        # SQLite built without FTS5 / trigram tokenizer - token backend only
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_existing_patients(apps, schema_editor):
+    Patient = apps.get_model('hospital', 'Patient')
+    PatientSearchToken = apps.get_model('hospital', 'PatientSearchToken')
+    connection = schema_editor.connection
+
+    has_fts = False
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            has_fts = cursor.fetchone() is not None
+
+    for patient in Patient.objects.using(connection.alias).iterator(chunk_size=2000):
+        PatientSearchToken.objects.using(connection.alias).bulk_create([
+            PatientSearchToken(clinic_id=patient.clinic_id, patient_id=patient.pk, kind=kind, token=token)
+            for kind, token in patient_tokens(patient)
+        ])
+        if has_fts:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, clinic_id) VALUES (%s, %s, %s)',
+                    [patient.pk, normalize_text(patient.patient_name), patient.clinic_id],
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0054_alter_mastermedicine_medicine_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('name', 'Name word'), ('phone', 'Phone digits (reversed)'), ('pid', 'Patient ID')], max_length=10)),
+                ('token', models.CharField(max_length=100)),
+                ('clinic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='patient_search_tokens', to='hospital.clinic')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='hospital.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['clinic', 'kind', 'token'], name='hospital_pa_clinic__478ece_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+        migrations.RunPython(index_existing_patients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def populate_visit_daily_stats(apps, schema_editor):
+    PatientVisit = apps.get_model('hospital', 'PatientVisit')
+    VisitDailyStats = apps.get_model('hospital', 'VisitDailyStats')
+    db_alias = schema_editor.connection.alias
+
+    buckets = (
+        PatientVisit.objects.using(db_alias).annotate(day=TruncDate('check_in_date'))
+        .values('clinic_id', 'day', 'status')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    VisitDailyStats.objects.using(db_alias).bulk_create([
+        VisitDailyStats(clinic_id=b['clinic_id'], date=b['day'], status=b['status'], count=b['total'])
+        for b in buckets
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0055_patientsearchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('clinic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visit_daily_stats', to='hospital.clinic')),
+            ],
+            options={
+                'verbose_name_plural': 'Visit daily stats',
+                'ordering': ['date'],
+                'unique_together': {('clinic', 'date', 'status')},
+            },
+        ),
+        migrations.RunPython(populate_visit_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.10 on 2026-10-16 21:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0057_patientidsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientLoginJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('clinic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='patient_login_jobs', to='hospital.clinic')),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='login_job', to='hospital.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='hospital_pa_status_e47fe1_idx')],
+            },
+        ),
+    ]
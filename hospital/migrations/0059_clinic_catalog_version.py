@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0058_patientloginjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinic',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.10 on 2026-10-16 23:40
+
+from django.db import migrations
+
+# (name, table, method, expression) - PostgreSQL only, so kept out of Meta.indexes
+TRGM_INDEXES = [
+    # icontains compiles to UPPER(col::text) LIKE UPPER(%s); index that expression
+    ('hospital_patient_name_trgm', 'hospital_patient', 'gin', '(UPPER(patient_name::text)) gin_trgm_ops'),
+    ('hospital_patient_phone_trgm', 'hospital_patient', 'gin', 'phone_number gin_trgm_ops'),
+]
+BRIN_INDEXES = [
+    # Append-mostly tables whose rows arrive in date order: BRIN is tiny and
+    # still narrows date-range scans to the right block ranges
+    ('hospital_patientvisit_checkin_brin', 'hospital_patientvisit', 'brin', 'check_in_date'),
+    ('hospital_treatmentlog_administered_brin', 'hospital_treatmentlog', 'brin', 'administered_date'),
+]
+
+
+def create_pg_indexes(apps, schema_editor):
+    """PostgreSQL only: pg_trgm GIN indexes for substring search, BRIN for dates"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    indexes = list(BRIN_INDEXES)
+    with schema_editor.connection.cursor() as cursor:
+        # pg_trgm ships with the contrib package, which minimal installs lack
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone():
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            indexes += TRGM_INDEXES
+    for name, table, method, expression in indexes:
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING {method} ({expression})")
+
+
+def drop_pg_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, method, expression in TRGM_INDEXES + BRIN_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0059_clinic_catalog_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pg_indexes, drop_pg_indexes),
+    ]
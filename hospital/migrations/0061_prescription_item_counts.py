@@ -0,0 +1,44 @@
+# Generated by Django 5.2.10 on 2026-10-17 09:15
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counts(apps, schema_editor):
+    Prescription = apps.get_model('hospital', 'Prescription')
+    alias = schema_editor.connection.alias
+
+    def count_of(model_name):
+        model = apps.get_model('hospital', model_name)
+        return Coalesce(
+            Subquery(
+                model.objects.using(alias).filter(prescription=OuterRef('pk'))
+                .order_by().values('prescription').annotate(n=Count('pk')).values('n'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Prescription.objects.using(alias).update(medicines_count=count_of('Medicine'), tests_count=count_of('Test'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0060_postgresql_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='medicines_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='tests_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
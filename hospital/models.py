@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 import uuid
@@ -41,6 +41,9 @@ class Clinic(models.Model):
     max_doctors = models.IntegerField(default=10)
     max_patients = models.IntegerField(default=1000)
     max_receptionists = models.IntegerField(default=5)
+
+    # Bumped on every MasterMedicine/MasterTest write (see hospital.master_catalog)
+    catalog_version = models.PositiveIntegerField(default=0, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -142,11 +145,22 @@ class Patient(models.Model):
         super().save(*args, **kwargs)
     
     def generate_patient_id(self):
-        """Generate unique patient ID per clinic"""
-        prefix = f"PT{self.clinic.id}"
+        """Generate unique patient ID per clinic from the per-year sequence"""
         year = timezone.now().year
-        rand = random.randint(10000, 99999)
-        return f"{prefix}-{year}-{rand}"
+        serial = PatientIdSequence.allocate(self.clinic, year)
+        return self.format_patient_id(self.clinic.id, year, serial)
+    
+    @staticmethod
+    def format_patient_id(clinic_id, year, serial):
+        # Six-digit serials never clash with the older random five-digit IDs
+        return f"PT{clinic_id}-{year}-{serial:06d}"
+    
+    @classmethod
+    def allocate_patient_ids(cls, clinic, count, year=None):
+        """Reserve ``count`` consecutive patient IDs (for bulk imports)"""
+        year = year or timezone.now().year
+        first = PatientIdSequence.allocate(clinic, year, count)
+        return [cls.format_patient_id(clinic.id, year, serial) for serial in range(first, first + count)]
     
     def generate_default_password(self):
         """Generate default password for patient"""
@@ -165,6 +179,90 @@ class Patient(models.Model):
             models.Index(fields=['clinic', 'patient_id']),
         ]
 
+# Search tokens for the reception patient search (see hospital.search)
+class PatientSearchToken(models.Model):
+    KIND_CHOICES = [
+        ('name', 'Name word'),
+        ('phone', 'Phone digits (reversed)'),
+        ('pid', 'Patient ID'),
+    ]
+
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='patient_search_tokens', null=True, blank=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='search_tokens')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    token = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['clinic', 'kind', 'token']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.token} -> {self.patient_id}"
+
+# Per-clinic, per-year patient ID counter (see Patient.generate_patient_id)
+class PatientIdSequence(models.Model):
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='patient_id_sequences')
+    year = models.PositiveIntegerField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [['clinic', 'year']]
+
+    def __str__(self):
+        return f"{self.clinic_id}/{self.year}: {self.last_value}"
+
+    @classmethod
+    def allocate(cls, clinic, year, count=1):
+        """
+        Reserve ``count`` serials and return the first one.
+
+        The increment is a single UPDATE, so the row lock (PostgreSQL) or
+        the write lock (SQLite) serializes concurrent registrations without
+        retries; each caller reads back its own value in the same transaction.
+        """
+        rows = cls.objects.filter(clinic=clinic, year=year)
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            if not rows.update(last_value=models.F('last_value') + count):
+                try:
+                    with transaction.atomic(using=using):
+                        cls.objects.create(clinic=clinic, year=year, last_value=count)
+                    return 1
+                except IntegrityError:
+                    # Another registration created this year's row first
+                    rows.update(last_value=models.F('last_value') + count)
+            last_value = rows.values_list('last_value', flat=True).get()
+        return last_value - count + 1
+
+# Queued patient login creation (see hospital.provisioning)
+class PatientLoginJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='patient_login_jobs', null=True, blank=True)
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, related_name='login_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"Login for {self.patient_id}: {self.status}"
+
 # Doctor model
 class Doctor(models.Model):
     clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='doctors', null=True, blank=True)
@@ -198,6 +296,10 @@ class Prescription(models.Model):
     # Admission Recommendation
     admission_recommended = models.BooleanField(default=False, help_text="Doctor recommends patient admission to hospital")
     admission_reason = models.TextField(blank=True, help_text="Reason for recommending admission")
+
+    # Maintained on Medicine/Test writes (see hospital.prescription_counts)
+    medicines_count = models.PositiveIntegerField(default=0, editable=False)
+    tests_count = models.PositiveIntegerField(default=0, editable=False)
     
     objects = ClinicManager()
     
@@ -327,6 +429,23 @@ class PatientVisit(models.Model):
     class Meta:
         ordering = ['-check_in_date']
 
+# Daily check-in counts per clinic and status (rollup of PatientVisit, see hospital.rollups)
+class VisitDailyStats(models.Model):
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='visit_daily_stats', null=True, blank=True)
+    date = models.DateField()
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+    
+    objects = ClinicManager()
+    
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.count}"
+    
+    class Meta:
+        ordering = ['date']
+        unique_together = [['clinic', 'date', 'status']]
+        verbose_name_plural = "Visit daily stats"
+
 # Test Report model - for uploading lab/test reports
 class TestReport(models.Model):
     clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='test_reports', null=True, blank=True)
@@ -0,0 +1,113 @@
+"""
+Keyset (cursor) pagination for long patient lists.
+
+Offset pagination gets slower the deeper you page because the database
+still walks every skipped row. Keyset pagination instead remembers the
+sort key of the last row shown and asks for rows "after" it, so every
+page is a single index range scan of ``per_page + 1`` rows:
+
+    paginator = KeysetPaginator(Patient.objects.filter(clinic=clinic), 'recent')
+    page = paginator.page(request.GET.get('cursor'))
+    page.items, page.next_cursor
+
+Orderings are (field, descending) pairs with ``id`` as the tie-breaker;
+the fields must be non-null. Cursors are opaque URL-safe strings.
+"""
+
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 100
+
+# name -> (field, descending); backed by the (clinic, field) Patient indexes
+ORDERINGS = {
+    'recent': ('registration_date', True),
+    'name': ('patient_name', False),
+}
+
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that were tampered with or belong to another ordering"""
+
+
+def encode_cursor(ordering, value, pk):
+    payload = json.dumps([ordering, value, pk], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    """Return (value, pk) for a cursor produced by encode_cursor()"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        name, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise InvalidCursor('Malformed cursor')
+    if name != ordering or value is None:
+        raise InvalidCursor('Cursor does not match the requested ordering')
+    return value, pk
+
+
+def parse_per_page(value, default=DEFAULT_PER_PAGE, maximum=MAX_PER_PAGE):
+    """Clamp a ?limit= query parameter to 1..maximum"""
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` by one of ORDERINGS using opaque cursors"""
+
+    def __init__(self, queryset, ordering='recent', per_page=DEFAULT_PER_PAGE):
+        if ordering not in ORDERINGS:
+            raise ValueError(f'Unknown ordering {ordering!r}')
+        self.queryset = queryset
+        self.ordering = ordering
+        self.field, self.descending = ORDERINGS[ordering]
+        self.per_page = per_page
+
+    def _ordered(self):
+        if self.descending:
+            return self.queryset.order_by(f'-{self.field}', '-id')
+        return self.queryset.order_by(self.field, 'id')
+
+    def page(self, cursor=None):
+        """Return the page that follows ``cursor`` (the first page when empty)"""
+        qs = self._ordered()
+        if cursor:
+            value, pk = decode_cursor(cursor, self.ordering)
+            # "field <= value AND (field < value OR id < pk)" keeps a bounded
+            # range on the index instead of an OR across the whole table
+            op = 'lt' if self.descending else 'gt'
+            qs = qs.filter(**{f'{self.field}__{op}e': value}).filter(
+                Q(**{f'{self.field}__{op}': value}) | Q(**{f'id__{op}': pk})
+            )
+
+        items = list(qs[:self.per_page + 1])
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            last = items[-1]
+            next_cursor = encode_cursor(self.ordering, getattr(last, self.field), last.pk)
+        return KeysetPage(items, next_cursor)
@@ -0,0 +1,64 @@
+"""
+Denormalized Prescription.medicines_count / tests_count.
+
+Lists of prescriptions show how many medicines and tests each one has;
+reading the columns instead of counting the related rows turns a page of N
+prescriptions from 2N+1 queries into one.
+
+The Medicine/Test signals (see hospital.signals) move the counts with an
+F() update on every row created or deleted through the ORM, inside the
+caller's transaction - the item views wrap their writes in
+prescription_items_atomic() so the row and the count commit together.
+Writes that skip signals (bulk_create, raw SQL, loaddata) leave the counts
+behind; recount_prescriptions() / `manage.py reconcile_prescription_counts`
+puts them right.
+"""
+
+from django.db import router, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Medicine, Prescription, Test
+
+# Related model -> Prescription column holding its count
+COUNT_FIELDS = {Medicine: 'medicines_count', Test: 'tests_count'}
+
+
+def prescription_items_atomic():
+    """atomic() on the database prescription items are written to (it can be a clinic's own)"""
+    return transaction.atomic(using=router.db_for_write(Medicine))
+
+
+def adjust_count(model, prescription_id, delta, using=None):
+    """Move the count of ``model`` rows (Medicine or Test) on one prescription by ``delta``"""
+    field = COUNT_FIELDS[model]
+    qs = Prescription.objects.all_clinics().filter(pk=prescription_id)
+    if using:
+        qs = qs.using(using)
+    qs.update(**{field: F(field) + delta})
+
+
+def _actual_count(model):
+    return Coalesce(
+        Subquery(
+            model.objects.all_clinics().filter(prescription=OuterRef('pk'))
+            .order_by().values('prescription').annotate(n=Count('pk')).values('n'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def stale_prescriptions(queryset=None):
+    """The prescriptions (of ``queryset``, default all) whose stored counts are wrong"""
+    queryset = Prescription.objects.all_clinics() if queryset is None else queryset
+    return queryset.annotate(
+        actual_medicines=_actual_count(Medicine),
+        actual_tests=_actual_count(Test),
+    ).filter(~Q(medicines_count=F('actual_medicines')) | ~Q(tests_count=F('actual_tests')))
+
+
+def recount_prescriptions(queryset=None):
+    """Recompute the counts of ``queryset`` (default all) in one UPDATE; returns rows updated"""
+    queryset = Prescription.objects.all_clinics() if queryset is None else queryset
+    return queryset.update(medicines_count=_actual_count(Medicine), tests_count=_actual_count(Test))
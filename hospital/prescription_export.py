@@ -0,0 +1,359 @@
+"""
+Batch export of prescription PDFs for a date range.
+
+Each prescription is rendered by hospital.prescription_pdf (same data and
+layout as print_prescription / download_prescription, and the same PDF
+cache) in a pool of worker processes. Results come back in date order
+with only a few documents in flight at a time, and are written out as:
+
+- a ZIP of one PDF per prescription
+- a single merged PDF, concatenated object by object by PdfConcatenator
+
+Both are streamed to the client as they are built (under ASGI through
+astream(): Django would read a plain generator into memory in one go before
+sending it), so no more than the documents in flight are held in memory. A
+prescription that fails to render is logged and listed in an errors.txt
+entry / a closing page instead of cutting the download short.
+
+settings.PRESCRIPTION_EXPORT_WORKERS sets the pool size (default: up to
+4 processes); 0 renders in the calling process.
+
+The workers (hospital.prescription_export_worker), and a ZIP streamed
+after the view returned, run outside the request's clinic context: the
+export query is pinned to the clinic's database and each render enters
+clinic_context itself, so clinics with their own database
+(hospital.tenant_databases) export their own rows.
+"""
+
+import copy
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from .models import Prescription
+from .prescription_export_worker import init_worker, render
+from .prescription_pdf import DEFAULT_PAGE_SIZE
+from .tenant_databases import clinic_database
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ['zip', 'pdf']
+# Rendered documents waiting to be written, per worker
+IN_FLIGHT_PER_WORKER = 2
+ERRORS_FILENAME = 'errors.txt'
+
+
+def prescriptions_for_export(clinic, date_from, date_to, doctor=None):
+    """
+    Prescriptions of ``clinic`` written between the two dates (inclusive),
+    oldest first, as light dicts used for file names and rendering.
+    """
+    prescriptions = Prescription.objects.all_clinics().using(clinic_database(clinic)).filter(
+        clinic=clinic,
+        prescription_date__date__gte=date_from,
+        prescription_date__date__lte=date_to,
+    )
+    if doctor:
+        prescriptions = prescriptions.filter(doctor=doctor)
+    return prescriptions.order_by('prescription_date', 'id').values(
+        'id', 'clinic_id', 'prescription_date', 'patient__patient_id', 'patient__patient_name'
+    )
+
+
+def export_filename(item):
+    """prescription_<date>_<patient id>_<name>_<id>.pdf"""
+    date = timezone.localtime(item['prescription_date']).strftime('%Y-%m-%d')
+    name = re.sub(r'[^A-Za-z0-9]+', '_', item['patient__patient_name'] or '').strip('_')
+    return f"prescription_{date}_{item['patient__patient_id']}_{name}_{item['id']}.pdf"
+
+
+# ==================== RENDERING POOL ====================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _worker_count():
+    default = min(4, os.cpu_count() or 1)
+    return getattr(settings, 'PRESCRIPTION_EXPORT_WORKERS', default)
+
+
+def _get_pool():
+    """Process pool shared by all exports in this process (spawned, not forked)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_worker_count(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+            )
+        return _pool
+
+
+def _failed(item, error):
+    logger.error("Could not render prescription %s for export", item['id'], exc_info=error)
+    return item, None, f"{type(error).__name__}: {error}"
+
+
+def iter_rendered(items, size=DEFAULT_PAGE_SIZE):
+    """
+    Yield (item, pdf bytes, None) in order, keeping a bounded number in
+    flight; (item, None, error message) for a prescription that failed
+    """
+    items = iter(items)
+    if not _worker_count():
+        for item in items:
+            try:
+                yield item, render(item['clinic_id'], item['id'], size), None
+            except Exception as e:
+                yield _failed(item, e)
+        return
+
+    pool = _get_pool()
+    window = _worker_count() * IN_FLIGHT_PER_WORKER
+    pending = deque()
+    try:
+        for item in items:
+            pending.append((item, pool.submit(render, item['clinic_id'], item['id'], size)))
+            if len(pending) >= window:
+                yield _result(*pending.popleft())
+        while pending:
+            yield _result(*pending.popleft())
+    finally:
+        # Client went away: drop the queued work
+        for _, future in pending:
+            future.cancel()
+
+
+def _result(item, future):
+    try:
+        return item, future.result(), None
+    except Exception as e:
+        return _failed(item, e)
+
+
+def error_lines(failures):
+    return [f"{export_filename(item)}: {error}" for item, error in failures]
+
+
+# ==================== OUTPUT ====================
+
+class _StreamBuffer:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(items, size=DEFAULT_PAGE_SIZE):
+    """Yield the bytes of a ZIP with one PDF per prescription"""
+    buffer = _StreamBuffer()
+    # PDFs are already compressed; storing them keeps the export CPU-light
+    failures = []
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for item, pdf, error in iter_rendered(items, size):
+            if error:
+                failures.append((item, error))
+                continue
+            local = timezone.localtime(item['prescription_date'])
+            info = zipfile.ZipInfo(export_filename(item), date_time=local.timetuple()[:6])
+            archive.writestr(info, pdf)
+            yield buffer.pop()
+        if failures:
+            lines = ["These prescriptions could not be rendered:", *error_lines(failures)]
+            archive.writestr(ERRORS_FILENAME, '\n'.join(lines) + '\n')
+    yield buffer.pop()
+
+
+def stream_merged_pdf(items, size=DEFAULT_PAGE_SIZE):
+    """Yield the bytes of one PDF holding every prescription, in order"""
+    buffer = _StreamBuffer()
+    merged = PdfConcatenator(buffer)
+    failures = []
+    for item, pdf, error in iter_rendered(items, size):
+        if error:
+            failures.append((item, error))
+            continue
+        merged.append(pdf)
+        yield buffer.pop()
+    if failures or not merged.pages:
+        merged.append(_notice_pdf(
+            ["These prescriptions could not be rendered:", *error_lines(failures)] if failures
+            else ["No prescriptions to export."]
+        ))
+    merged.close()
+    yield buffer.pop()
+
+
+def _notice_pdf(lines):
+    """A plain page (or several) listing ``lines``"""
+    output = BytesIO()
+    page = canvas.Canvas(output, pagesize=A4)
+    margin = 20 * mm
+    y = A4[1] - margin
+    for line in lines:
+        if y < margin:
+            page.showPage()
+            y = A4[1] - margin
+        page.setFont('Helvetica', 10)
+        page.drawString(margin, y, line[:120])
+        y -= 14
+    page.save()
+    return output.getvalue()
+
+
+class PdfConcatenator:
+    """
+    Writes PDFs one after another into ``output`` as a single document.
+
+    Each appended PDF's pages and the objects they use are renumbered and
+    written out straight away, so only the document being copied, the
+    object offsets and a digest per image stay in memory (pypdf's
+    PdfWriter keeps every page until it writes). Identical images - the
+    letterhead on every prescription - are written once and shared.
+    """
+
+    PAGES = 1
+    CATALOG = 2
+
+    def __init__(self, output):
+        self.output = output
+        self.position = 0
+        self.offsets = {}
+        self.pages = []
+        self.images = {}
+        self.next_number = self.CATALOG + 1
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self.output.write(data)
+        self.position += len(data)
+
+    def _allocate(self):
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def _write_object(self, number, value):
+        body = BytesIO()
+        body.write(b'%d 0 obj\n' % number)
+        value.write_to_stream(body)
+        body.write(b'\nendobj\n')
+        self.offsets[number] = self.position
+        self._write(body.getvalue())
+
+    def append(self, pdf):
+        reader = PdfReader(BytesIO(pdf))
+        pages = reader.pages
+        numbers = {}
+        queue = deque()
+
+        # References to the old page tree and pages point at the new ones
+        tree = reader.trailer['/Root'].raw_get('/Pages')
+        numbers[tree.idnum, tree.generation] = self.PAGES
+        for page in pages:
+            reference = page.indirect_reference
+            numbers[reference.idnum, reference.generation] = self._allocate()
+
+        def renumber(value):
+            if isinstance(value, IndirectObject):
+                key = value.idnum, value.generation
+                if key not in numbers:
+                    target = value.get_object()
+                    if isinstance(target, StreamObject) and target.get('/Subtype') == '/Image':
+                        numbers[key] = self._share_image(renumber(target))
+                    else:
+                        numbers[key] = self._allocate()
+                        queue.append((numbers[key], target))
+                return IndirectObject(numbers[key], 0, None)
+            if isinstance(value, DictionaryObject):
+                clone = copy.copy(value)  # streams keep their (still encoded) data
+                for key, item in list(clone.items()):
+                    clone[key] = renumber(item)
+                return clone
+            if isinstance(value, ArrayObject):
+                return ArrayObject(renumber(item) for item in value)
+            return value
+
+        for page in pages:
+            reference = page.indirect_reference
+            entries = {key: renumber(item) for key, item in page.items() if key != '/Parent'}
+            entries[NameObject('/Parent')] = IndirectObject(self.PAGES, 0, None)
+            number = numbers[reference.idnum, reference.generation]
+            self._write_object(number, DictionaryObject(entries))
+            self.pages.append(number)
+            while queue:
+                number, target = queue.popleft()
+                self._write_object(number, renumber(target))
+
+    def _share_image(self, image):
+        """Object number of ``image`` (already renumbered), written the first time it is seen"""
+        body = BytesIO()
+        image.write_to_stream(body)
+        digest = hashlib.sha256(body.getvalue()).digest()
+        if digest not in self.images:
+            self.images[digest] = self._allocate()
+            self._write_object(self.images[digest], image)
+        return self.images[digest]
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table"""
+        self._write_object(self.PAGES, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(IndirectObject(number, 0, None) for number in self.pages),
+            NameObject('/Count'): NumberObject(len(self.pages)),
+        }))
+        self._write_object(self.CATALOG, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.PAGES, 0, None),
+        }))
+        xref = self.position
+        lines = [b'xref\n0 %d\n' % self.next_number, b'0000000000 65535 f \n']
+        lines += [b'%010d 00000 n \n' % self.offsets[number] for number in range(1, self.next_number)]
+        lines.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            self.next_number, self.CATALOG, xref,
+        ))
+        self._write(b''.join(lines))
+
+
+async def astream(chunks):
+    """Async iterator over the sync iterator ``chunks``, one chunk per thread hop"""
+    chunks = iter(chunks)
+    # Every step on the same (thread-sensitive) thread, as the database needs
+    step = sync_to_async(next)
+    try:
+        while (chunk := await step(chunks, None)) is not None:
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            await sync_to_async(close)()
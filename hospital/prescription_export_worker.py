@@ -0,0 +1,27 @@
+"""
+Code run by the export pool of hospital.prescription_export.
+
+Pool processes are spawned and unpickle these functions before Django is
+set up, so nothing that needs the app registry (models, ...) is imported
+at module level here.
+"""
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def render(clinic_id, prescription_id, size):
+    """
+    PDF bytes of one prescription. Runs outside any request, so it routes
+    to the clinic's database itself (see hospital.tenant_databases).
+    """
+    from .models import Clinic, Prescription
+    from .prescription_pdf import get_prescription_pdf
+    from .tenant_databases import clinic_context
+
+    with clinic_context(Clinic.objects.get(pk=clinic_id)):
+        prescription = Prescription.objects.all_clinics().only('id', 'clinic_id').get(pk=prescription_id)
+        pdf, _ = get_prescription_pdf(prescription, size)
+    return pdf
@@ -0,0 +1,543 @@
+"""
+Server-side prescription PDFs.
+
+render_prescription_pdf() draws the same layout as print_prescription.html
+with reportlab: header image and doctor grid, clinic bar, patient row, a
+25% / 75% body (notes, vitals and tests | medicines) and the medical store
+and signature footer. Whatever of the left column does not fit on the first
+page continues after the medicines on the following pages.
+
+Rendered PDFs are cached by prescription ID and a hash of everything that
+appears on the page (see prescription_content_hash), so repeat downloads
+come straight from the cache:
+
+- "rx-pdf:current:<clinic gen>:<id>:<size>" -> content hash of the last render
+- "rx-pdf:<id>:<size>:<hash>"               -> the PDF bytes
+
+The signal handlers in hospital.signals drop the "current" entry when a
+prescription, its medicines/tests/notes/vitals or its patient change, and
+bump the clinic generation when the clinic, its doctors or its medical
+store change.
+
+Text is set in Helvetica unless settings.PRESCRIPTION_PDF_FONTS names TTF
+files ({'regular': ..., 'bold': ..., 'devanagari': ...}). The Marathi line
+above the medical store is only drawn when a Devanagari font is configured.
+"""
+
+import hashlib
+import json
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import caches
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4, A5
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import (
+    BaseDocTemplate, Flowable, Frame, FrameBreak, HRFlowable, Image, KeepTogether,
+    NextPageTemplate, PageTemplate, Paragraph, Spacer, Table, TableStyle,
+)
+from reportlab.platypus.doctemplate import ActionFlowable
+
+from .models import Doctor, Prescription
+
+SCHEDULE_MAP = {
+    "morning": (1, 0, 0),
+    "afternoon": (0, 1, 0),
+    "night": (0, 0, 1),
+    "morning_evening": (1, 0, 1),
+    "morning_night": (1, 0, 1),
+    "afternoon_night": (0, 1, 1),
+    "morning_afternoon_night": (1, 1, 1),
+    "sos": (0, 0, 0),
+}
+
+# Page size -> CSS --scale, as in print_prescription.html
+PAGE_SIZES = {'A4': 1.0, 'A5': 0.7}
+DEFAULT_PAGE_SIZE = 'A4'
+
+# Bump when the drawing code changes so old cached PDFs are not served
+LAYOUT_VERSION = 2
+CACHE_TIMEOUT = 60 * 60 * 24 * 30  # seconds
+
+MEDICAL_STORE_NOTE = "वरील औषधे मिळण्याचे एकमेव ठिकाण"
+
+
+# ==================== DATA ====================
+
+def prescription_queryset():
+    return Prescription.objects.select_related(
+        'patient', 'doctor__user', 'clinic', 'doctor_notes', 'vitals'
+    ).prefetch_related('medicines', 'tests')
+
+
+def build_prescription_context(prescription):
+    """Everything print_prescription.html and the PDF renderer show"""
+    tests = list(prescription.tests.all())
+    medicines = list(prescription.medicines.all())
+    doctor_notes = getattr(prescription, 'doctor_notes', None)
+    vitals = getattr(prescription, 'vitals', None)
+    all_doctors = list(Doctor.objects.filter(clinic=prescription.clinic).select_related('user'))
+    primary_medical = prescription.clinic.associated_medicals.filter(
+        is_primary=True,
+        is_active=True
+    ).first()
+
+    for med in medicines:
+        med.schedule_counts = SCHEDULE_MAP.get(med.schedule, (0, 0, 0))
+
+        # Display helpers
+        med.frequency_display = (med.frequency_per_day or "")
+        med.food_instruction = (med.food_instruction or "-").title()
+
+        # Doctor-friendly format (1-0-1)
+        med.dose_pattern = f"{med.schedule_counts[0]}-{med.schedule_counts[1]}-{med.schedule_counts[2]}"
+
+        med.duration_display = med.duration or "-"
+
+    return {
+        'prescription': prescription,
+        'tests': tests,
+        'medicines': medicines,
+        'doctor_notes': doctor_notes,
+        'vitals': vitals,
+        'doctors': all_doctors,
+        'primary_medical': primary_medical,
+    }
+
+
+def prescription_content_hash(context):
+    """Hash of every value that appears on the printed prescription"""
+    prescription = context['prescription']
+    patient = prescription.patient
+    clinic = prescription.clinic
+    notes = context['doctor_notes']
+    vitals = context['vitals']
+    medical = context['primary_medical']
+    content = {
+        'layout': LAYOUT_VERSION,
+        'prescription': [prescription.pk, prescription.prescription_date, prescription.doctor_id],
+        'patient': [
+            patient.patient_id, patient.patient_name, patient.age, patient.gender,
+            patient.date_of_birth, patient.weight, patient.phone_number, patient.address,
+        ],
+        'clinic': [clinic.name, clinic.address, clinic.phone_number, clinic.logo.name if clinic.logo else ''],
+        'doctors': [
+            [d.pk, d.user.get_full_name(), d.specialization, d.license_number] for d in context['doctors']
+        ],
+        'medicines': [
+            [m.pk, m.medicine_type, m.medicine_name, m.dosage, m.qty, m.dose_pattern, m.food_instruction, m.instructions]
+            for m in context['medicines']
+        ],
+        'tests': [[t.pk, t.test_name] for t in context['tests']],
+        'notes': [notes.diagnosis, notes.observations, notes.treatment_plan, notes.notes] if notes else None,
+        'vitals': [vitals.bp, vitals.pulse, vitals.temp, vitals.spo2, vitals.sugar] if vitals else None,
+        'medical': medical.name if medical else None,
+    }
+    encoded = json.dumps(content, default=str, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+# ==================== CACHE ====================
+
+def _cache():
+    return caches[getattr(settings, 'PRESCRIPTION_PDF_CACHE', 'default')]
+
+
+def _generation_key(clinic_id):
+    return f"rx-pdf:gen:{clinic_id}"
+
+
+def _current_key(generation, prescription_id, size):
+    return f"rx-pdf:current:{generation}:{prescription_id}:{size}"
+
+
+def _content_key(prescription_id, size, digest):
+    return f"rx-pdf:{prescription_id}:{size}:{digest}"
+
+
+def get_prescription_pdf(prescription, size=DEFAULT_PAGE_SIZE):
+    """
+    Return (pdf bytes, content hash) for ``prescription``.
+    Only renders when nothing is cached for the current content.
+    """
+    cache = _cache()
+    generation = cache.get(_generation_key(prescription.clinic_id), 0)
+    current_key = _current_key(generation, prescription.pk, size)
+
+    digest = cache.get(current_key)
+    if digest:
+        pdf = cache.get(_content_key(prescription.pk, size, digest))
+        if pdf is not None:
+            return pdf, digest
+
+    context = build_prescription_context(prescription_queryset().get(pk=prescription.pk))
+    digest = prescription_content_hash(context)
+    content_key = _content_key(prescription.pk, size, digest)
+    pdf = cache.get(content_key)
+    if pdf is None:
+        pdf = render_prescription_pdf(context, size)
+        cache.set(content_key, pdf, CACHE_TIMEOUT)
+    cache.set(current_key, digest, CACHE_TIMEOUT)
+    return pdf, digest
+
+
+def invalidate_prescription_pdfs(clinic_id, prescription_ids):
+    """Forget the cached PDFs of these prescriptions"""
+    if not prescription_ids:
+        return
+    cache = _cache()
+    generation = cache.get(_generation_key(clinic_id), 0)
+    cache.delete_many([
+        _current_key(generation, pk, size) for pk in prescription_ids for size in PAGE_SIZES
+    ])
+
+
+def invalidate_clinic_pdfs(clinic_id):
+    """Forget the cached PDFs of every prescription in a clinic"""
+    cache = _cache()
+    key = _generation_key(clinic_id)
+    cache.set(key, cache.get(key, 0) + 1, None)
+
+
+# ==================== RENDERING ====================
+
+_fonts = None
+
+
+def _font_names():
+    """(regular, bold, devanagari or None), registering configured TTFs once"""
+    global _fonts
+    if _fonts is None:
+        configured = getattr(settings, 'PRESCRIPTION_PDF_FONTS', {}) or {}
+        names = {'regular': 'Helvetica', 'bold': 'Helvetica-Bold', 'devanagari': None}
+        for role, name in [('regular', 'RxSans'), ('bold', 'RxSans-Bold'), ('devanagari', 'RxDevanagari')]:
+            if configured.get(role):
+                pdfmetrics.registerFont(TTFont(name, configured[role]))
+                names[role] = name
+        _fonts = (names['regular'], names['bold'], names['devanagari'])
+    return _fonts
+
+
+class QtyRule(Flowable):
+    """A rule filling the line, then "Qty: n" on the right"""
+
+    def __init__(self, text, font, font_size):
+        super().__init__()
+        self.text, self.font, self.font_size = text, font, font_size
+
+    def wrap(self, avail_width, avail_height):
+        self.width = avail_width
+        return avail_width, self.font_size * 1.3
+
+    def draw(self):
+        text_width = pdfmetrics.stringWidth(self.text, self.font, self.font_size)
+        middle = self.font_size * 0.55
+        self.canv.setLineWidth(0.75)
+        self.canv.line(0, middle, self.width - text_width - 6, middle)
+        self.canv.setFont(self.font, self.font_size)
+        self.canv.drawRightString(self.width, self.font_size * 0.25, self.text)
+
+
+class LeaveFirstPage(ActionFlowable):
+    """Continue on the next page, unless the story already left the first one"""
+
+    def apply(self, doc):
+        if doc.pageTemplate.id == 'first':
+            doc.handle_pageBreak()
+
+
+def split_to_fit(flowables, width, height):
+    """
+    (flowables that fit a ``width`` x ``height`` frame, the rest), splitting
+    the one that straddles the bottom the way a Frame would
+    """
+    fitted = []
+    flowables = list(flowables)
+    while flowables:
+        flowable = flowables.pop(0)
+        space = flowable.getSpaceBefore() if fitted else 0
+        available = height - space
+        if available > 0:
+            _, needed = flowable.wrap(width, available)
+            if needed <= available:
+                fitted.append(flowable)
+                height = available - needed - flowable.getSpaceAfter()
+                continue
+            parts = flowable.split(width, available)
+            if parts:
+                fitted.append(parts[0])
+                flowables[:0] = parts[1:]
+                break
+        flowables.insert(0, flowable)
+        break
+    return fitted, flowables
+
+
+def _header_image_path(clinic):
+    if clinic.logo:
+        try:
+            return clinic.logo.path
+        except (NotImplementedError, ValueError):
+            pass
+    return finders.find('images/header.png')
+
+
+def render_prescription_pdf(context, size=DEFAULT_PAGE_SIZE):
+    """Draw one prescription and return the PDF bytes"""
+    scale = PAGE_SIZES.get(size, 1.0)
+    page_width, page_height = A5 if size == 'A5' else A4
+    regular, bold, devanagari = _font_names()
+    # Helvetica has no glyphs for the symbols the HTML uses
+    symbols = {'dx': 'Dx', 'rx': 'Rx', 'plus': '+'} if regular == 'Helvetica' else {'dx': '△', 'rx': '℞', 'plus': '✚'}
+
+    px = 0.75 * scale  # one CSS pixel at this page scale, in points
+    base = 17 * px
+    pad = 10 * mm * scale
+    content_width = page_width - 2 * pad
+
+    def style(name, size_factor, font=regular, **kwargs):
+        font_size = base * size_factor
+        return ParagraphStyle(name, fontName=font, fontSize=font_size, leading=font_size * 1.3, **kwargs)
+
+    doctor_style = style('doctor', 0.97)
+    doctor_meta_style = style('doctor_meta', 0.82)
+    clinic_style = style('clinic', 0.9, alignment=TA_CENTER)
+    patient_style = style('patient', 0.85)
+    address_style = style('address', 0.72)
+    section_style = style('section', 1.0, spaceAfter=12 * px)
+    small_style = style('small', 0.95)
+    rx_style = ParagraphStyle('rx', fontName='Times-Bold', fontSize=46 * px, leading=52 * px)
+    medicine_style = style('medicine', 0.85, font=bold)
+    dose_style = style('dose', 0.85 * 0.95, font='Courier')
+    strip_style = style('strip', 0.9, font=bold, alignment=TA_CENTER)
+
+    prescription = context['prescription']
+    patient = prescription.patient
+    clinic = prescription.clinic
+    notes = context['doctor_notes']
+    vitals = context['vitals']
+    medical = context['primary_medical']
+
+    def text(value):
+        return escape(str(value if value not in (None, '') else ''))
+
+    # ---- header ----
+    header = []
+    image_path = _header_image_path(clinic)
+    if image_path:
+        reader = ImageReader(image_path)
+        image_width, image_height = reader.getSize()
+        height = min(90 * px, content_width * image_height / image_width)
+        header.append(Image(image_path, width=height * image_width / image_height, height=height))
+    header.append(Spacer(1, 8 * px))
+
+    doctor_cells = []
+    for doc in context['doctors']:
+        name = f"Dr. {text(doc.user.get_full_name())}"
+        if doc == prescription.doctor:
+            name += " (Consulting)"
+        meta = text(doc.specialization)
+        if doc.license_number:
+            meta += f" | Reg: {text(doc.license_number)}"
+        doctor_cells.append([Paragraph(f"<font name='{bold}'>{name}</font>", doctor_style),
+                             Paragraph(meta, doctor_meta_style)])
+    if doctor_cells:
+        rows = [doctor_cells[i:i + 2] for i in range(0, len(doctor_cells), 2)]
+        if len(rows[-1]) == 1:
+            rows[-1].append('')
+        doctor_table = Table(rows, colWidths=[content_width / 2] * 2)
+        doctor_table.setStyle(TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6 * px),
+            ('TOPPADDING', (0, 0), (-1, -1), 0),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6 * px),
+        ]))
+        header.append(doctor_table)
+    header.append(HRFlowable(width='100%', thickness=1.5, color=colors.black, spaceBefore=0, spaceAfter=6 * px))
+    header.append(Paragraph(
+        f"{text(clinic.address)}<br/>Phone: {text(clinic.phone_number) or '-'}", clinic_style
+    ))
+    header.append(HRFlowable(width='100%', thickness=0.75, color=colors.black, spaceBefore=6 * px, spaceAfter=7 * px))
+
+    gap = '&nbsp;' * 4 + ' '
+    dob = patient.date_of_birth.strftime('%d/%m/%Y') if patient.date_of_birth else '-'
+    weight = f"{patient.weight} kg" if patient.weight else '-'
+    patient_items = [
+        ('Patient ID:', text(patient.patient_id)),
+        ('Name:', text(patient.patient_name)),
+        ('Age/Gender:', f"{text(patient.age)}/{text(patient.get_gender_display()) or '-'}"),
+        ('DOB:', dob),
+        ('Weight:', text(weight)),
+        ('Mobile:', text(patient.phone_number) or '-'),
+        ('Date:', timezone.localtime(prescription.prescription_date).strftime('%d/%m/%Y')),
+    ]
+    # Like the flex row: items wrap as a whole, never inside
+    header.append(Paragraph(gap.join(
+        f"<font name='{bold}'>{label.replace(' ', '&nbsp;')}</font>&nbsp;{value.replace(' ', '&nbsp;')}" for label, value in patient_items
+    ), patient_style))
+    header.append(Spacer(1, 5 * px))
+    header.append(Paragraph(f"<font name='{bold}'>Address:</font> {text(patient.address) or '-'}", address_style))
+    header.append(HRFlowable(width='100%', thickness=0.75, color=colors.black, spaceBefore=7 * px, spaceAfter=0))
+
+    header_height = 0
+    for flowable in header:
+        _, height = flowable.wrap(content_width, page_height)
+        header_height += height + flowable.getSpaceBefore() + flowable.getSpaceAfter()
+    header_height += 1
+
+    # ---- left column: notes, vitals, tests ----
+    left_width = content_width * 0.25
+    right_x = pad + left_width + 10 * px
+    right_width = content_width - left_width - 10 * px
+
+    left_inner = left_width - 10 * px
+    left = []
+
+    def labelled(label, value):
+        left.append(Paragraph(f"<font name='{bold}'>{label}</font> {text(value)}", section_style))
+
+    if notes and notes.diagnosis:
+        labelled(symbols['dx'], notes.diagnosis)
+    if notes and notes.observations:
+        labelled('C/O:', notes.observations)
+    if notes and notes.treatment_plan:
+        labelled('O/E:', notes.treatment_plan)
+    if vitals:
+        boxes = [Paragraph(f"<font name='{bold}'>Vitals:</font>", small_style)]
+        for label, value in [('BP', vitals.bp), ('Pulse', vitals.pulse), ('Temp', vitals.temp),
+                             ('SpO2', vitals.spo2), ('Sugar', vitals.sugar)]:
+            if value:
+                box = Table([[Paragraph(f"<font name='{bold}'>{label}:</font><br/>{text(value)}", small_style)]],
+                            colWidths=[left_width - 12 * px])
+                box.setStyle(TableStyle([
+                    ('BOX', (0, 0), (-1, -1), 0.75, colors.HexColor('#999999')),
+                    ('LEFTPADDING', (0, 0), (-1, -1), 3 * px),
+                    ('TOPPADDING', (0, 0), (-1, -1), 3 * px),
+                    ('BOTTOMPADDING', (0, 0), (-1, -1), 3 * px),
+                ]))
+                boxes += [Spacer(1, 6 * px), box]
+        boxes.append(Spacer(1, 12 * px))
+        left += boxes
+    if notes and notes.notes:
+        labelled('Advice:', notes.notes)
+    if context['tests']:
+        # Long lists split across pages, repeating the header row
+        tests_table = Table(
+            [[Paragraph(f"<font name='{bold}'>Test Name</font>", small_style)]]
+            + [[Paragraph(text(test.test_name), small_style)] for test in context['tests']],
+            colWidths=[left_width - 12 * px], repeatRows=1,
+        )
+        tests_table.setStyle(TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.75, colors.black),
+            ('LEFTPADDING', (0, 0), (-1, -1), 4 * px),
+            ('TOPPADDING', (0, 0), (-1, -1), 4 * px),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4 * px),
+        ]))
+        left += [Paragraph(f"<font name='{bold}'>Suggested Tests:</font>", section_style.clone(
+            'tests_label', spaceAfter=5 * px)), tests_table]
+
+    # ---- right column: medicines ----
+    right = [Paragraph(symbols['rx'], rx_style)]
+    for number, medicine in enumerate(context['medicines'], start=1):
+        line = f"{number}. {medicine.get_medicine_type_display()} {medicine.medicine_name}  {medicine.dosage}"
+        dose = f"{medicine.dose_pattern} | {medicine.food_instruction} Food"
+        if medicine.instructions:
+            dose += f" | {medicine.instructions}"
+        right.append(KeepTogether([
+            Paragraph(text(line), medicine_style),
+            QtyRule(f"Qty: {medicine.qty}", bold, base * 0.85),
+            Spacer(1, 4 * px),
+            Paragraph(text(dose), dose_style),
+            HRFlowable(width='100%', thickness=0.75, color=colors.HexColor('#cccccc'), dash=(3, 2),
+                       spaceBefore=8 * px, spaceAfter=10 * px),
+        ]))
+    if not context['medicines']:
+        right.append(Paragraph("No medicines prescribed", style('empty', 0.85)))
+
+    # ---- footer (drawn on every page) ----
+    strip_lines = []
+    if devanagari:
+        strip_lines.append(Paragraph(
+            MEDICAL_STORE_NOTE, ParagraphStyle('note', fontName=devanagari, fontSize=13 * px, leading=17 * px,
+                                               alignment=TA_CENTER)
+        ))
+    if medical:
+        plus = symbols['plus']
+        strip_lines.append(Paragraph(f"{plus} {text(medical.name)} {plus}", strip_style))
+    strip_width = content_width * 0.6
+    strip_height = sum(p.wrap(strip_width, page_height)[1] for p in strip_lines)
+    sign_height = 3 * px + base * 0.9 * 1.3
+    footer_height = 10 * px + max(strip_height, sign_height)
+    footer_top = pad + footer_height
+
+    def draw_page(canvas, doc):
+        canvas.saveState()
+        canvas.setLineWidth(1.5)
+        canvas.rect(pad / 2, pad / 2, page_width - pad, page_height - pad)
+        canvas.setLineWidth(0.75)
+        canvas.line(pad, footer_top, page_width - pad, footer_top)
+
+        y = pad
+        for paragraph in reversed(strip_lines):
+            _, height = paragraph.wrap(strip_width, page_height)
+            paragraph.drawOn(canvas, pad + (content_width - strip_width) / 2, y)
+            y += height
+
+        sign_width = 200 * px
+        sign_y = pad + base * 0.9 * 1.3 + 3 * px
+        canvas.line(page_width - pad - sign_width, sign_y, page_width - pad, sign_y)
+        canvas.setFont(regular, base * 0.9)
+        canvas.drawRightString(page_width - pad, pad + base * 0.25, "Dr. Signature")
+        canvas.restoreState()
+
+    body_gap = 10 * px + 5 * px
+    body_top = page_height - pad - header_height - 10 * px
+    body_height = body_top - footer_top - body_gap
+
+    def draw_first_page(canvas, doc):
+        draw_page(canvas, doc)
+        # The rule between the left column and the medicines
+        canvas.saveState()
+        canvas.setLineWidth(0.75)
+        canvas.line(pad + left_width, footer_top + body_gap, pad + left_width, body_top)
+        canvas.restoreState()
+
+    def frame(x, y, width, height, frame_id, right_padding=0):
+        return Frame(x, y, width, height, id=frame_id, leftPadding=0, rightPadding=right_padding, topPadding=0,
+                     bottomPadding=0)
+
+    first_page = PageTemplate(id='first', onPage=draw_first_page, frames=[
+        frame(pad, body_top, content_width, header_height, 'header'),
+        frame(pad, footer_top + body_gap, left_width, body_height, 'left', right_padding=left_width - left_inner),
+        frame(right_x, footer_top + body_gap, right_width, body_height, 'right'),
+    ])
+    later_pages = PageTemplate(id='later', onPage=draw_page, frames=[
+        frame(pad, footer_top + body_gap, content_width, page_height - pad - footer_top - body_gap, 'body'),
+    ])
+
+    # Overflowing the left frame would run into the medicines' frame, so the
+    # rest of the left column (long notes, many tests) follows the medicines
+    # on the next page instead
+    left, left_rest = split_to_fit(left, left_inner, body_height - 1)
+    story = header + [NextPageTemplate('later'), FrameBreak()] + left + [FrameBreak()] + right
+    if left_rest:
+        story += [LeaveFirstPage()] + left_rest
+
+    buffer = BytesIO()
+    document = BaseDocTemplate(
+        buffer, pagesize=(page_width, page_height), pageTemplates=[first_page, later_pages],
+        title=f"Prescription {prescription.pk}", author=clinic.name,
+        leftMargin=pad, rightMargin=pad, topMargin=pad, bottomMargin=pad,
+    )
+    document.build(story)
+    return buffer.getvalue()
@@ -0,0 +1,262 @@
+"""
+Background creation of patient login accounts.
+
+Creating a login runs the full password hasher, which is deliberately slow,
+so the reception views only queue a PatientLoginJob and return the patient
+ID straight away. The credentials are known up front (username = patient ID
+in lowercase, password = Patient.default_password), so nothing the
+receptionist hands over changes.
+
+Jobs are worked off by:
+
+- a daemon thread started in the web process after the registering
+  transaction commits (settings.PATIENT_LOGIN_WORKER = 'thread', the default)
+- `manage.py process_login_jobs`, which can also queue every patient
+  that has no login yet (set PATIENT_LOGIN_WORKER = 'command' to leave
+  all the work to it)
+
+Failed jobs are retried after RETRY_DELAYS; after MAX_ATTEMPTS they stay
+'failed' with the error recorded until they are queued again.
+
+Neither worker runs inside a request, so the queue is worked off clinic by
+clinic under clinic_context: a clinic with its own database
+(hospital.tenant_databases) keeps its jobs and patients there.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Clinic, Patient, PatientLoginJob, User
+from .tenant_databases import clinic_context
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 4
+RETRY_DELAYS = [10, 60, 300]  # seconds before the 2nd, 3rd and 4th attempt
+# A 'running' job not touched for this long belongs to a dead worker
+STALE_AFTER = timedelta(minutes=10)
+CLAIM_CHUNK = 100
+
+
+class ProvisioningError(Exception):
+    """The login cannot be created (retrying won't help)"""
+
+
+class ProvisioningResult:
+    def __init__(self):
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def processed(self):
+        return self.done + self.retried + self.failed
+
+    def __str__(self):
+        return f"{self.done} logins created, {self.retried} to retry, {self.failed} failed"
+
+
+# ==================== CREATING LOGINS ====================
+
+def login_username(patient):
+    return patient.patient_id.lower()
+
+
+def create_patient_login(patient):
+    """Create and link the patient's login User (the slow, hashing part)"""
+    if patient.user_id:
+        return patient.user
+
+    username = login_username(patient)
+    if not patient.default_password:
+        patient.default_password = patient.generate_default_password()
+        patient.save(update_fields=['default_password'])
+
+    with transaction.atomic():
+        existing = User.objects.filter(username=username).first()
+        if existing:
+            # Left behind by an earlier attempt; reuse it only if it's this clinic's unlinked patient login
+            if existing.role != 'patient' or existing.clinic_id != patient.clinic_id or hasattr(existing, 'patient'):
+                raise ProvisioningError(f"username '{username}' is already taken")
+            user = existing
+        else:
+            user = User.objects.create_user(
+                username=username,
+                password=patient.default_password,
+                email=f"{patient.phone_number}@patient.local",
+                clinic_id=patient.clinic_id,
+                role='patient',
+            )
+        patient.user = user
+        patient.save(update_fields=['user'])
+    return user
+
+
+# ==================== QUEUEING ====================
+
+def clinic_scopes(clinic=None):
+    """
+    ``clinic``, or every clinic followed by None for jobs without one (those
+    live in the shared database). Run each scope under clinic_context.
+    """
+    if clinic:
+        return [clinic]
+    return [*Clinic.objects.order_by('pk'), None]
+
+
+def enqueue_patient_login(patient):
+    """Queue login creation for ``patient``; returns the PatientLoginJob"""
+    job, created = PatientLoginJob.objects.get_or_create(
+        patient=patient, defaults={'clinic_id': patient.clinic_id}
+    )
+    if not created and job.status in ('done', 'failed'):
+        job.status = 'pending'
+        job.attempts = 0
+        job.last_error = ''
+        job.run_after = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'last_error', 'run_after', 'updated_at'])
+    transaction.on_commit(kick_worker)
+    return job
+
+
+def enqueue_missing_logins(clinic=None, batch_size=1000):
+    """
+    Queue a job for every patient without a login (and without a job).
+    Failed jobs are queued again. Returns the number of jobs queued.
+    """
+    queued = 0
+    for scope in clinic_scopes(clinic):
+        with clinic_context(scope):
+            queued += _enqueue_missing_logins(scope, batch_size)
+    return queued
+
+
+def _enqueue_missing_logins(clinic, batch_size):
+    patients = Patient.objects.all_clinics().filter(clinic=clinic, user__isnull=True)
+    failed = PatientLoginJob.objects.all_clinics().filter(
+        clinic=clinic, status='failed', patient__user__isnull=True
+    )
+
+    queued = failed.update(status='pending', attempts=0, last_error='', run_after=timezone.now())
+
+    batch = []
+    for pk, clinic_id in patients.filter(login_job__isnull=True).values_list('pk', 'clinic_id').iterator():
+        batch.append(PatientLoginJob(patient_id=pk, clinic_id=clinic_id))
+        if len(batch) >= batch_size:
+            queued += len(PatientLoginJob.objects.bulk_create(batch, ignore_conflicts=True))
+            batch = []
+    if batch:
+        queued += len(PatientLoginJob.objects.bulk_create(batch, ignore_conflicts=True))
+    return queued
+
+
+def requeue_stale_jobs(clinic=None):
+    """Put 'running' jobs abandoned by a dead worker back in the queue"""
+    requeued = 0
+    for scope in clinic_scopes(clinic):
+        with clinic_context(scope):
+            requeued += PatientLoginJob.objects.all_clinics().filter(
+                clinic=scope, status='running', updated_at__lt=timezone.now() - STALE_AFTER
+            ).update(status='pending', run_after=timezone.now())
+    return requeued
+
+
+# ==================== WORKING OFF THE QUEUE ====================
+
+def process_jobs(limit=None, clinic=None):
+    """Run due jobs until the queue is empty (or ``limit`` jobs ran)"""
+    result = ProvisioningResult()
+    requeue_stale_jobs(clinic)
+    for scope in clinic_scopes(clinic):
+        if limit is not None and result.processed >= limit:
+            break
+        with clinic_context(scope):
+            _process_clinic_jobs(scope, limit, result)
+    return result
+
+
+def _process_clinic_jobs(clinic, limit, result):
+    while limit is None or result.processed < limit:
+        due = PatientLoginJob.objects.all_clinics().filter(
+            clinic=clinic, status='pending', run_after__lte=timezone.now()
+        )
+        chunk = CLAIM_CHUNK if limit is None else min(CLAIM_CHUNK, limit - result.processed)
+        job_ids = list(due.order_by('run_after', 'id').values_list('id', flat=True)[:chunk])
+        if not job_ids:
+            break
+        for job_id in job_ids:
+            if claim_job(job_id):
+                run_job(job_id, result)
+
+
+def claim_job(job_id):
+    """Mark a pending job as running; False if another worker got it first"""
+    return bool(PatientLoginJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', attempts=F('attempts') + 1, updated_at=timezone.now()
+    ))
+
+
+def run_job(job_id, result):
+    job = PatientLoginJob.objects.select_related('patient').get(pk=job_id)
+    try:
+        create_patient_login(job.patient)
+    except Exception as e:
+        if isinstance(e, ProvisioningError) or job.attempts >= MAX_ATTEMPTS:
+            job.status = 'failed'
+            result.failed += 1
+            logger.warning("Patient login job %s failed: %s", job.pk, e)
+        else:
+            job.status = 'pending'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_DELAYS[job.attempts - 1])
+            result.retried += 1
+        job.last_error = str(e)[:1000]
+    else:
+        job.status = 'done'
+        job.last_error = ''
+        result.done += 1
+    job.save(update_fields=['status', 'run_after', 'last_error', 'updated_at'])
+
+
+# ==================== IN-PROCESS WORKER ====================
+
+_worker_lock = threading.Lock()
+_worker_running = False
+_worker_wanted = False
+
+
+def kick_worker():
+    """Make sure the in-process worker thread will look at the queue"""
+    global _worker_running, _worker_wanted
+    if getattr(settings, 'PATIENT_LOGIN_WORKER', 'thread') != 'thread':
+        return
+    with _worker_lock:
+        _worker_wanted = True
+        if _worker_running:
+            return
+        _worker_running = True
+    threading.Thread(target=_worker_loop, name='patient-login-worker', daemon=True).start()
+
+
+def _worker_loop():
+    global _worker_running, _worker_wanted
+    try:
+        while True:
+            with _worker_lock:
+                if not _worker_wanted:
+                    _worker_running = False
+                    return
+                _worker_wanted = False
+            try:
+                process_jobs()
+            except Exception:
+                logger.exception("Patient login worker crashed; jobs stay queued")
+    finally:
+        with _worker_lock:
+            _worker_running = False
+        connections.close_all()
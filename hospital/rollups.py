@@ -0,0 +1,62 @@
+"""
+Materialized rollups that keep dashboard aggregates off the raw tables.
+
+VisitDailyStats holds one row per (clinic, local date, status) with the
+number of PatientVisit rows in that bucket. It is kept up to date by the
+PatientVisit signal handlers in hospital.signals and can be rebuilt from
+history with `manage.py rebuild_visit_daily_stats`.
+"""
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import PatientVisit, VisitDailyStats
+
+
+def visit_rollup_key(clinic_id, check_in_date, status):
+    """(clinic_id, local date, status) bucket for a visit"""
+    return (clinic_id, timezone.localdate(check_in_date), status)
+
+
+def apply_visit_delta(key, delta):
+    """Add ``delta`` to the bucket ``key``, creating the row if needed"""
+    clinic_id, date, status = key
+    rows = VisitDailyStats.objects.filter(clinic_id=clinic_id, date=date, status=status)
+    if rows.update(count=F('count') + delta):
+        return
+    if delta < 0:
+        # No bucket to take from: it went with its clinic (a cascade deletes
+        # the rollup before the visits) or predates the rollup
+        return
+    try:
+        with transaction.atomic(using=router.db_for_write(VisitDailyStats)):
+            VisitDailyStats.objects.create(clinic_id=clinic_id, date=date, status=status, count=delta)
+    except IntegrityError:
+        # Another request created the bucket first
+        rows.update(count=F('count') + delta)
+
+
+def rebuild_visit_daily_stats(clinic=None):
+    """Recompute VisitDailyStats from PatientVisit; returns number of buckets"""
+    visits = PatientVisit.objects.all_clinics()
+    stats = VisitDailyStats.objects.all_clinics()
+    if clinic:
+        visits = visits.filter(clinic=clinic)
+        stats = stats.filter(clinic=clinic)
+
+    # TruncDate uses the current time zone, matching timezone.localdate()
+    buckets = (
+        visits.annotate(day=TruncDate('check_in_date'))
+        .values('clinic_id', 'day', 'status')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic(using=router.db_for_write(VisitDailyStats)):
+        stats.delete()
+        created = VisitDailyStats.objects.bulk_create([
+            VisitDailyStats(clinic_id=b['clinic_id'], date=b['day'], status=b['status'], count=b['total'])
+            for b in buckets.iterator()
+        ], batch_size=2000)
+    return len(created)
@@ -0,0 +1,395 @@
+"""
+Patient search engine for the reception search box.
+
+Patients are indexed into PatientSearchToken rows when they are saved
+(see hospital.signals), so a search is a handful of indexed range scans
+instead of an icontains scan over the whole Patient table:
+
+- name words      -> prefix match on normalized (lowercase, accent-free) words
+- phone number    -> suffix match, stored as reversed digits so a suffix
+                     becomes an index-friendly prefix
+- patient ID      -> exact / prefix match on the full ID and its serial part
+
+On SQLite, SQLiteFTS5SearchBackend additionally keeps an FTS5 trigram table
+that fills up short result lists with substring matches on names;
+PostgresTrigramSearchBackend does the same through a pg_trgm index.
+
+Results are ranked by match quality (see SCORE_*).
+"""
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+
+from .models import Patient, PatientSearchToken
+
+# Match quality - higher is better
+SCORE_PID_EXACT = 100
+SCORE_PHONE_EXACT = 90
+SCORE_PID_PREFIX = 80
+SCORE_PHONE_SUFFIX = 70
+SCORE_NAME_EXACT = 60
+SCORE_NAME_PREFIX = 50
+SCORE_NAME_SUBSTRING = 20
+
+# Max candidates read per search (after ANDing the name terms); keeps
+# latency flat on large clinics
+CANDIDATE_LIMIT = 500
+MIN_PHONE_DIGITS = 3
+
+FTS_TABLE = 'hospital_patient_fts'
+
+_PID_RE = re.compile(r'^pt\d+-', re.IGNORECASE)
+_NUMERIC_RE = re.compile(r'^[\d\s+()-]+$')
+_NON_ALNUM_RE = re.compile(r'[^0-9a-z]+')
+
+
+# ==================== NORMALIZATION ====================
+
+def normalize_text(value):
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return _NON_ALNUM_RE.sub(' ', value.lower()).strip()
+
+
+def phone_digits(value):
+    """Digits only - '+91 98765-43210' -> '919876543210'"""
+    return ''.join(ch for ch in (value or '') if ch.isdigit())
+
+
+def patient_tokens(patient):
+    """
+    Return the set of (kind, token) pairs to index for a patient.
+    Works on model instances and historical (migration) models alike.
+    """
+    tokens = set()
+    for word in normalize_text(patient.patient_name).split():
+        tokens.add(('name', word[:100]))
+
+    digits = phone_digits(patient.phone_number)
+    if digits:
+        tokens.add(('phone', digits[::-1]))
+
+    pid = (patient.patient_id or '').lower()
+    if pid:
+        tokens.add(('pid', pid))
+        serial = pid.rsplit('-', 1)[-1]
+        if serial != pid:
+            tokens.add(('pid', serial))
+    return tokens
+
+
+def _prefix_range(term):
+    """Filter kwargs for an index-friendly 'token starts with term' scan"""
+    return {'token__gte': term, 'token__lt': term + '\uffff'}
+
+
+# ==================== TOKEN BACKEND ====================
+
+class TokenSearchBackend:
+    """Portable backend built on the PatientSearchToken table"""
+
+    # ---------- indexing ----------
+
+    def index_patient(self, patient):
+        """(Re)index one patient; no-op when the tokens are unchanged"""
+        wanted = patient_tokens(patient)
+        existing = set(
+            PatientSearchToken.objects.filter(patient=patient).values_list('kind', 'token')
+        )
+        if wanted == existing:
+            return
+        with transaction.atomic(using=router.db_for_write(PatientSearchToken)):
+            PatientSearchToken.objects.filter(patient=patient).delete()
+            PatientSearchToken.objects.bulk_create([
+                PatientSearchToken(clinic_id=patient.clinic_id, patient=patient, kind=kind, token=token)
+                for kind, token in wanted
+            ])
+
+    def index_patients(self, patients):
+        """Index freshly created patients in bulk (bulk_create skips signals)"""
+        PatientSearchToken.objects.bulk_create([
+            PatientSearchToken(clinic_id=p.clinic_id, patient_id=p.pk, kind=kind, token=token)
+            for p in patients
+            for kind, token in patient_tokens(p)
+        ], batch_size=2000)
+
+    def remove_patient(self, patient_pk):
+        """Tokens cascade with the Patient row; nothing extra to do"""
+
+    def rebuild(self, clinic=None, batch_size=2000):
+        """Rebuild the index from scratch; returns number of patients indexed"""
+        tokens = PatientSearchToken.objects.all()
+        patients = Patient.objects.all_clinics()
+        if clinic:
+            tokens = tokens.filter(clinic=clinic)
+            patients = patients.filter(clinic=clinic)
+        tokens.delete()
+
+        total = 0
+        batch = []
+        for patient in patients.only('id', 'clinic_id', 'patient_name', 'phone_number', 'patient_id').iterator(chunk_size=batch_size):
+            batch.append(patient)
+            if len(batch) >= batch_size:
+                self.index_patients(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.index_patients(batch)
+            total += len(batch)
+        return total
+
+    # ---------- searching ----------
+
+    def search(self, clinic, query, limit=15):
+        """Return up to ``limit`` Patients matching ``query``, best first"""
+        scores = self.score_candidates(clinic, query)
+        if not scores:
+            return []
+        return self._fetch_ranked(scores, limit)
+
+    def score_candidates(self, clinic, query):
+        """Return {patient_pk: score} for ``query``"""
+        raw = (query or '').strip()
+        if not raw:
+            return {}
+
+        scores = {}
+        compact = raw.lower().replace(' ', '')
+
+        # Patient ID (e.g. "PT1-2026-12345" or a prefix of it)
+        if _PID_RE.match(compact):
+            self._merge(scores, self._scan(clinic, 'pid', compact, SCORE_PID_EXACT, SCORE_PID_PREFIX))
+            return scores
+
+        # Digits only -> phone suffix and patient ID serial
+        if _NUMERIC_RE.match(raw):
+            digits = phone_digits(raw)
+            if len(digits) >= MIN_PHONE_DIGITS:
+                self._merge(scores, self._scan(clinic, 'phone', digits[::-1], SCORE_PHONE_EXACT, SCORE_PHONE_SUFFIX))
+            self._merge(scores, self._scan(clinic, 'pid', digits, SCORE_PID_EXACT, SCORE_PID_PREFIX))
+            return scores
+
+        # Name words - every term must match (AND)
+        terms = normalize_text(raw).split()
+        if not terms:
+            return {}
+        return self._name_scores(clinic, terms)
+
+    def _name_scores(self, clinic, terms):
+        # Start from the most selective (longest) term ...
+        terms = sorted(set(terms), key=len, reverse=True)
+        if len(terms) == 1:
+            return self._scan(clinic, 'name', terms[0], SCORE_NAME_EXACT, SCORE_NAME_PREFIX)
+
+        # ... and AND the other terms in SQL, one subquery each, so the
+        # candidate limit applies after the intersection: common first words
+        # ("ramesh kumar") cannot crowd out the patient being looked for
+        name_tokens = self._tokens(clinic, 'name')
+        candidates = name_tokens.filter(**_prefix_range(terms[0]))
+        for term in terms[1:]:
+            candidates = candidates.filter(
+                patient_id__in=name_tokens.filter(**_prefix_range(term)).values('patient_id')
+            )
+        scores = {}
+        for patient_pk, token in candidates.order_by('token').values_list('patient_id', 'token')[:CANDIDATE_LIMIT]:
+            score = SCORE_NAME_EXACT if token == terms[0] else SCORE_NAME_PREFIX
+            if score > scores.get(patient_pk, 0):
+                scores[patient_pk] = score
+        if not scores:
+            return scores
+
+        # Score the other terms against those candidates' own words
+        words = {}
+        for patient_pk, token in PatientSearchToken.objects.filter(
+            patient_id__in=list(scores), kind='name'
+        ).values_list('patient_id', 'token'):
+            words.setdefault(patient_pk, []).append(token)
+
+        for term in terms[1:]:
+            for patient_pk in scores:
+                best = SCORE_NAME_PREFIX
+                if term in words.get(patient_pk, ()):
+                    best = SCORE_NAME_EXACT
+                scores[patient_pk] += best
+        return scores
+
+    @staticmethod
+    def _tokens(clinic, kind):
+        qs = PatientSearchToken.objects.filter(kind=kind)
+        if clinic:
+            qs = qs.filter(clinic=clinic)
+        return qs
+
+    def _scan(self, clinic, kind, term, exact_score, prefix_score):
+        """Index range scan for tokens starting with ``term``"""
+        qs = self._tokens(clinic, kind).filter(**_prefix_range(term)).order_by('token')[:CANDIDATE_LIMIT]
+
+        scores = {}
+        for patient_pk, token in qs.values_list('patient_id', 'token'):
+            score = exact_score if token == term else prefix_score
+            if score > scores.get(patient_pk, 0):
+                scores[patient_pk] = score
+        return scores
+
+    @staticmethod
+    def _merge(scores, more):
+        for pk, score in more.items():
+            if score > scores.get(pk, 0):
+                scores[pk] = score
+
+    @staticmethod
+    def _fetch_ranked(scores, limit):
+        # Candidates arrive in token (alphabetical) order, which breaks ties
+        order = {pk: position for position, pk in enumerate(scores)}
+        top = sorted(scores, key=lambda pk: (-scores[pk], order[pk]))[:limit]
+        patients = Patient.objects.all_clinics().filter(pk__in=top).only(
+            'id', 'patient_id', 'patient_name', 'phone_number', 'clinic_id'
+        )
+        by_pk = {p.pk: p for p in patients}
+        return [by_pk[pk] for pk in top if pk in by_pk]
+
+
+# ==================== SQLITE FTS5 BACKEND ====================
+
+def _fts_connection():
+    """The database holding the patients (a clinic may have its own, see hospital.tenant_databases)"""
+    return connections[router.db_for_write(Patient)]
+
+
+class SQLiteFTS5SearchBackend(TokenSearchBackend):
+    """
+    Token backend plus an FTS5 trigram table over patient names.
+    The trigram table is only consulted when the token scan returns
+    fewer than ``limit`` results, to add substring matches
+    (e.g. "esh" -> "Ramesh").
+    """
+
+    def index_patient(self, patient):
+        super().index_patient(patient)
+        with _fts_connection().cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, clinic_id) VALUES (%s, %s, %s)',
+                [patient.pk, normalize_text(patient.patient_name), patient.clinic_id],
+            )
+
+    def index_patients(self, patients):
+        super().index_patients(patients)
+        with _fts_connection().cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, clinic_id) VALUES (%s, %s, %s)',
+                [(p.pk, normalize_text(p.patient_name), p.clinic_id) for p in patients],
+            )
+
+    def remove_patient(self, patient_pk):
+        with _fts_connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [patient_pk])
+
+    def rebuild(self, clinic=None, batch_size=2000):
+        with _fts_connection().cursor() as cursor:
+            if clinic:
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE clinic_id = %s', [clinic.pk])
+            else:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        return super().rebuild(clinic=clinic, batch_size=batch_size)
+
+    def search(self, clinic, query, limit=15):
+        scores = self.score_candidates(clinic, query)
+        if len(scores) < limit:
+            terms = normalize_text(query).split()
+            if terms and all(len(term) >= 3 for term in terms) and not _NUMERIC_RE.match(query.strip()):
+                for pk in self._substring_matches(clinic, terms, limit * 4):
+                    scores.setdefault(pk, SCORE_NAME_SUBSTRING * len(terms))
+        if not scores:
+            return []
+        return self._fetch_ranked(scores, limit)
+
+    def _substring_matches(self, clinic, terms, limit):
+        match = ' AND '.join('"%s"' % term.replace('"', '') for term in terms)
+        sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [match]
+        if clinic:
+            sql += ' AND clinic_id = %s'
+            params.append(clinic.pk)
+        sql += ' LIMIT %s'
+        params.append(limit)
+        with _fts_connection().cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+# ==================== POSTGRESQL TRIGRAM BACKEND ====================
+
+class PostgresTrigramSearchBackend(TokenSearchBackend):
+    """
+    Token backend plus substring matches on names through the pg_trgm GIN
+    index on UPPER(patient_name) (migration 0060), the PostgreSQL
+    counterpart of the FTS5 table. Like FTS5, only consulted to fill up
+    short result lists, and only for terms of 3+ characters (trigrams).
+    """
+
+    def search(self, clinic, query, limit=15):
+        scores = self.score_candidates(clinic, query)
+        if len(scores) < limit:
+            terms = normalize_text(query).split()
+            if terms and all(len(term) >= 3 for term in terms) and not _NUMERIC_RE.match(query.strip()):
+                for pk in self._substring_matches(clinic, terms, limit * 4):
+                    scores.setdefault(pk, SCORE_NAME_SUBSTRING * len(terms))
+        if not scores:
+            return []
+        return self._fetch_ranked(scores, limit)
+
+    def _substring_matches(self, clinic, terms, limit):
+        qs = Patient.objects.all_clinics()
+        if clinic:
+            qs = qs.filter(clinic=clinic)
+        for term in terms:
+            qs = qs.filter(patient_name__icontains=term)
+        return list(qs.values_list('pk', flat=True)[:limit])
+
+
+# ==================== BACKEND SELECTION ====================
+
+_backend = None
+
+
+def fts5_table_exists():
+    """True when running on SQLite and the FTS5 table was created by migrations"""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def get_search_backend():
+    """
+    Return the configured backend.
+
+    settings.PATIENT_SEARCH_BACKEND: 'auto' (default), 'token', 'fts5' or
+    'trigram'. 'auto' uses FTS5 when the SQLite trigram table is available
+    and pg_trgm on PostgreSQL.
+    """
+    global _backend
+    if _backend is None:
+        choice = getattr(settings, 'PATIENT_SEARCH_BACKEND', 'auto')
+        if choice == 'fts5' or (choice == 'auto' and fts5_table_exists()):
+            _backend = SQLiteFTS5SearchBackend()
+        elif choice == 'trigram' or (choice == 'auto' and connection.vendor == 'postgresql'):
+            _backend = PostgresTrigramSearchBackend()
+        else:
+            _backend = TokenSearchBackend()
+    return _backend
+
+
+def reset_search_backend():
+    global _backend
+    _backend = None
+
+
+def search_patients(clinic, query, limit=15):
+    """Search patients of ``clinic`` (all clinics when None)"""
+    return get_search_backend().search(clinic, query, limit)
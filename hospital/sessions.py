@@ -0,0 +1,49 @@
+"""
+Cached, database-backed sessions for SESSION_ENGINE = 'hospital.sessions'.
+
+Django's cached_db engine: every write goes to django_session and to the
+SESSION_CACHE_ALIAS cache, reads come from the cache and only fall back to
+the table on a miss. The 'sessions' cache is a LocMemCache, i.e. an LRU
+inside each worker process, so a process that changes a session (login,
+logout) cannot reach the cached copies of the other processes. Entries are
+therefore kept for at most SESSION_CACHE_MAX_AGE seconds instead of the
+whole session lifetime - the longest another process may still see a
+session that was logged out. Set it to None when SESSION_CACHE_ALIAS points
+at a cache the processes share.
+"""
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+
+DEFAULT_CACHE_MAX_AGE = 60  # seconds
+
+
+class _ShortLivedCache:
+    """Cache proxy that caps the timeout of every entry at ``max_age`` seconds"""
+
+    def __init__(self, cache, max_age):
+        self._cache = cache
+        self._max_age = max_age
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def _timeout(self, timeout):
+        return self._max_age if timeout is None else min(timeout, self._max_age)
+
+    def set(self, key, value, timeout):
+        return self._cache.set(key, value, self._timeout(timeout))
+
+    async def aset(self, key, value, timeout):
+        return await self._cache.aset(key, value, self._timeout(timeout))
+
+
+class SessionStore(cached_db.SessionStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        max_age = getattr(settings, 'SESSION_CACHE_MAX_AGE', DEFAULT_CACHE_MAX_AGE)
+        if max_age is not None:
+            self._cache = _ShortLivedCache(self._cache, max_age)
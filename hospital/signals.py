@@ -0,0 +1,223 @@
+"""
+Model signal handlers.
+Connected in HospitalConfig.ready().
+"""
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .clinic_cache import invalidate_clinic
+from .live_queue import publish_visit_event
+from .master_catalog import bump_catalog_version
+from .medicine_index import loaded_medicine_index
+from .models import (
+    AssociatedMedical, Clinic, Doctor, DoctorNotes, MasterMedicine, MasterTest, Medicine, Patient, PatientVisit,
+    Prescription, Test, User, Vitals,
+)
+from .prescription_counts import adjust_count
+from .prescription_pdf import invalidate_clinic_pdfs, invalidate_prescription_pdfs
+from .rollups import apply_visit_delta, visit_rollup_key
+from .search import get_search_backend
+from .tenant_databases import forget_global_row, replicate_global_row, tenant_database_for_id
+
+
+# ==================== CLINIC CACHE ====================
+
+@receiver(post_save, sender=Clinic)
+@receiver(post_delete, sender=Clinic)
+def invalidate_clinic_cache(sender, instance, **kwargs):
+    """Drop the cached slug -> Clinic entry when a clinic changes"""
+    invalidate_clinic(clinic=instance, slug=instance.slug)
+
+
+# ==================== MEDICINE AUTOCOMPLETE INDEX ====================
+
+@receiver(post_save, sender=MasterMedicine)
+def update_medicine_index(sender, instance, raw=False, **kwargs):
+    index = loaded_medicine_index(instance.clinic_id)
+    if index and not raw:
+        index.update_medicine(instance)
+
+
+@receiver(post_delete, sender=MasterMedicine)
+def remove_from_medicine_index(sender, instance, **kwargs):
+    index = loaded_medicine_index(instance.clinic_id)
+    if index:
+        index.remove_medicine(instance.pk)
+
+
+@receiver(post_save, sender=Medicine)
+def count_prescribed_medicine(sender, instance, created, raw=False, **kwargs):
+    """Feed the per-doctor ranking with newly prescribed medicines"""
+    index = loaded_medicine_index(instance.clinic_id)
+    if not index or not created or raw:
+        return
+    user_id = Prescription.objects.all_clinics().filter(pk=instance.prescription_id).values_list(
+        'doctor__user_id', flat=True
+    ).first()
+    index.record_prescribed(user_id, instance.medicine_name)
+
+
+# ==================== MASTER CATALOG VERSION ====================
+
+@receiver(post_save, sender=MasterMedicine)
+@receiver(post_delete, sender=MasterMedicine)
+@receiver(post_save, sender=MasterTest)
+@receiver(post_delete, sender=MasterTest)
+def bump_master_catalog_version(sender, instance, raw=False, **kwargs):
+    """Make the clinic's master data ETags and snapshot URLs change"""
+    if not raw:
+        bump_catalog_version(instance.clinic_id)
+
+
+# ==================== PATIENT SEARCH INDEX ====================
+
+@receiver(post_save, sender=Patient)
+def index_patient_for_search(sender, instance, raw=False, **kwargs):
+    """Keep the reception search index in step with patient edits"""
+    if raw:
+        return
+    get_search_backend().index_patient(instance)
+
+
+@receiver(post_delete, sender=Patient)
+def remove_patient_from_search(sender, instance, **kwargs):
+    get_search_backend().remove_patient(instance.pk)
+
+
+# ==================== VISIT DAILY ROLLUP ====================
+
+@receiver(pre_save, sender=PatientVisit)
+def remember_visit_rollup_key(sender, instance, raw=False, **kwargs):
+    """Capture the visit's bucket (and, for the live queue, status) before an update changes it"""
+    instance._rollup_old_key = None
+    instance._old_status = None
+    if raw or not instance.pk:
+        return
+    old = PatientVisit.objects.filter(pk=instance.pk).values('clinic_id', 'check_in_date', 'status').first()
+    if old:
+        instance._rollup_old_key = visit_rollup_key(old['clinic_id'], old['check_in_date'], old['status'])
+        instance._old_status = old['status']
+
+
+@receiver(post_save, sender=PatientVisit)
+def update_visit_rollup(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_key = visit_rollup_key(instance.clinic_id, instance.check_in_date, instance.status)
+    old_key = getattr(instance, '_rollup_old_key', None)
+    if created or old_key is None:
+        apply_visit_delta(new_key, 1)
+    elif old_key != new_key:
+        apply_visit_delta(old_key, -1)
+        apply_visit_delta(new_key, 1)
+
+
+@receiver(post_delete, sender=PatientVisit)
+def remove_visit_from_rollup(sender, instance, **kwargs):
+    apply_visit_delta(visit_rollup_key(instance.clinic_id, instance.check_in_date, instance.status), -1)
+
+
+# ==================== LIVE CHECK-IN QUEUE ====================
+
+@receiver(post_save, sender=PatientVisit)
+def publish_visit_to_live_queue(sender, instance, created, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Push check-ins and status changes to the open dashboards once committed"""
+    if raw:
+        return
+    if created:
+        kind = 'created'
+    elif instance.status != getattr(instance, '_old_status', None):
+        kind = 'status_changed'
+    else:
+        return
+    transaction.on_commit(lambda: publish_visit_event(instance, kind), using=using)
+
+
+# ==================== PRESCRIPTION ITEM COUNTS ====================
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_save, sender=Test)
+def count_prescription_item(sender, instance, created, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Keep Prescription.medicines_count / tests_count in step (same transaction)"""
+    if created and not raw:
+        adjust_count(sender, instance.prescription_id, 1, using)
+
+
+@receiver(post_delete, sender=Medicine)
+@receiver(post_delete, sender=Test)
+def uncount_prescription_item(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    adjust_count(sender, instance.prescription_id, -1, using)
+
+
+# ==================== PRESCRIPTION PDF CACHE ====================
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+def invalidate_prescription_pdf(sender, instance, **kwargs):
+    invalidate_prescription_pdfs(instance.clinic_id, [instance.pk])
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+@receiver(post_save, sender=DoctorNotes)
+@receiver(post_delete, sender=DoctorNotes)
+@receiver(post_save, sender=Vitals)
+@receiver(post_delete, sender=Vitals)
+def invalidate_prescription_pdf_for_item(sender, instance, **kwargs):
+    """Medicines, tests, notes and vitals are all printed on the prescription"""
+    invalidate_prescription_pdfs(instance.clinic_id, [instance.prescription_id])
+
+
+@receiver(post_save, sender=Patient)
+def invalidate_patient_prescription_pdfs(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    invalidate_prescription_pdfs(
+        instance.clinic_id, list(instance.prescriptions.values_list('pk', flat=True))
+    )
+
+
+@receiver(post_save, sender=Clinic)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=AssociatedMedical)
+@receiver(post_delete, sender=AssociatedMedical)
+def invalidate_clinic_prescription_pdfs(sender, instance, **kwargs):
+    """The clinic header, doctor grid and medical store appear on every prescription"""
+    invalidate_clinic_pdfs(instance.pk if sender is Clinic else instance.clinic_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_doctor_name_pdfs(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Doctor names are printed; logins (last_login updates) don't matter"""
+    if raw or created or instance.role != 'doctor' or not instance.clinic_id:
+        return
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    invalidate_clinic_pdfs(instance.clinic_id)
+
+
+# ==================== TENANT DATABASE COPIES ====================
+
+@receiver(post_save, sender=Clinic)
+@receiver(post_save, sender=User)
+def replicate_to_tenant_database(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    """A clinic with its own database keeps copies of its Clinic row and users there"""
+    if raw or using != DEFAULT_DB_ALIAS:
+        return
+    alias = tenant_database_for_id(instance.pk if sender is Clinic else instance.clinic_id)
+    if alias:
+        replicate_global_row(instance, alias)
+
+
+@receiver(post_delete, sender=User)
+def forget_in_tenant_database(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if using != DEFAULT_DB_ALIAS:
+        return
+    alias = tenant_database_for_id(instance.clinic_id)
+    if alias:
+        forget_global_row(instance, alias)
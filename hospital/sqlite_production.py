@@ -0,0 +1,204 @@
+"""
+SQLite production mode.
+
+settings.DATABASES['default']['OPTIONS'] configures every connection:
+
+- journal_mode=WAL: readers no longer wait for the writer (nor it for them)
+- synchronous=NORMAL: safe with WAL, and commits stop waiting on fsync
+- mmap_size / cache_size / temp_store: fewer read syscalls per query
+- transaction_mode IMMEDIATE: an atomic block takes the write lock at BEGIN,
+  so two writers queue on the busy timeout instead of one failing with
+  "database is locked" when it tries to upgrade a read lock
+- timeout: how long a writer waits for the lock (the busy timeout)
+
+SQLite still has a single writer. With SQLITE_WRITE_QUEUE = True,
+SerializedWritesMiddleware also makes the unsafe-method requests (POST,
+PUT, PATCH, DELETE) of one process take turns on an in-process lock: they
+wait as long as needed instead of racing for the file lock, so a burst of
+check-ins is slowed down rather than rejected. Processes still contend with
+each other through the busy timeout.
+
+benchmark_sqlite() measures the effect with threads of concurrent
+check-in writes and dashboard reads on a scratch database
+(`manage.py sqlite_benchmark`).
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+UNSAFE_METHODS = frozenset(['POST', 'PUT', 'PATCH', 'DELETE'])
+# What Django uses when DATABASES has no OPTIONS
+DJANGO_DEFAULT_OPTIONS = {'timeout': 5}
+
+_write_lock = threading.Lock()
+
+
+# ==================== WRITE QUEUE ====================
+
+@contextmanager
+def serialized_writes():
+    """Wait (without limit) for this process's turn to write"""
+    with _write_lock:
+        yield
+
+
+class SerializedWritesMiddleware:
+    """Run the unsafe-method requests of this process one at a time"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQLITE_WRITE_QUEUE', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in UNSAFE_METHODS:
+            return self.get_response(request)
+        with serialized_writes():
+            return self.get_response(request)
+
+
+# ==================== BENCHMARK ====================
+
+SCHEMA = """
+    CREATE TABLE visit (id INTEGER PRIMARY KEY, clinic_id INTEGER, purpose TEXT, created REAL);
+    CREATE INDEX visit_clinic ON visit (clinic_id, created);
+    CREATE TABLE daily_stats (clinic_id INTEGER PRIMARY KEY, visits INTEGER NOT NULL DEFAULT 0);
+"""
+CLINICS = 5
+SEED_ROWS = 20000
+
+
+def _connect(path, options):
+    """A sqlite3 connection set up the way Django sets one up from ``options``"""
+    conn = sqlite3.connect(path, timeout=options.get('timeout', 5), isolation_level=None,
+                           check_same_thread=False)
+    for command in options.get('init_command', '').split(';'):
+        if command.strip():
+            conn.execute(command)
+    return conn
+
+
+def _create(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript(SCHEMA)
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO visit (clinic_id, purpose, created) VALUES (?, ?, ?)',
+        ((n % CLINICS, 'Checkup', n) for n in range(SEED_ROWS)),
+    )
+    conn.executemany('INSERT INTO daily_stats (clinic_id, visits) VALUES (?, 0)', ((c,) for c in range(CLINICS)))
+    conn.execute('COMMIT')
+    conn.close()
+
+
+def _check_in(conn, begin, clinic_id):
+    """What patient_checkin does: read, insert the visit, bump the rollup"""
+    conn.execute(begin)
+    try:
+        conn.execute('SELECT COUNT(*) FROM visit WHERE clinic_id = ?', (clinic_id,)).fetchone()
+        conn.execute('INSERT INTO visit (clinic_id, purpose, created) VALUES (?, ?, ?)',
+                     (clinic_id, 'Checkup', time.time()))
+        conn.execute('UPDATE daily_stats SET visits = visits + 1 WHERE clinic_id = ?', (clinic_id,))
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
+
+def _dashboard(conn, clinic_id):
+    conn.execute(
+        'SELECT id, purpose FROM visit WHERE clinic_id = ? ORDER BY created DESC LIMIT 50', (clinic_id,)
+    ).fetchall()
+    conn.execute('SELECT visits FROM daily_stats WHERE clinic_id = ?', (clinic_id,)).fetchone()
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return round(sorted_values[rank - 1] * 1000, 2)
+
+
+def benchmark_sqlite(options, writers=8, readers=8, duration=5.0, write_queue=False):
+    """
+    Run ``writers`` check-in threads and ``readers`` dashboard threads for
+    ``duration`` seconds on a fresh database opened with ``options`` (a
+    DATABASES OPTIONS dict). Returns throughput, lock errors and latencies.
+    """
+    begin = 'BEGIN IMMEDIATE' if options.get('transaction_mode', '').upper() == 'IMMEDIATE' else 'BEGIN'
+    queue = threading.Lock()
+    lock = threading.Lock()
+    writes, reads, locked = [], [], [0]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.sqlite3')
+        _create(path)
+        deadline = time.monotonic() + duration
+
+        def write_loop(n):
+            conn = _connect(path, options)
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    if write_queue:
+                        with queue:
+                            _check_in(conn, begin, n % CLINICS)
+                    else:
+                        _check_in(conn, begin, n % CLINICS)
+                except sqlite3.OperationalError:
+                    with lock:
+                        locked[0] += 1
+                    continue
+                with lock:
+                    writes.append(time.perf_counter() - start)
+            conn.close()
+
+        def read_loop(n):
+            conn = _connect(path, options)
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    _dashboard(conn, n % CLINICS)
+                except sqlite3.OperationalError:
+                    with lock:
+                        locked[0] += 1
+                    continue
+                with lock:
+                    reads.append(time.perf_counter() - start)
+            conn.close()
+
+        threads = [threading.Thread(target=write_loop, args=(n,)) for n in range(writers)]
+        threads += [threading.Thread(target=read_loop, args=(n,)) for n in range(readers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        conn = sqlite3.connect(path)
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        conn.close()
+
+    writes.sort()
+    reads.sort()
+    return {
+        'journal_mode': journal_mode,
+        'transaction': begin,
+        'write_queue': write_queue,
+        'writes_per_s': round(len(writes) / elapsed, 1),
+        'reads_per_s': round(len(reads) / elapsed, 1),
+        'lock_errors': locked[0],
+        'write_p50_ms': _percentile(writes, 50),
+        'write_p95_ms': _percentile(writes, 95),
+        'read_p50_ms': _percentile(reads, 50),
+        'read_p95_ms': _percentile(reads, 95),
+    }
@@ -0,0 +1,428 @@
+"""
+Synthetic multi-clinic data for load and scale testing.
+
+SyntheticDataGenerator creates clinics, each with doctors, a receptionist,
+master medicines/tests and a history of patients: visits, prescriptions
+with medicines, tests, vitals and doctor notes, plus admissions with
+treatment logs, using the real models and tables: bulk_create for rows
+other rows point at (patients, prescriptions, admissions), a plain
+executemany built from the model's fields for the leaf tables. Each batch
+of patients and all their rows is one transaction.
+
+Output is reproducible for a given seed, options and ``now`` (the anchor
+every date is computed from; the current time if not given). Dates are
+spread over the ``days`` days up to it during clinic hours. bulk_create
+stamps auto_now/auto_now_add fields with the wall clock, so the generator
+writes the intended dates back with one bulk_update per batch.
+
+bulk_create skips signals, so the generator indexes the new patients for
+search, counts the prescription items and rebuilds the check-in rollup
+itself. Logins are not created -
+the patients show up under "patients without login".
+"""
+
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, models, router, transaction
+from django.utils import timezone
+
+from .models import (
+    Clinic, Doctor, DoctorNotes, MasterMedicine, MasterTest, Medicine, Patient, PatientAdmission,
+    PatientVisit, Prescription, Test, TreatmentLog, User, Vitals,
+)
+from .prescription_counts import recount_prescriptions
+from .rollups import rebuild_visit_daily_stats
+from .search import get_search_backend
+from .tenant_databases import clinic_context, clinic_database, replicate_global_row, tenant_database
+
+# Rough rows written per patient with the distributions below (used to turn
+# a target row count into patients per clinic)
+ROWS_PER_PATIENT = 19
+
+VISITS_PER_PATIENT = [1, 1, 1, 2, 2, 3, 4, 6]
+MEDICINES_PER_PRESCRIPTION = [1, 2, 2, 3, 3, 3, 4, 5]
+TESTS_PER_PRESCRIPTION = [0, 0, 0, 1, 1, 2]
+ADMISSION_RATE = 0.04
+TREATMENTS_PER_ADMISSION = (2, 10)
+OPENING_HOUR, CLOSING_HOUR = 9, 19
+INSERT_CHUNK = 5000
+BULK_BATCH = 2000
+
+FIRST_NAMES = [
+    'Aarav', 'Vivaan', 'Aditya', 'Vihaan', 'Arjun', 'Sai', 'Reyansh', 'Krishna', 'Ishaan', 'Rohan',
+    'Ananya', 'Diya', 'Aadhya', 'Saanvi', 'Pari', 'Anika', 'Navya', 'Kavya', 'Meera', 'Sneha',
+    'Rahul', 'Amit', 'Suresh', 'Ramesh', 'Ganesh', 'Sunita', 'Lata', 'Asha', 'Pooja', 'Priya',
+]
+LAST_NAMES = [
+    'Patil', 'Deshmukh', 'Kulkarni', 'Joshi', 'Pawar', 'Jadhav', 'Shinde', 'More', 'Chavan', 'Gaikwad',
+    'Sharma', 'Verma', 'Gupta', 'Singh', 'Kumar', 'Reddy', 'Nair', 'Iyer', 'Shah', 'Mehta',
+]
+CITIES = [('Pune', 'Maharashtra'), ('Nashik', 'Maharashtra'), ('Satara', 'Maharashtra'), ('Belgaum', 'Karnataka')]
+PURPOSES = ['Checkup', 'Follow-up', 'Fever', 'Cough and cold', 'Body pain', 'Stomach ache', 'Emergency']
+DIAGNOSES = [
+    'Viral fever', 'Upper respiratory tract infection', 'Acute gastritis', 'Hypertension',
+    'Type 2 diabetes mellitus', 'Migraine', 'Lower back pain', 'Allergic rhinitis', 'Urinary tract infection',
+]
+MEDICINES = [
+    # name, type, dosage, schedule, frequency, food
+    ('Paracetamol', 'tablet', '500mg', 'morning_night', 2, 'after'),
+    ('Ibuprofen', 'tablet', '400mg', 'morning_evening', 2, 'after'),
+    ('Amoxicillin', 'capsule', '500mg', 'morning_afternoon_night', 3, 'after'),
+    ('Azithromycin', 'tablet', '500mg', 'morning', 1, 'before'),
+    ('Cetirizine', 'tablet', '10mg', 'night', 1, 'anytime'),
+    ('Pantoprazole', 'tablet', '40mg', 'morning', 1, 'before'),
+    ('Ondansetron', 'tablet', '4mg', 'sos', 1, 'anytime'),
+    ('Metformin', 'tablet', '500mg', 'morning_night', 2, 'after'),
+    ('Amlodipine', 'tablet', '5mg', 'morning', 1, 'anytime'),
+    ('Cough Syrup', 'syrup', '10ml', 'morning_afternoon_night', 3, 'after'),
+    ('ORS', 'powder', '1 sachet', 'morning_afternoon_night', 3, 'anytime'),
+    ('Vitamin D3', 'capsule', '60000 IU', 'morning', 1, 'after'),
+    ('Diclofenac Gel', 'ointment', 'Apply thin layer', 'morning_night', 2, 'anytime'),
+    ('Ciprofloxacin Eye Drops', 'drops', '2 drops', 'morning_afternoon_night', 3, 'anytime'),
+]
+TESTS = [
+    ('Complete Blood Count', 'blood'), ('Blood Sugar Fasting', 'blood'), ('HbA1c', 'blood'),
+    ('Lipid Profile', 'blood'), ('Thyroid Profile', 'blood'), ('Urine Routine', 'urine'),
+    ('Chest X-Ray', 'xray'), ('Abdomen Ultrasound', 'ultrasound'), ('ECG', 'ecg'),
+    ('CT Brain', 'ct_scan'), ('MRI Lumbar Spine', 'mri'),
+]
+TREATMENTS = [
+    ('medication', 'Paracetamol 500mg', 'Oral'), ('injection', 'Ceftriaxone 1g', 'IV'),
+    ('saline', 'Normal Saline (0.9%)', 'IV'), ('oxygen', 'Oxygen support', 'Nasal Cannula'),
+    ('monitoring', 'Vitals monitoring', ''), ('therapy', 'Chest physiotherapy', ''),
+]
+
+def _stamped_fields(model):
+    """Fields bulk_create fills with the wall clock"""
+    return [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+
+
+class GenerationResult:
+    def __init__(self):
+        self.clinics = 0
+        self.counts = {}
+        self.started = time.monotonic()
+
+    def add(self, model, count):
+        name = model.__name__
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    @property
+    def rows(self):
+        return sum(self.counts.values())
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def __str__(self):
+        rate = self.rows / self.elapsed if self.elapsed else 0
+        return f"{self.rows} rows in {self.elapsed:.1f}s ({rate:,.0f} rows/s)"
+
+
+class SyntheticDataGenerator:
+    def __init__(self, clinics=3, patients=1000, doctors=4, days=365, seed=1,
+                 prefix='synthetic', batch_size=1000, progress=None, now=None):
+        self.clinic_count = clinics
+        self.patients_per_clinic = patients
+        self.doctors_per_clinic = doctors
+        self.days = days
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.progress = progress
+        self.rng = random.Random(seed)
+        self.now = timezone.localtime(now)
+        self.result = GenerationResult()
+        # One hash for every generated account - they are not meant to log in
+        self.password = make_password(None)
+
+    def run(self):
+        slugs = [f"{self.prefix}-{number}" for number in range(1, self.clinic_count + 1)]
+        taken = set(Clinic.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+        if taken:
+            raise ValueError(f"Clinics already exist: {', '.join(sorted(taken))}")
+
+        for number, slug in enumerate(slugs, start=1):
+            self._generate_clinic(number, slug)
+        return self.result
+
+    # ---------- per clinic ----------
+
+    def _generate_clinic(self, number, slug):
+        rng = self.rng
+        city, state = rng.choice(CITIES)
+        clinic, = self._bulk_create(Clinic, [Clinic(
+            name=f"Synthetic Clinic {number}",
+            slug=slug,
+            address=f"{rng.randint(1, 300)} Main Road",
+            city=city,
+            state=state,
+            zip_code=f"41{rng.randint(1000, 9999)}",
+            phone_number=self._phone(),
+            email=f"{slug}@example.com",
+            registration_number=f"{slug.upper()}-REG",
+            subscription_status='active',
+            max_patients=self.patients_per_clinic * 2,
+        )])
+        self.result.clinics += 1
+        self.result.add(Clinic, 1)
+        # A clinic listed in DB_CLINIC_DATABASES gets its rows in its own database
+        with clinic_context(clinic):
+            self._generate_clinic_rows(clinic)
+
+    def _generate_clinic_rows(self, clinic):
+        rng = self.rng
+        receptionist, *doctor_users = self._bulk_create(User, [
+            User(
+                username=username, password=self.password, clinic=clinic, role=role, date_joined=self.now,
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+            )
+            for username, role in [(f"{clinic.slug}-reception", 'receptionist')] + [
+                (f"{clinic.slug}-dr{index}", 'doctor') for index in range(1, self.doctors_per_clinic + 1)
+            ]
+        ])
+        alias = tenant_database(clinic)
+        if alias:
+            # bulk_create sends no post_save, so copy the rows as hospital.signals would
+            for instance in [clinic, receptionist, *doctor_users]:
+                replicate_global_row(instance, alias)
+        doctors = Doctor.objects.bulk_create([
+            Doctor(clinic=clinic, user=user, specialization='General Physician', license_number=f"MH-{rng.randint(10000, 99999)}")
+            for user in doctor_users
+        ])
+        self.result.add(User, 1 + len(doctor_users))
+        self.result.add(Doctor, len(doctors))
+        self._seed_master_data(clinic)
+
+        remaining = self.patients_per_clinic
+        while remaining > 0:
+            count = min(self.batch_size, remaining)
+            with transaction.atomic(using=clinic_database(clinic)):
+                self._generate_patients(clinic, receptionist, doctors, count)
+            remaining -= count
+            if self.progress:
+                self.progress(clinic, self.patients_per_clinic - remaining, self.result)
+
+        rebuild_visit_daily_stats(clinic=clinic)
+
+    def _seed_master_data(self, clinic):
+        medicines = self._bulk_create(MasterMedicine, [
+            MasterMedicine(
+                clinic=clinic, medicine_name=name, medicine_type=kind, default_dosage=dosage,
+                default_schedule=schedule, frequency_per_day=frequency, food_instruction=food,
+            )
+            for name, kind, dosage, schedule, frequency, food in MEDICINES
+        ])
+        tests = self._bulk_create(MasterTest, [
+            MasterTest(clinic=clinic, test_name=name, test_type=kind) for name, kind in TESTS
+        ])
+        self.result.add(MasterMedicine, len(medicines))
+        self.result.add(MasterTest, len(tests))
+
+    # ---------- patients and their history ----------
+
+    def _generate_patients(self, clinic, receptionist, doctors, count):
+        rng = self.rng
+        histories = []
+        patients = []
+        for patient_id in Patient.allocate_patient_ids(clinic, count, year=self.now.year):
+            visit_times = sorted(self._moment() for _ in range(rng.choice(VISITS_PER_PATIENT)))
+            age = rng.randint(1, 90)
+            patients.append(Patient(
+                clinic=clinic,
+                patient_id=patient_id,
+                patient_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                age=age,
+                gender=rng.choice(['male', 'female']),
+                address=f"{rng.randint(1, 999)}, {rng.choice(CITIES)[0]}",
+                phone_number=self._phone(),
+                date_of_birth=(self.now - timedelta(days=age * 365 + rng.randint(0, 364))).date(),
+                weight=round(rng.uniform(8, 95), 1),
+                registration_date=visit_times[0].date(),
+                status=rng.choice(['registered', 'discharged', 'discharged']),
+                default_password=''.join(rng.choices('abcdefghjkmnpqrstuvwxyz23456789', k=8)),
+                registered_by=receptionist,
+            ))
+            histories.append(visit_times)
+        self._bulk_create(Patient, patients)
+        get_search_backend().index_patients(patients)
+        self.result.add(Patient, len(patients))
+
+        visits, prescriptions = [], []
+        for patient, visit_times in zip(patients, histories):
+            doctor = rng.choice(doctors)  # patients mostly see the same doctor
+            for moment in visit_times:
+                today = moment.date() == self.now.date()
+                purpose = rng.choice(PURPOSES)
+                visits.append(dict(
+                    clinic_id=clinic.pk, patient_id=patient.pk, checked_in_by_id=receptionist.pk, check_in_date=moment,
+                    purpose=purpose, status=rng.choice(['checked_in', 'in_consultation']) if today else 'completed',
+                ))
+                prescriptions.append(Prescription(
+                    clinic=clinic, patient=patient, doctor=doctor if rng.random() < 0.8 else rng.choice(doctors),
+                    prescription_date=min(moment + timedelta(minutes=rng.randint(5, 60)), self.now),
+                    status='pending' if today else 'completed',
+                ))
+        self._insert_rows(PatientVisit, visits)
+        self._bulk_create(Prescription, prescriptions)
+        self.result.add(Prescription, len(prescriptions))
+
+        self._generate_prescription_details(clinic, prescriptions, visits)
+        self._generate_admissions(clinic, patients, histories, doctors)
+
+    def _generate_prescription_details(self, clinic, prescriptions, visits):
+        rng = self.rng
+        medicines, tests, vitals, notes = [], [], [], []
+        for prescription, visit in zip(prescriptions, visits):
+            for name, kind, dosage, schedule, frequency, food in rng.sample(MEDICINES, rng.choice(MEDICINES_PER_PRESCRIPTION)):
+                days = rng.choice([3, 5, 7, 10, 15, 30])
+                medicines.append(dict(
+                    clinic_id=clinic.pk, prescription_id=prescription.pk, medicine_name=name, dosage=dosage,
+                    frequency_per_day=frequency, duration=f"{days} days", medicine_type=kind,
+                    qty=frequency * days if kind in ('tablet', 'capsule') else 1,
+                    schedule=schedule, food_instruction=food,
+                ))
+            for name, kind in rng.sample(TESTS, rng.choice(TESTS_PER_PRESCRIPTION)):
+                completed = prescription.status == 'completed' and rng.random() < 0.7
+                tests.append(dict(
+                    clinic_id=clinic.pk, prescription_id=prescription.pk, test_type=kind, test_name=name,
+                    test_date=prescription.prescription_date.date(), is_completed=completed,
+                    result='Within normal limits' if completed else '',
+                ))
+            if rng.random() < 0.9:
+                vitals.append(dict(
+                    clinic_id=clinic.pk, prescription_id=prescription.pk,
+                    bp=f"{rng.randint(100, 160)}/{rng.randint(60, 100)}", pulse=str(rng.randint(60, 110)),
+                    temp=f"{rng.uniform(97, 102.5):.1f}", spo2=str(rng.randint(92, 100)),
+                    sugar=str(rng.randint(70, 260)) if rng.random() < 0.3 else None,
+                ))
+            if rng.random() < 0.8:
+                diagnosis = rng.choice(DIAGNOSES)
+                notes.append(dict(
+                    clinic_id=clinic.pk, prescription_id=prescription.pk, observations=f"Complaints of {visit['purpose'].lower()}",
+                    diagnosis=diagnosis, treatment_plan=f"Treat {diagnosis.lower()}; review if not better",
+                    checkin_purpose=visit['purpose'],
+                ))
+        for model, rows in ((Medicine, medicines), (Test, tests), (Vitals, vitals), (DoctorNotes, notes)):
+            self._insert_rows(model, rows)
+        if prescriptions:
+            recount_prescriptions(Prescription.objects.all_clinics().filter(
+                clinic=clinic, pk__range=(prescriptions[0].pk, prescriptions[-1].pk),
+            ))
+
+    def _generate_admissions(self, clinic, patients, histories, doctors):
+        rng = self.rng
+        admissions = []
+        for patient, visit_times in zip(patients, histories):
+            if rng.random() >= ADMISSION_RATE:
+                continue
+            admitted = visit_times[-1] + timedelta(hours=rng.randint(1, 6))
+            stay = timedelta(days=rng.randint(1, 10))
+            discharged = admitted + stay if admitted + stay < self.now else None
+            admission_type = rng.choice(PatientAdmission.ADMISSION_TYPES)[0]
+            admissions.append(PatientAdmission(
+                clinic=clinic, patient=patient, doctor=rng.choice(doctors), admission_date=admitted,
+                admission_type=admission_type,
+                bed_number=f"{'ICU' if admission_type == 'icu' else 'W'}-{rng.randint(1, 40)}",
+                reason_for_admission=rng.choice(DIAGNOSES),
+                status='discharged' if discharged else rng.choice(['admitted', 'in_treatment', 'improving', 'stable']),
+                discharge_date=discharged,
+            ))
+        self._bulk_create(PatientAdmission, admissions)
+        self.result.add(PatientAdmission, len(admissions))
+
+        logs = []
+        for admission in admissions:
+            end = admission.discharge_date or self.now
+            span = max((end - admission.admission_date).total_seconds(), 60)
+            for _ in range(rng.randint(*TREATMENTS_PER_ADMISSION)):
+                kind, name, route = rng.choice(TREATMENTS)
+                logs.append(dict(
+                    clinic_id=clinic.pk, admission_id=admission.pk, administered_by_id=admission.doctor.user_id,
+                    treatment_type=kind, treatment_name=name, route=route,
+                    administered_date=admission.admission_date + timedelta(seconds=rng.uniform(0, span)),
+                ))
+        self._insert_rows(TreatmentLog, logs)
+
+    # ---------- helpers ----------
+
+    def _bulk_create(self, model, objs):
+        """bulk_create ``objs``, keeping the dates set on them (see _stamp)"""
+        fields = _stamped_fields(model)
+        dates = [[getattr(obj, field.attname) for field in fields] for obj in objs]
+        model.objects.bulk_create(objs, batch_size=BULK_BATCH)
+        for obj, values in zip(objs, dates):
+            for field, value in zip(fields, values):
+                setattr(obj, field.attname, value)
+        self._stamp(model, objs)
+        return objs
+
+    def _stamp(self, model, objs):
+        """
+        Write the auto_now/auto_now_add fields of saved ``objs``: the value
+        set on the instance, or ``self.now`` where there is none.
+        """
+        fields = _stamped_fields(model)
+        if not fields or not objs:
+            return
+        for obj in objs:
+            for field in fields:
+                if getattr(obj, field.attname) is None:
+                    now = self.now if isinstance(field, models.DateTimeField) else self.now.date()
+                    setattr(obj, field.attname, now)
+        model.objects.bulk_update(objs, [field.name for field in fields], batch_size=BULK_BATCH)
+
+    def _insert_rows(self, model, rows):
+        """
+        INSERT plain dicts of field attnames with executemany.
+
+        Used for the leaf tables (nothing points at them, so their PKs are
+        not needed): building a model instance per row is most of the cost
+        of bulk_create. Missing fields get their model default.
+        """
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        defaults = {}
+        for field in fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                defaults[field.attname] = self.now
+            else:
+                defaults[field.attname] = field.get_default()
+        # Only dates/times need the backend's conversion; the rest binds as is
+        converted = [
+            field for field in fields
+            if field.get_internal_type() in ('DateField', 'DateTimeField', 'TimeField', 'DecimalField')
+        ]
+
+        connection = connections[router.db_for_write(model)]
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})"
+
+        params = []
+        for row in rows:
+            values = {**defaults, **row}
+            for field in converted:
+                values[field.attname] = field.get_db_prep_save(values[field.attname], connection)
+            params.append([values[field.attname] for field in fields])
+        with connection.cursor() as cursor:
+            for start in range(0, len(params), INSERT_CHUNK):
+                cursor.executemany(sql, params[start:start + INSERT_CHUNK])
+        self.result.add(model, len(rows))
+
+    def _moment(self):
+        """A random time during clinic hours within the last ``days`` days (not in the future)"""
+        rng = self.rng
+        day = self.now - timedelta(days=rng.randrange(self.days))
+        moment = day.replace(hour=OPENING_HOUR, minute=0, second=0, microsecond=0) + timedelta(
+            seconds=rng.randrange((CLOSING_HOUR - OPENING_HOUR) * 3600)
+        )
+        return moment if moment <= self.now else moment - timedelta(days=1)
+
+    def _phone(self):
+        return f"9{self.rng.randint(100000000, 999999999)}"
@@ -0,0 +1,263 @@
+"""
+Database-per-tenant option for large clinics.
+
+By default every clinic shares the 'default' database, separated by the
+`clinic` FK. A clinic listed in settings.TENANT_DATABASES (slug -> alias,
+filled from DB_CLINIC_DATABASES) instead keeps all of its clinic-scoped
+rows - patients, visits, prescriptions, master data, ... - in its own
+database, so one busy hospital does not slow every other clinic down.
+
+- TenantRouter sends the queries of a request to the database of the
+  clinic TenantMiddleware resolved (the thread-local in hospital.managers).
+  Code outside a request (commands, background threads) wraps its work in
+  clinic_context(clinic) to get the same routing.
+- Clinic and User rows stay in 'default' (logins and sessions do not know
+  the clinic yet). A tenant database holds copies of its clinic's row and
+  users so its foreign keys resolve; hospital.signals keeps them current.
+- `manage.py move_clinic_database` copies a clinic's rows from one alias
+  to another (and optionally deletes the source rows). Add the clinic to
+  DB_CLINIC_DATABASES and restart after the copy.
+"""
+
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .managers import get_current_clinic, set_current_clinic
+from .search import FTS_TABLE
+
+# Shared by every clinic; always read and written in 'default'
+GLOBAL_MODELS = frozenset(['clinic', 'user'])
+
+
+class TenantCopyError(Exception):
+    """The clinic cannot be copied to the target database as it stands"""
+
+
+def tenant_databases():
+    return getattr(settings, 'TENANT_DATABASES', {})
+
+
+def tenant_database(clinic):
+    """The alias holding ``clinic``'s rows, or None for the shared database"""
+    if clinic is None:
+        return None
+    return tenant_databases().get(clinic.slug)
+
+
+def clinic_database(clinic):
+    """The alias holding ``clinic``'s rows"""
+    return tenant_database(clinic) or DEFAULT_DB_ALIAS
+
+
+def tenant_database_for_id(clinic_id):
+    if not clinic_id or not tenant_databases():
+        return None
+    Clinic = apps.get_model('hospital', 'Clinic')
+    slug = Clinic.objects.filter(pk=clinic_id).values_list('slug', flat=True).first()
+    return tenant_databases().get(slug)
+
+
+@contextmanager
+def clinic_context(clinic):
+    """Route the queries in the block as a request for ``clinic`` would be"""
+    previous = get_current_clinic()
+    set_current_clinic(clinic)
+    try:
+        yield
+    finally:
+        set_current_clinic(previous)
+
+
+def is_tenant_model(model):
+    return model._meta.app_label == 'hospital' and model._meta.model_name not in GLOBAL_MODELS
+
+
+# ==================== ROUTER ====================
+
+class TenantRouter:
+    """Clinic-scoped models live in the current clinic's database, if it has one"""
+
+    def _db(self, model, hints):
+        if not tenant_databases() or not is_tenant_model(model):
+            return None
+        # Related lookups stay in the database the parent row came from
+        instance = hints.get('instance')
+        # __class__, not type(): the instance may be a lazy request.user
+        if instance is not None and instance._state.db and is_tenant_model(instance.__class__):
+            return instance._state.db
+        return tenant_database(get_current_clinic())
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints)
+
+
+# ==================== GLOBAL ROW COPIES ====================
+
+def _field_values(instance):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields
+            if not field.primary_key}
+
+
+def replicate_global_row(instance, alias):
+    """Create or update the tenant database's copy of a Clinic or User row"""
+    model = type(instance)
+    # Not update_or_create: save() would restamp the auto_now fields of the copy
+    if not model._base_manager.using(alias).filter(pk=instance.pk).update(**_field_values(instance)):
+        _insert(model, [[getattr(instance, field.attname) for field in model._meta.concrete_fields]], alias)
+
+
+def forget_global_row(instance, alias):
+    type(instance)._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+# ==================== MOVING A CLINIC ====================
+
+def _tenant_models():
+    return [model for model in apps.get_app_config('hospital').get_models() if is_tenant_model(model)]
+
+
+def _clinic_rows(model, clinic, alias):
+    """``clinic``'s rows of ``model`` in ``alias``"""
+    qs = model._base_manager.using(alias)
+    if any(field.name == 'clinic' for field in model._meta.concrete_fields):
+        return qs.filter(clinic=clinic)
+    # Child rows without their own clinic FK (template lines): through the parent
+    for field in model._meta.concrete_fields:
+        if field.is_relation and is_tenant_model(field.related_model):
+            return qs.filter(**{f'{field.name}__clinic': clinic})
+    raise TenantCopyError(f"Cannot tell which {model.__name__} rows belong to a clinic")
+
+
+def _insert(model, rows, target):
+    """Insert raw rows (pk included) without save(), signals or auto_now"""
+    connection = connections[target]
+    fields = model._meta.concrete_fields
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    sql = f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})"
+    params = [
+        [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+        for row in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _copy_global_rows(model, pks, source, target, batch_size=2000):
+    """Copy the rows of ``pks`` the target does not have yet (a clinic moving back has them)"""
+    pks = sorted(pks)
+    attnames = [field.attname for field in model._meta.concrete_fields]
+    copied = 0
+    for start in range(0, len(pks), batch_size):
+        chunk = set(pks[start:start + batch_size])
+        chunk -= set(model._base_manager.using(target).filter(pk__in=chunk).values_list('pk', flat=True))
+        if chunk:
+            _insert(model, model._base_manager.using(source).filter(pk__in=chunk).values_list(*attnames), target)
+            copied += len(chunk)
+    return copied
+
+
+def copy_clinic(clinic, source, target, batch_size=2000, progress=None):
+    """
+    Copy every clinic-scoped row of ``clinic`` from ``source`` to ``target``
+    (both database aliases, target already migrated), keeping primary keys.
+    Returns {model name: rows copied}. Raises TenantCopyError, copying
+    nothing, if the target already holds one of the rows.
+    """
+    if source == target:
+        raise TenantCopyError("Source and target are the same database")
+    User = apps.get_model('hospital', 'User')
+    Clinic = apps.get_model('hospital', 'Clinic')
+    models = _tenant_models()
+    counts = {}
+
+    with transaction.atomic(using=target):
+        # Foreign keys are checked at commit, so the order of the tables does not matter
+        counts['Clinic'] = _copy_global_rows(Clinic, [clinic.pk], source, target)
+
+        # The clinic's staff and patient logins, plus anyone its rows point at
+        user_ids = set(User._base_manager.using(source).filter(clinic=clinic).values_list('pk', flat=True))
+        for model in models:
+            for field in model._meta.concrete_fields:
+                if field.is_relation and field.related_model is User:
+                    user_ids.update(
+                        _clinic_rows(model, clinic, source).exclude(**{field.attname: None})
+                        .values_list(field.attname, flat=True).distinct()
+                    )
+        counts['User'] = _copy_global_rows(User, user_ids, source, target, batch_size)
+
+        for model in models:
+            attnames = [field.attname for field in model._meta.concrete_fields]
+            rows = _clinic_rows(model, clinic, source).order_by('pk').values_list(*attnames)
+            copied = 0
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    copied += _copy_batch(model, batch, target)
+                    batch = []
+            if batch:
+                copied += _copy_batch(model, batch, target)
+            counts[model.__name__] = copied
+            if progress:
+                progress(model.__name__, copied)
+
+        counts['patient name index'] = _copy_fts_rows(clinic, source, target)
+
+        # Explicit primary keys leave PostgreSQL sequences behind
+        target_connection = connections[target]
+        with target_connection.cursor() as cursor:
+            for sql in target_connection.ops.sequence_reset_sql(no_style(), [Clinic, User, *models]):
+                cursor.execute(sql)
+
+    return counts
+
+
+def _copy_batch(model, batch, target):
+    pk_index = [field.primary_key for field in model._meta.concrete_fields].index(True)
+    pks = [row[pk_index] for row in batch]
+    clash = model._base_manager.using(target).filter(pk__in=pks).values_list('pk', flat=True).first()
+    if clash is not None:
+        raise TenantCopyError(f"{model.__name__} #{clash} already exists in the target database")
+    _insert(model, batch, target)
+    return len(batch)
+
+
+def _has_fts_table(alias):
+    connection = connections[alias]
+    return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+
+def _copy_fts_rows(clinic, source, target):
+    """The SQLite FTS5 patient name table (hospital.search) has no model"""
+    if not (_has_fts_table(source) and _has_fts_table(target)):
+        return 0
+    with connections[source].cursor() as cursor:
+        cursor.execute(f'SELECT rowid, name, clinic_id FROM {FTS_TABLE} WHERE clinic_id = %s', [clinic.pk])
+        rows = cursor.fetchall()
+    with connections[target].cursor() as cursor:
+        cursor.executemany(f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, clinic_id) VALUES (%s, %s, %s)', rows)
+    return len(rows)
+
+
+def delete_clinic_rows(clinic, alias):
+    """Delete ``clinic``'s clinic-scoped rows from ``alias`` (not its Clinic or User rows)"""
+    with transaction.atomic(using=alias):
+        for model in reversed(_tenant_models()):
+            # No cascades or signals: every dependent table is in the list
+            _clinic_rows(model, clinic, alias)._raw_delete(alias)
+        if _has_fts_table(alias):
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE clinic_id = %s', [clinic.pk])
+
+
+def clinic_row_counts(clinic, alias):
+    return {model.__name__: _clinic_rows(model, clinic, alias).count() for model in _tenant_models()}
+
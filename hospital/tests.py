@@ -1,3 +1,1347 @@
-from django.test import TestCase
+import contextlib
+import io
+import json
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import openpyxl
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import (
+    LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from pypdf import PdfReader
+from reportlab.platypus.doctemplate import LayoutError
+
+from . import db_routers, prescription_export, sqlite_production
+from .benchmarks import SCENARIO_NAMES, BenchmarkError, compare_to_baseline, run_benchmarks
+from .clinic_cache import clear_clinic_cache, clinic_cache_stats, get_clinic_by_slug, reset_clinic_cache_stats
+from .importers import PatientImporter, PatientImportError, read_rows
+from .loadtest import ClinicDay, LoadStats, Response as LoadResponse, run_load_test
+from .master_catalog import SNAPSHOT_MAX_AGE, catalog_version
+from .medicine_index import clear_medicine_indexes, get_medicine_index, loaded_medicine_index, search_medicines
+from .metrics import reset_request_metrics
+from .models import (
+    Clinic, Doctor, DoctorNotes, MasterMedicine, MasterTest, Medicine, Patient, PatientIdSequence, PatientLoginJob,
+    PatientVisit, Prescription, Test, User, VisitDailyStats, Vitals,
+)
+from .pagination import InvalidCursor, KeysetPaginator, encode_cursor
+from .prescription_export import export_filename, prescriptions_for_export, stream_merged_pdf, stream_zip
+from .prescription_pdf import (
+    PAGE_SIZES, build_prescription_context, get_prescription_pdf, prescription_queryset, render_prescription_pdf,
+)
+from .provisioning import (
+    MAX_ATTEMPTS, RETRY_DELAYS, STALE_AFTER, enqueue_missing_logins, enqueue_patient_login, login_username, process_jobs,
+)
+from .rollups import rebuild_visit_daily_stats
+from .search import (
+    PostgresTrigramSearchBackend, SQLiteFTS5SearchBackend, get_search_backend, reset_search_backend, search_patients,
+)
+from .sqlite_production import DJANGO_DEFAULT_OPTIONS, SerializedWritesMiddleware, benchmark_sqlite
+from .synthetic import SyntheticDataGenerator
+from .tenant_databases import (
+    TenantCopyError, TenantRouter, clinic_context, clinic_row_counts, copy_clinic, delete_clinic_rows,
+)
+from .views import get_same_day_prescriptions
+
+# Clinic the tenant database tests keep in a database of its own; CI runs
+# them with DB_CLINIC_DATABASES=tenant-test=<name>
+TENANT_SLUG = 'tenant-test'
+
+
+def seed_clinic(slug, patients=6):
+    """
+    A clinic with a receptionist, two doctors, master data and ``patients``
+    patients who all checked in today. The first two got a prescription
+    from the first doctor today, every patient has an older completed one;
+    each prescription has two medicines, two tests, vitals and notes. Every
+    list the dashboards show has several rows, so a per-row query shows up
+    as a budget failure.
+    """
+    clinic = Clinic.objects.create(
+        name=f"Clinic {slug}", slug=slug, address="1 Main Road", city="Pune", state="Maharashtra",
+        zip_code="411001", phone_number="9000000000", email=f"{slug}@example.com",
+        registration_number=f"{slug.upper()}-REG",
+    )
+    # Clinic and users stay in 'default'; the rest goes where the clinic's requests would put it
+    with clinic_context(clinic):
+        receptionist, doctors = seed_clinic_rows(clinic, patients)
+    return clinic, receptionist, doctors
+
+
+def seed_clinic_rows(clinic, patients):
+    slug = clinic.slug
+    receptionist = User.objects.create_user(f"{slug}-reception", password='pw', clinic=clinic, role='receptionist')
+    doctors = [
+        Doctor.objects.create(
+            clinic=clinic, specialization='General Physician', license_number=f"MH-{number}",
+            user=User.objects.create_user(f"{slug}-dr{number}", password='pw', clinic=clinic, role='doctor'),
+        )
+        for number in (1, 2)
+    ]
+    for name, kind in [('Paracetamol', 'tablet'), ('Pantoprazole', 'tablet'), ('Paracip Syrup', 'syrup')]:
+        MasterMedicine.objects.create(clinic=clinic, medicine_name=name, medicine_type=kind, default_dosage='1')
+    for name, kind in [('Complete Blood Count', 'blood'), ('Urine Routine', 'urine'), ('Chest X-Ray', 'xray')]:
+        MasterTest.objects.create(clinic=clinic, test_name=name, test_type=kind)
+
+    last_week = timezone.now() - timedelta(days=7)
+    for number in range(patients):
+        patient = Patient.objects.create(
+            clinic=clinic, patient_name=f"Ramesh Patil{number}", age=30 + number, gender='male',
+            address="Pune", phone_number=f"98765{number:05d}", registered_by=receptionist,
+        )
+        PatientVisit.objects.create(clinic=clinic, patient=patient, checked_in_by=receptionist, purpose='Fever')
+        old = add_prescription(clinic, patient, doctors[number % 2], status='completed')
+        Prescription.objects.filter(pk=old.pk).update(prescription_date=last_week)
+        if number < 2:
+            add_prescription(clinic, patient, doctors[0])
+    return receptionist, doctors
+
+
+def add_prescription(clinic, patient, doctor, status='pending'):
+    prescription = Prescription.objects.create(clinic=clinic, patient=patient, doctor=doctor, status=status)
+    for name in ('Paracetamol', 'Pantoprazole'):
+        Medicine.objects.create(
+            clinic=clinic, prescription=prescription, medicine_name=name, dosage='500mg',
+            frequency_per_day=2, duration='5 days', medicine_type='tablet', qty=10,
+        )
+    for name in ('Complete Blood Count', 'Urine Routine'):
+        Test.objects.create(clinic=clinic, prescription=prescription, test_type='blood', test_name=name)
+    Vitals.objects.create(clinic=clinic, prescription=prescription, bp='120/80', pulse='72')
+    DoctorNotes.objects.create(
+        clinic=clinic, prescription=prescription, observations='Fever', diagnosis='Viral fever',
+        treatment_plan='Rest',
+    )
+    return prescription
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, QUERY_BUDGETS={})
+class QueryBudgetTests(TestCase):
+    """Every budgeted view stays within its @query_budget on a clinic with data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, cls.doctors = seed_clinic('budget')
+        # Another clinic's rows must not leak into the counts or the lists
+        seed_clinic('other', patients=2)
+        cls.prescription = Prescription.objects.filter(doctor=cls.doctors[0], status='pending').first()
+
+    def setUp(self):
+        clear_medicine_indexes()
+        reset_request_metrics()
+
+    def url(self, name, **kwargs):
+        return reverse(name, kwargs={'clinic_slug': self.clinic.slug, **kwargs})
+
+    def request(self, user, name, method='get', data=None, **kwargs):
+        """Request the view as ``user``; QueryBudgetExceeded fails the test"""
+        self.client.force_login(user)
+        # Views still print debug output
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = getattr(self.client, method)(self.url(name, **kwargs), data or {})
+        self.assertEqual(response.status_code, 200, f"{name} returned {response.status_code}")
+        return response
+
+    def test_reception_dashboard(self):
+        response = self.request(self.receptionist, 'reception_dashboard')
+        self.assertEqual(len(response.context['patients']), 6)
+
+    def test_patient_search(self):
+        response = self.request(self.receptionist, 'patient_search', data={'q': 'ramesh'})
+        self.assertEqual(len(response.json()['results']), 6)
+
+    def test_checkin_dashboard(self):
+        response = self.request(self.receptionist, 'checkin_dashboard', data={'period': 'today'})
+        self.assertContains(response, 'Ramesh Patil5')
+
+    def test_doctor_dashboard(self):
+        response = self.request(self.doctors[0].user, 'doctor_dashboard')
+        # Which patients count as seen "today" depends on the time of day (UTC vs local date)
+        self.assertGreater(len(response.context['patients']), 1)
+        self.assertGreater(len(response.context['prescriptions']), 1)
+
+    def test_doctor_dashboard_patients_ajax(self):
+        response = self.request(self.doctors[0].user, 'doctor_dashboard_patients_ajax')
+        self.assertContains(response, 'Ramesh Patil5')
+
+    def test_doctor_dashboard_prescriptions_ajax(self):
+        response = self.request(self.doctors[0].user, 'doctor_dashboard_prescriptions_ajax')
+        prescriptions = response.json()['prescriptions']
+        self.assertEqual(len(prescriptions), 5)
+        self.assertTrue(all(rx['medicines_count'] == 2 and rx['tests_count'] == 2 for rx in prescriptions))
+
+    def test_add_prescription_details(self):
+        response = self.request(
+            self.doctors[0].user, 'add_prescription_details', prescription_id=self.prescription.pk,
+        )
+        self.assertEqual(len(response.context['medicines']), 2)
+        self.assertEqual(len(response.context['tests']), 2)
+
+    def test_add_prescription_details_actions(self):
+        actions = {
+            'add_medicine': {
+                'medicine_type': 'tablet', 'medicine_name': 'Paracetamol', 'dosage': '500mg',
+                'frequency_per_day': 2, 'duration': '5 days', 'schedule': 'morning_night', 'qty': 10,
+                'food_instruction': 'after', 'instructions': '',
+            },
+            'add_test': {'test_type': 'blood', 'test_name': 'HbA1c', 'description': ''},
+            'save_vitals': {'bp': '130/85', 'pulse': '80', 'temp': '98.6', 'spo2': '98', 'sugar': ''},
+            'save_notes': {
+                'checkin_purpose': 'Fever', 'observations': 'Better', 'diagnosis': 'Viral fever',
+                'treatment_plan': 'Rest', 'notes': '',
+            },
+        }
+        for action, data in actions.items():
+            with self.subTest(action=action):
+                response = self.request(
+                    self.doctors[0].user, 'add_prescription_details', 'post',
+                    {'action': action, **data}, prescription_id=self.prescription.pk,
+                )
+                self.assertTrue(response.json()['success'], response.content)
+        self.prescription.refresh_from_db()
+        self.assertEqual((self.prescription.medicines_count, self.prescription.tests_count), (3, 3))
+
+    def test_api_master_medicines(self):
+        response = self.request(self.doctors[0].user, 'api_master_medicines', data={'q': 'pa'})
+        self.assertEqual(len(response.json()), 3)
+
+    def test_api_master_tests(self):
+        response = self.request(self.doctors[0].user, 'api_master_tests')
+        self.assertEqual(len(response.json()), 3)
+
+    def test_api_master_catalog(self):
+        response = self.request(self.doctors[0].user, 'api_master_catalog')
+        self.assertEqual(len(response.json()['medicines']), 3)
+        self.assertEqual(len(response.json()['tests']), 3)
+
+
+class DatabaseEngineTests(TestCase):
+    """
+    Behaviour that must hold on SQLite and PostgreSQL alike (DB_ENGINE; CI
+    runs the suite on both). Engine-specific pieces are checked through
+    connection.vendor rather than assumed.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, cls.doctors = seed_clinic('engine', patients=4)
+        cls.other_clinic = seed_clinic('elsewhere', patients=2)[0]
+        cls.sunita = Patient.objects.create(
+            clinic=cls.clinic, patient_name="Sunita Deshmukh", age=41, gender='female',
+            address="Pune", phone_number="+91 91234-56789", registered_by=cls.receptionist,
+        )
+
+    def setUp(self):
+        reset_search_backend()
+        self.addCleanup(reset_search_backend)
+
+    def names(self, query, clinic=None):
+        return [p.patient_name for p in search_patients(clinic or self.clinic, query)]
+
+    def test_auto_backend_matches_engine(self):
+        expected = {
+            'sqlite': SQLiteFTS5SearchBackend,
+            'postgresql': PostgresTrigramSearchBackend,
+        }[connection.vendor]
+        self.assertIs(type(get_search_backend()), expected)
+
+    def test_name_terms_are_anded(self):
+        self.assertEqual(self.names('ramesh patil2'), ['Ramesh Patil2'])
+        self.assertEqual(self.names('sunita patil'), [])
+
+    def test_name_prefix_ignores_case_and_accents(self):
+        self.assertEqual(self.names('SUNÍ desh'), ['Sunita Deshmukh'])
+
+    def test_exact_word_ranks_first(self):
+        self.assertEqual(self.names('patil1')[0], 'Ramesh Patil1')
+
+    def test_substring_fills_short_results(self):
+        # "eshmu" is no word prefix; FTS5 or pg_trgm/icontains finds it
+        self.assertEqual(self.names('eshmu'), ['Sunita Deshmukh'])
+
+    def test_phone_suffix_and_patient_id(self):
+        self.assertEqual(self.names('56789'), ['Sunita Deshmukh'])
+        self.assertEqual(self.names(self.sunita.patient_id), ['Sunita Deshmukh'])
+
+    def test_search_stays_in_clinic(self):
+        self.assertEqual(len(self.names('ramesh')), 4)
+        self.assertEqual(len(self.names('ramesh', self.other_clinic)), 2)
+        self.assertEqual(self.names('sunita', self.other_clinic), [])
+
+    def test_prescription_counts_are_maintained(self):
+        prescription = Prescription.objects.filter(clinic=self.clinic, status='pending').first()
+        self.assertEqual((prescription.medicines_count, prescription.tests_count), (2, 2))
+        prescription.medicines.first().delete()
+        prescription.refresh_from_db()
+        self.assertEqual((prescription.medicines_count, prescription.tests_count), (1, 2))
+
+    def test_postgresql_indexes(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("migration 0060 only creates indexes on PostgreSQL")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename LIKE 'hospital_%%'")
+            indexes = {row[0] for row in cursor.fetchall()}
+        self.assertLessEqual(
+            {'hospital_patientvisit_checkin_brin', 'hospital_treatmentlog_administered_brin'}, indexes,
+        )
+
+
+class AuthenticationBackendTests(TestCase):
+    """Logins go through ClinicUserBackend; sessions from plain ModelBackend still work"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, cls.doctors = seed_clinic('auth', patients=1)
+
+    def dashboard(self):
+        url = reverse('reception_dashboard', kwargs={'clinic_slug': self.clinic.slug})
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.get(url)
+
+    def test_new_login_uses_clinic_backend(self):
+        self.client.post(reverse('login'), {'username': self.receptionist.username, 'password': 'pw'})
+        self.assertEqual(
+            self.client.session[BACKEND_SESSION_KEY], 'hospital.auth_backends.ClinicUserBackend',
+        )
+        self.assertEqual(self.dashboard().status_code, 200)
+
+    def test_model_backend_session_survives(self):
+        # Logged in before ClinicUserBackend was introduced
+        self.client.force_login(self.receptionist, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.dashboard().status_code, 200)
+
+
+class LiveQueueTests(TestCase):
+    """The dashboards only open the event stream where it does not tie up a WSGI worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, cls.doctors = seed_clinic('live', patients=1)
+
+    def setUp(self):
+        self.stream_url = reverse('checkin_queue_stream', kwargs={'clinic_slug': self.clinic.slug})
+        self.dashboards = [
+            (self.doctors[0].user, reverse('doctor_dashboard', kwargs={'clinic_slug': self.clinic.slug})),
+            (self.receptionist, reverse('checkin_dashboard', kwargs={'clinic_slug': self.clinic.slug})),
+        ]
+
+    def get(self, user, url):
+        self.client.force_login(user)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.get(url)
+
+    def test_wsgi_keeps_reloading(self):
+        for user, url in self.dashboards:
+            with self.subTest(url=url):
+                self.assertNotContains(self.get(user, url), self.stream_url)
+        self.assertEqual(self.get(self.receptionist, self.stream_url).status_code, 404)
+
+    @override_settings(LIVE_QUEUE_ENABLED=True)
+    def test_setting_forces_stream(self):
+        for user, url in self.dashboards:
+            with self.subTest(url=url):
+                self.assertContains(self.get(user, url), self.stream_url)
+
+    async def test_asgi_opens_stream(self):
+        for user, url in self.dashboards:
+            with self.subTest(url=url):
+                await self.async_client.aforce_login(user)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    response = await self.async_client.get(url)
+                self.assertContains(response, self.stream_url)
+
+
+@override_settings(PRESCRIPTION_PDF_CACHE='default')
+class PrescriptionPdfTests(TestCase):
+    """Server-rendered prescription PDFs and their content-hash cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, cls.doctors = seed_clinic('pdf', patients=1)
+        cls.prescription = Prescription.objects.filter(clinic=cls.clinic, status='pending').first()
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def make_long(self):
+        for number in range(30):
+            Test.objects.create(
+                clinic=self.clinic, prescription=self.prescription, test_type='blood', test_name=f"Test {number}",
+            )
+        DoctorNotes.objects.filter(prescription=self.prescription).update(
+            observations="Fever with chills and body ache since three days. " * 60,
+        )
+
+    def render(self, size):
+        prescription = prescription_queryset().get(pk=self.prescription.pk)
+        return render_prescription_pdf(build_prescription_context(prescription), size)
+
+    def test_long_left_column_continues_on_later_pages(self):
+        self.make_long()
+        for size in PAGE_SIZES:
+            with self.subTest(size=size):
+                pdf = self.render(size)
+                self.assertTrue(pdf.startswith(b'%PDF'))
+                self.assertGreater(len(re.findall(rb'/Type /Page\b(?!s)', pdf)), 1)
+
+    def test_download_long_prescription(self):
+        self.make_long()
+        self.client.force_login(self.doctors[0].user)
+        url = reverse('download_prescription', kwargs={
+            'clinic_slug': self.clinic.slug, 'prescription_id': self.prescription.pk,
+        })
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.get(url, {'size': 'a5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_cache_serves_repeats_and_drops_changed_prescriptions(self):
+        with mock.patch('hospital.prescription_pdf.render_prescription_pdf', return_value=b'%PDF-') as render:
+            first = get_prescription_pdf(self.prescription)
+            self.assertEqual(get_prescription_pdf(self.prescription), first)
+            self.assertEqual(render.call_count, 1)
+
+            Test.objects.create(
+                clinic=self.clinic, prescription=self.prescription, test_type='blood', test_name='Lipid Profile',
+            )
+            changed = get_prescription_pdf(self.prescription)
+            self.assertNotEqual(changed[1], first[1])
+            self.assertEqual(render.call_count, 2)
+
+    def test_clinic_changes_drop_every_prescription(self):
+        with mock.patch('hospital.prescription_pdf.render_prescription_pdf', return_value=b'%PDF-') as render:
+            get_prescription_pdf(self.prescription)
+            self.clinic.address = "2 Station Road"
+            self.clinic.save()
+            get_prescription_pdf(self.prescription)
+            self.assertEqual(render.call_count, 2)
+
+
+@override_settings(PRESCRIPTION_EXPORT_WORKERS=0, PRESCRIPTION_PDF_CACHE='default')
+class PrescriptionExportTests(TestCase):
+    """ZIP and merged-PDF exports; rendered in process (pool workers would not see the test database)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, cls.doctors = seed_clinic('export', patients=3)
+        cls.admin = User.objects.create_user('export-admin', password='pw', clinic=cls.clinic, role='admin')
+        seed_clinic('export-other', patients=1)
+        cls.today = timezone.localdate()
+        cls.last_week = timezone.localtime(timezone.now() - timedelta(days=7)).date()
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def items(self, date_from=None, date_to=None, doctor=None):
+        return list(prescriptions_for_export(
+            self.clinic, date_from or self.last_week, date_to or self.today, doctor=doctor,
+        ))
+
+    def test_date_range_and_doctor_filters(self):
+        self.assertEqual(len(self.items()), 5)
+        self.assertEqual(len(self.items(date_to=self.last_week)), 3)
+        self.assertEqual(len(self.items(date_from=self.today)), 2)
+        self.assertEqual(len(self.items(doctor=self.doctors[1])), 1)
+        dates = [item['prescription_date'] for item in self.items()]
+        self.assertEqual(dates, sorted(dates))
+
+    def test_zip_has_one_pdf_per_prescription(self):
+        items = self.items()
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_zip(items))))
+        self.assertEqual(archive.namelist(), [export_filename(item) for item in items])
+        self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in archive.namelist()))
+
+    def test_merged_pdf_concatenates_in_order(self):
+        items = self.items()
+        merged = PdfReader(io.BytesIO(b''.join(stream_merged_pdf(items))))
+        self.assertEqual(len(merged.pages), len(items))
+        for page, item in zip(merged.pages, items):
+            self.assertIn(item['patient__patient_id'], page.extract_text())
+        # The letterhead image is written once and shared by every page
+        images = {
+            page['/Resources']['/XObject'].raw_get(name).idnum
+            for page in merged.pages for name in page['/Resources']['/XObject']
+        }
+        self.assertEqual(len(images), 1)
+
+    def test_failed_render_is_reported_not_fatal(self):
+        items = self.items()
+        broken = items[1]
+
+        def render(clinic_id, prescription_id, size):
+            if prescription_id == broken['id']:
+                raise LayoutError("Flowable too large")
+            return original(clinic_id, prescription_id, size)
+
+        original = prescription_export.render
+        with mock.patch('hospital.prescription_export.render', render), self.assertLogs('hospital.prescription_export'):
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_zip(items))))
+            merged = PdfReader(io.BytesIO(b''.join(stream_merged_pdf(items))))
+        self.assertNotIn(export_filename(broken), archive.namelist())
+        self.assertEqual(len(archive.namelist()), len(items))
+        self.assertIn(export_filename(broken), archive.read('errors.txt').decode())
+        self.assertEqual(len(merged.pages), len(items))
+        self.assertIn(export_filename(broken), merged.pages[-1].extract_text())
+
+    def test_view_streams_both_formats(self):
+        self.client.force_login(self.admin)
+        url = reverse('export_prescriptions', kwargs={'clinic_slug': self.clinic.slug})
+        data = {'date_from': self.today.isoformat(), 'date_to': self.today.isoformat(), 'doctor': '', 'size': 'A5'}
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.post(url, {**data, 'format': 'zip'})
+            self.assertEqual(len(zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))).namelist()), 2)
+            response = self.client.post(url, {**data, 'format': 'pdf'})
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertEqual(len(PdfReader(io.BytesIO(b''.join(response.streaming_content))).pages), 2)
+
+
+@override_settings(TENANT_DATABASES={'tenant-a': 'clinic_tenant-a'})
+class TenantRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = TenantRouter()
+
+    def test_routes_clinic_rows_to_the_current_clinics_database(self):
+        self.assertIsNone(self.router.db_for_read(Patient))
+        with clinic_context(Clinic(slug='tenant-a')):
+            self.assertEqual(self.router.db_for_read(Patient), 'clinic_tenant-a')
+            self.assertEqual(self.router.db_for_write(Prescription), 'clinic_tenant-a')
+            # Logins and the clinic itself stay shared
+            self.assertIsNone(self.router.db_for_read(User))
+            self.assertIsNone(self.router.db_for_write(Clinic))
+            with clinic_context(Clinic(slug='shared')):
+                self.assertIsNone(self.router.db_for_write(Patient))
+            self.assertEqual(self.router.db_for_write(Patient), 'clinic_tenant-a')
+        self.assertIsNone(self.router.db_for_write(Patient))
+
+    def test_related_rows_follow_their_parent(self):
+        prescription = Prescription()
+        prescription._state.db = 'clinic_tenant-a'
+        self.assertEqual(self.router.db_for_read(Medicine, instance=prescription), 'clinic_tenant-a')
+
+    def test_lazy_user_instance(self):
+        # patient.registered_by = request.user routes with the lazy user as the instance
+        user = User()
+        user._state.db = 'default'
+        with clinic_context(Clinic(slug='tenant-a')):
+            self.assertEqual(
+                self.router.db_for_write(Patient, instance=SimpleLazyObject(lambda: user)), 'clinic_tenant-a',
+            )
+
+
+@skipUnless(TENANT_SLUG in settings.TENANT_DATABASES, f"DB_CLINIC_DATABASES has no '{TENANT_SLUG}' database")
+class TenantDatabaseTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alias = settings.TENANT_DATABASES[TENANT_SLUG]
+        cls.clinic, cls.receptionist, cls.doctors = seed_clinic(TENANT_SLUG, patients=3)
+
+    def test_clinic_rows_live_in_the_clinic_database(self):
+        self.assertEqual(Patient.objects.using(self.alias).filter(clinic=self.clinic).count(), 3)
+        self.assertFalse(Patient.objects.using('default').filter(clinic=self.clinic).exists())
+        self.assertEqual(
+            clinic_row_counts(self.clinic, self.alias)['Prescription'],
+            Prescription.objects.all_clinics().using(self.alias).count(),
+        )
+
+    def test_clinic_and_users_are_copied_and_kept_current(self):
+        copies = User.objects.using(self.alias).filter(clinic=self.clinic)
+        self.assertEqual(copies.count(), 3)
+        self.assertTrue(Clinic.objects.using(self.alias).filter(pk=self.clinic.pk).exists())
+
+        self.receptionist.first_name = 'Sunita'
+        self.receptionist.save()
+        self.assertEqual(copies.get(pk=self.receptionist.pk).first_name, 'Sunita')
+        self.clinic.name = 'Renamed'
+        self.clinic.save()
+        self.assertEqual(Clinic.objects.using(self.alias).get(pk=self.clinic.pk).name, 'Renamed')
+
+    def test_copy_clinic_moves_every_row(self):
+        clinic, _, _ = seed_clinic('tenant-move', patients=2)
+        # A clinic database holds one clinic: empty it so the primary keys do not clash
+        delete_clinic_rows(self.clinic, self.alias)
+        before = clinic_row_counts(clinic, 'default')
+
+        counts = copy_clinic(clinic, 'default', self.alias)
+        self.assertEqual(counts['Patient'], 2)
+        self.assertEqual(clinic_row_counts(clinic, self.alias), before)
+        self.assertTrue(User.objects.using(self.alias).filter(username='tenant-move-dr1').exists())
+        with self.assertRaises(TenantCopyError):
+            copy_clinic(clinic, 'default', self.alias)
+
+        delete_clinic_rows(clinic, self.alias)
+        self.assertFalse(any(clinic_row_counts(clinic, self.alias).values()))
+        self.assertEqual(clinic_row_counts(clinic, 'default'), before)
+
+    def test_superadmin_views_read_the_clinic_database(self):
+        superadmin = User.objects.create_user('platform', password='pw', role='super_admin')
+        self.client.force_login(superadmin)
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.get(reverse('superadmin_clinic_patients', args=[self.clinic.pk]))
+            self.assertEqual(response.context['total_patients'], 3)
+            response = self.client.get(reverse('superadmin_clinic_prescriptions', args=[self.clinic.pk]))
+            self.assertEqual(response.context['total_prescriptions'], 5)
+
+            self.client.post(reverse('delete_clinic', args=[self.clinic.pk]))
+        self.assertFalse(Clinic.objects.filter(pk=self.clinic.pk).exists())
+        self.assertFalse(any(clinic_row_counts(self.clinic, self.alias).values()))
+        self.assertFalse(Clinic.objects.using(self.alias).filter(pk=self.clinic.pk).exists())
+        self.assertFalse(User.objects.using(self.alias).filter(clinic_id=self.clinic.pk).exists())
+
+
+@override_settings(REPLICA_LAG_CHECK_INTERVAL=0, REPLICA_MAX_LAG=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = db_routers.ReplicaRoutingMiddleware(lambda request: HttpResponse())
+        self.view = db_routers.replica_read(lambda request: None)
+        patcher = mock.patch('hospital.db_routers.replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(db_routers._lag.update, checked_at=None, lag=None)
+        db_routers._lag.update(checked_at=None, lag=None)
+
+    def routed(self, request, lag=0.5):
+        """Whether process_view switches ``request`` to the replica"""
+        request.resolver_match = None
+        db_routers._local.use_replica = False
+        with mock.patch('hospital.db_routers.measure_replica_lag', return_value=lag):
+            self.middleware.process_view(request, self.view, (), {})
+        self.addCleanup(setattr, db_routers._local, 'use_replica', False)
+        return db_routers.reads_from_replica()
+
+    def test_replica_reads_skip_logins_and_writes(self):
+        router = db_routers.ReplicaRouter()
+        self.assertTrue(self.routed(self.factory.get('/')))
+        self.assertEqual(router.db_for_read(Patient), db_routers.REPLICA)
+        self.assertIsNone(router.db_for_read(User))
+        self.assertIsNone(router.db_for_write(Patient))
+
+    def test_writers_read_from_the_primary_for_a_while(self):
+        response = self.middleware(self.factory.post('/'))
+        self.assertEqual(response.cookies[db_routers.STICKY_COOKIE]['max-age'], db_routers.DEFAULT_STICKY_SECONDS)
+
+        request = self.factory.get('/')
+        request.COOKIES[db_routers.STICKY_COOKIE] = '1'
+        self.assertFalse(self.routed(request))
+        self.assertTrue(self.routed(self.factory.get('/')))
+        self.assertFalse(self.routed(self.factory.post('/')))
+
+    def test_lagging_or_unreachable_replica_falls_back_to_the_primary(self):
+        self.assertTrue(self.routed(self.factory.get('/'), lag=9))
+        self.assertFalse(self.routed(self.factory.get('/'), lag=11))
+        self.assertFalse(self.routed(self.factory.get('/'), lag=None))
+
+    @override_settings(REPLICA_LAG_CHECK_INTERVAL=60)
+    def test_lag_is_measured_once_per_interval(self):
+        with mock.patch('hospital.db_routers.measure_replica_lag', return_value=30) as measure:
+            self.assertFalse(db_routers.replica_usable())
+            self.assertFalse(db_routers.replica_usable())
+        self.assertEqual(measure.call_count, 1)
+
+
+class PatientSearchViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, _ = seed_clinic('search-view')
+
+    def search(self, **params):
+        self.client.force_login(self.receptionist)
+        url = reverse('patient_search', kwargs={'clinic_slug': self.clinic.slug})
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.get(url, {'q': 'Ramesh', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.search(limit=2)), 2)
+        self.assertEqual(len(self.search(limit=0)), 1)
+        with mock.patch('hospital.views.search_patients', wraps=search_patients) as search:
+            self.assertEqual(len(self.search(limit=1000)), 6)
+        self.assertEqual(search.call_args.args[2], 50)
+
+    def test_bad_limit_uses_the_default(self):
+        with mock.patch('hospital.views.search_patients', wraps=search_patients) as search:
+            self.assertEqual(len(self.search(limit='abc')), 6)
+        self.assertEqual(search.call_args.args[2], 15)
+
+
+class SyntheticDataTests(TestCase):
+    now = timezone.make_aware(datetime(2026, 6, 30, 18, 0))
+
+    def generate(self, prefix):
+        SyntheticDataGenerator(clinics=1, patients=30, doctors=2, days=60, prefix=prefix, now=self.now).run()
+        return Clinic.objects.get(slug=f"{prefix}-1")
+
+    def history(self, clinic):
+        return [
+            list(Patient.objects.filter(clinic=clinic).order_by('pk').values_list(
+                'patient_id', 'patient_name', 'registration_date', 'date_of_birth')),
+            list(PatientVisit.objects.filter(clinic=clinic).order_by('pk').values_list('check_in_date', 'status')),
+            list(Prescription.objects.filter(clinic=clinic).order_by('pk').values_list('prescription_date', 'status')),
+            list(MasterMedicine.objects.filter(clinic=clinic).order_by('pk').values_list('created_at', 'updated_at')),
+            clinic.created_at,
+        ]
+
+    def test_dates_come_from_the_anchor(self):
+        clinic = self.generate('anchored')
+        earliest = self.now - timedelta(days=61)
+        for model, field in [(PatientVisit, 'check_in_date'), (Prescription, 'prescription_date')]:
+            dates = model.objects.filter(clinic=clinic).values_list(field, flat=True)
+            self.assertTrue(all(earliest <= date <= self.now for date in dates), model.__name__)
+        self.assertEqual(clinic.created_at, self.now)
+        self.assertEqual(set(User.objects.filter(clinic=clinic).values_list('created_at', flat=True)), {self.now})
+        self.assertTrue(Patient.objects.filter(clinic=clinic, patient_id__contains='2026').exists())
+        self.assertTrue(Patient._meta.get_field('registration_date').auto_now_add)
+
+    def test_same_seed_and_anchor_give_the_same_history(self):
+        first, second = self.generate('first'), self.generate('second')
+        one, other = self.history(first), self.history(second)
+        # Only the patient IDs carry the clinic's own ID
+        strip = lambda rows: [(pid.rsplit('-', 1)[-1], *rest) for pid, *rest in rows]
+        self.assertEqual(strip(one[0]), strip(other[0]))
+        self.assertEqual(one[1:], other[1:])
+
+
+class PatientImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, _ = seed_clinic('import', patients=2)
+
+    def run_import(self, text, batch_size=1000, create_logins=True):
+        importer = PatientImporter(self.clinic, self.receptionist, create_logins=create_logins, batch_size=batch_size)
+        return importer.import_file(io.BytesIO(text.encode()), 'patients.csv')
+
+    def test_missing_columns_and_bad_rows(self):
+        with self.assertRaisesMessage(PatientImportError, 'phone_number'):
+            self.run_import("Name,Age\nAsha,30\n")
+        with self.assertRaises(PatientImportError):
+            self.run_import("")
+        result = self.run_import(
+            "Name,Mobile,Age,Sex\n"
+            "Asha Pawar,9000000001,30,F\n"
+            ",9000000002,30,F\n"
+            "Lata More,9000000003,thirty,F\n"
+            "Pooja Shah,9000000004,30,X\n"
+            "Priya Nair,n/a,30,F\n"
+        )
+        self.assertEqual(result.created, 1)
+        self.assertEqual([number for number, _ in result.errors], [3, 4, 5, 6])
+
+    def test_duplicate_phones_are_compared_by_digits(self):
+        # seed_clinic registered 9876500000 and 9876500001
+        result = self.run_import(
+            "name,phone,age\n"
+            "A,98765 00000,30\n"       # existing patient
+            "B,9000000001,30\n"
+            "C,+9000-000-001,30\n"     # same file, same batch
+            "D,9000000002,30\n"
+            "E,90000 00002,30\n",      # same file, later batch
+            batch_size=2,
+        )
+        self.assertEqual((result.created, result.duplicates), (2, 3))
+        self.assertEqual(
+            sorted(Patient.objects.filter(clinic=self.clinic, patient_name__in=list('ABCDE')).values_list('patient_name', flat=True)),
+            ['B', 'D'],
+        )
+        # A second import sees the first one's patients
+        self.assertEqual(self.run_import("name,phone,age\nF,9000000002,30\n").duplicates, 1)
+
+    def test_ids_logins_and_search(self):
+        existing = set(Patient.objects.filter(clinic=self.clinic).values_list('patient_id', flat=True))
+        result = self.run_import("name,phone,age\n" + "".join(f"Kavya {n},91000000{n:02d},{20 + n}\n" for n in range(5)), batch_size=2)
+        self.assertEqual(result.created, 5)
+        patients = list(Patient.objects.filter(clinic=self.clinic, patient_name__startswith='Kavya').order_by('pk'))
+        ids = [patient.patient_id for patient in patients]
+        self.assertEqual(len(set(ids) | existing), len(existing) + 5)
+        serials = [int(pid.rsplit('-', 1)[-1]) for pid in ids]
+        self.assertEqual(serials, list(range(serials[0], serials[0] + 5)))
+
+        self.assertEqual(result.logins_queued, 5)
+        self.assertEqual(PatientLoginJob.objects.filter(patient__in=patients, status='pending').count(), 5)
+        self.assertFalse(User.objects.filter(patient__in=patients).exists())
+        self.assertEqual(list(search_patients(self.clinic, 'Kavya 3')), [patients[3]])
+
+        self.run_import("name,phone,age\nMeera,9200000000,40\n", create_logins=False)
+        self.assertFalse(PatientLoginJob.objects.filter(patient__patient_name='Meera').exists())
+
+    def test_xlsx_upload(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['Patient Name', 'Phone Number', 'DOB', 'Weight'])
+        workbook.active.append(['Sneha Joshi', 9300000000, datetime(1990, 5, 17), 55.5])
+        upload = io.BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+        result = PatientImporter(self.clinic, create_logins=False).import_file(upload, 'patients.xlsx')
+        self.assertEqual(result.created, 1)
+        patient = Patient.objects.get(clinic=self.clinic, patient_name='Sneha Joshi')
+        self.assertEqual((patient.phone_number, patient.weight), ('9300000000', 55.5))
+
+        with self.assertRaises(PatientImportError):
+            list(read_rows(io.BytesIO(b'not a workbook'), 'patients.xlsx'))
+
+
+class ClinicCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, _ = seed_clinic('cached', patients=1)
+
+    def setUp(self):
+        clear_clinic_cache()
+        reset_clinic_cache_stats()
+        self.addCleanup(clear_clinic_cache)
+
+    def test_repeat_lookups_skip_the_database(self):
+        self.assertEqual(get_clinic_by_slug('cached'), self.clinic)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_clinic_by_slug('cached'), self.clinic)
+        self.assertIsNone(get_clinic_by_slug('missing'))
+        stats = clinic_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 2, 1))
+
+    def test_saving_or_deleting_a_clinic_drops_its_entry(self):
+        clinic = Clinic.objects.create(name="Clinic", slug='cached-empty')
+        get_clinic_by_slug('cached-empty')
+        clinic = Clinic.objects.get(pk=clinic.pk)
+        clinic.name = 'Renamed'
+        clinic.slug = 'renamed'
+        clinic.save()
+        self.assertIsNone(get_clinic_by_slug('cached-empty'))
+        self.assertEqual(get_clinic_by_slug('renamed').name, 'Renamed')
+
+        clinic.delete()
+        self.assertIsNone(get_clinic_by_slug('renamed'))
+
+    @override_settings(CLINIC_CACHE_TTL=0)
+    def test_entries_expire(self):
+        get_clinic_by_slug('cached')
+        with self.assertNumQueries(1):
+            get_clinic_by_slug('cached')
+
+    def test_requests_resolve_the_clinic_from_the_cache(self):
+        self.client.force_login(self.receptionist)
+        url = reverse('reception_dashboard', kwargs={'clinic_slug': 'cached'})
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.client.get(url)
+            reset_clinic_cache_stats()
+            self.client.get(url)
+        self.assertEqual(clinic_cache_stats()['misses'], 0)
+
+
+class VisitRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, _ = seed_clinic('rollup', patients=4)
+
+    def buckets(self, clinic=None):
+        return sorted(
+            VisitDailyStats.objects.filter(clinic=clinic or self.clinic, count__gt=0)
+            .values_list('date', 'status', 'count')
+        )
+
+    def assert_matches_rebuild(self):
+        live = self.buckets()
+        rebuild_visit_daily_stats(clinic=self.clinic)
+        self.assertEqual(live, self.buckets())
+
+    def test_signals_match_a_full_rebuild(self):
+        today = timezone.localdate()
+        self.assertEqual(self.buckets(), [(today, 'checked_in', 4)])
+        visits = list(PatientVisit.objects.filter(clinic=self.clinic).order_by('pk'))
+
+        visits[0].status = 'completed'
+        visits[0].save()
+        visits[1].check_in_date = timezone.now() - timedelta(days=3)
+        visits[1].save()
+        visits[2].delete()
+        PatientVisit.objects.create(clinic=self.clinic, patient=visits[3].patient, checked_in_by=self.receptionist)
+        self.assertEqual(self.buckets(), sorted([
+            (today, 'checked_in', 2), (today, 'completed', 1), (today - timedelta(days=3), 'checked_in', 1),
+        ]))
+        self.assert_matches_rebuild()
+
+    def test_deleting_the_clinic_leaves_no_buckets(self):
+        clinic_id = self.clinic.pk
+        self.clinic.delete()
+        self.assertFalse(VisitDailyStats.objects.filter(clinic_id=clinic_id).exists())
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Every patient registered today, and names in pairs: ties on both orderings
+        cls.clinic, cls.receptionist, _ = seed_clinic('keyset', patients=0)
+        for number in range(11):
+            Patient.objects.create(
+                clinic=cls.clinic, patient_name=f"Twin {number // 2}", age=30, gender='female',
+                address="Pune", phone_number=f"97000{number:05d}", registered_by=cls.receptionist,
+            )
+
+    def walk(self, ordering, per_page=3):
+        paginator = KeysetPaginator(Patient.objects.filter(clinic=self.clinic), ordering, per_page)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.extend(patient.pk for patient in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once_across_ties(self):
+        patients = Patient.objects.filter(clinic=self.clinic)
+        self.assertEqual(self.walk('recent'), list(patients.order_by('-registration_date', '-id').values_list('pk', flat=True)))
+        self.assertEqual(self.walk('name'), list(patients.order_by('patient_name', 'id').values_list('pk', flat=True)))
+        self.assertEqual(len(self.walk('name', per_page=2)), 11)
+
+    def test_bad_cursors_are_rejected(self):
+        paginator = KeysetPaginator(Patient.objects.filter(clinic=self.clinic), 'name')
+        for cursor in ['not-a-cursor', encode_cursor('recent', '2026-01-01', 1), encode_cursor('name', None, 1)]:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+        self.client.force_login(self.receptionist)
+        url = reverse('reception_patients_page', kwargs={'clinic_slug': self.clinic.slug})
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+            response = self.client.get(url, {'order': 'name', 'limit': 4}).json()
+        self.assertEqual(response['count'], 4)
+        self.assertTrue(response['has_next'])
+
+
+class PatientIdSequenceTests(TransactionTestCase):
+    """Real transactions: concurrent registrations must never share an ID"""
+
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name="Clinic", slug='sequence', registration_number='SEQ-1')
+
+    def test_concurrent_allocations_do_not_overlap(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Threads share the in-memory test database through SQLite's shared
+            # cache, which fails on a lock instead of waiting for it
+            self.skipTest("needs a file or server database")
+        blocks, errors = [], []
+        start = threading.Barrier(6)
+
+        def register(count):
+            try:
+                start.wait()
+                for _ in range(5):
+                    first = PatientIdSequence.allocate(self.clinic, 2026, count)
+                    blocks.append(range(first, first + count))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=register, args=(count,)) for count in (1, 1, 2, 3, 5, 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        serials = sorted(serial for block in blocks for serial in block)
+        self.assertEqual(serials, list(range(1, 5 * 20 + 1)))
+        self.assertEqual(PatientIdSequence.objects.get(clinic=self.clinic, year=2026).last_value, 100)
+
+    def test_ids_are_per_clinic_and_year(self):
+        other = Clinic.objects.create(name="Other", slug='sequence-other', registration_number='SEQ-2')
+        self.assertEqual(PatientIdSequence.allocate(self.clinic, 2026, 3), 1)
+        self.assertEqual(PatientIdSequence.allocate(self.clinic, 2026), 4)
+        self.assertEqual(PatientIdSequence.allocate(self.clinic, 2027), 1)
+        self.assertEqual(PatientIdSequence.allocate(other, 2026), 1)
+        self.assertEqual(
+            Patient.allocate_patient_ids(self.clinic, 2, year=2026),
+            [f"PT{self.clinic.pk}-2026-000005", f"PT{self.clinic.pk}-2026-000006"],
+        )
+
+
+@override_settings(PATIENT_LOGIN_WORKER='command')
+class PatientLoginJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, _, _ = seed_clinic('logins', patients=3)
+        cls.patients = list(Patient.objects.filter(clinic=cls.clinic).order_by('pk'))
+
+    def make_due(self, job):
+        PatientLoginJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+    def test_creates_the_login_with_the_patients_password(self):
+        patient = self.patients[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue_patient_login(patient)
+        self.assertEqual(str(process_jobs()), "1 logins created, 0 to retry, 0 failed")
+        job.refresh_from_db()
+        patient.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertEqual(patient.user.username, login_username(patient))
+        self.assertTrue(patient.user.check_password(patient.default_password))
+        self.assertEqual(process_jobs().processed, 0)
+
+    def test_retries_back_off_then_fail(self):
+        job = enqueue_patient_login(self.patients[0])
+        with mock.patch('hospital.provisioning.create_patient_login', side_effect=RuntimeError("database is locked")):
+            for attempt, delay in enumerate(RETRY_DELAYS, start=1):
+                started = timezone.now()
+                self.assertEqual(process_jobs().retried, 1)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts, job.last_error), ('pending', attempt, "database is locked"))
+                self.assertAlmostEqual((job.run_after - started).total_seconds(), delay, delta=5)
+                # Not due yet
+                self.assertEqual(process_jobs().processed, 0)
+                self.make_due(job)
+            with self.assertLogs('hospital.provisioning', 'WARNING'):
+                self.assertEqual(process_jobs().failed, 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', MAX_ATTEMPTS))
+
+        # Failed jobs are queued again by enqueue_missing_logins, with the patients that have none
+        self.assertEqual(enqueue_missing_logins(self.clinic), 3)
+        self.assertEqual(process_jobs(clinic=self.clinic).done, 3)
+
+    def test_taken_username_fails_without_retrying(self):
+        patient = self.patients[1]
+        User.objects.create_user(login_username(patient), password='pw', clinic=self.clinic, role='doctor')
+        job = enqueue_patient_login(patient)
+        with self.assertLogs('hospital.provisioning', 'WARNING'):
+            self.assertEqual(process_jobs().failed, 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+        self.assertIn('already taken', job.last_error)
+
+    def test_jobs_of_a_dead_worker_are_picked_up(self):
+        job = enqueue_patient_login(self.patients[2])
+        PatientLoginJob.objects.filter(pk=job.pk).update(status='running')
+        self.assertEqual(process_jobs().processed, 0)
+        PatientLoginJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - STALE_AFTER * 2)
+        self.assertEqual(process_jobs().done, 1)
+
+
+class MedicineIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, _, cls.doctors = seed_clinic('medicines', patients=1)
+        for name in ('Cetirizine', 'Levocetirizine', 'Cetirizine Cold', 'Amoxicillin'):
+            MasterMedicine.objects.create(clinic=cls.clinic, medicine_name=name, medicine_type='tablet', default_dosage='1')
+
+    def setUp(self):
+        clear_medicine_indexes()
+        self.addCleanup(clear_medicine_indexes)
+
+    def names(self, query, doctor=None, **kwargs):
+        user_id = doctor.user_id if doctor else None
+        return [item['name'] for item in search_medicines(self.clinic, query, user_id=user_id, **kwargs)]
+
+    def test_exact_then_prefix_then_word_then_substring(self):
+        self.assertEqual(self.names('cetirizine'), ['Cetirizine', 'Cetirizine Cold', 'Levocetirizine'])
+        self.assertEqual(self.names('COLD'), ['Cetirizine Cold'])
+        self.assertEqual(self.names('izine', limit=2), ['Cetirizine', 'Cetirizine Cold'])
+        self.assertEqual(self.names('xyz'), [])
+
+    def test_each_doctors_usual_medicines_come_first(self):
+        # seed_clinic: both doctors prescribed Paracetamol and Pantoprazole; nobody Paracip Syrup
+        self.assertEqual(self.names('para'), ['Paracetamol', 'Paracip Syrup'])
+        patient = Patient.objects.get(clinic=self.clinic)
+        for _ in range(5):
+            prescription = Prescription.objects.create(clinic=self.clinic, patient=patient, doctor=self.doctors[1])
+            Medicine.objects.create(
+                clinic=self.clinic, prescription=prescription, medicine_name='Paracip Syrup', dosage='5ml',
+                frequency_per_day=2, duration='3 days', medicine_type='syrup', qty=1,
+            )
+        self.assertEqual(self.names('para', self.doctors[1]), ['Paracip Syrup', 'Paracetamol'])
+        self.assertEqual(self.names('para', self.doctors[0])[0], 'Paracetamol')
+        # The same after a rebuild from the history
+        clear_medicine_indexes()
+        self.assertEqual(self.names('para', self.doctors[1]), ['Paracip Syrup', 'Paracetamol'])
+
+    def test_master_data_changes_update_the_loaded_index(self):
+        self.names('cetirizine')
+        index = loaded_medicine_index(self.clinic.pk)
+        medicine = MasterMedicine.objects.create(
+            clinic=self.clinic, medicine_name='Cetirizine Syrup', medicine_type='syrup', default_dosage='5ml',
+        )
+        with self.assertNumQueries(0):
+            self.assertIn('Cetirizine Syrup', self.names('cetirizine'))
+
+        medicine.medicine_name = 'Montair LC'
+        medicine.save()
+        self.assertNotIn('Cetirizine Syrup', self.names('cetirizine'))
+        self.assertEqual(self.names('montair'), ['Montair LC'])
+        medicine.is_active = False
+        medicine.save()
+        self.assertEqual(self.names('montair'), [])
+        MasterMedicine.objects.filter(medicine_name='Levocetirizine').get().delete()
+        self.assertEqual(self.names('levo'), [])
+        self.assertIs(loaded_medicine_index(self.clinic.pk), index)
+
+    def test_newer_catalog_version_rebuilds(self):
+        index = get_medicine_index(self.clinic.pk)
+        self.assertIs(get_medicine_index(self.clinic.pk, version=index.catalog_version), index)
+        self.assertIsNot(get_medicine_index(self.clinic.pk, version=index.catalog_version + 1), index)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, QUERY_BUDGETS={})
+class MasterCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, _, cls.doctors = seed_clinic('catalog', patients=1)
+
+    def setUp(self):
+        clear_medicine_indexes()
+        self.addCleanup(clear_medicine_indexes)
+        self.client.force_login(self.doctors[0].user)
+
+    def get(self, name, data=None, **extra):
+        url = reverse(name, kwargs={'clinic_slug': self.clinic.slug})
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.get(url, data, **extra)
+
+    def test_repeated_lookup_is_a_304(self):
+        for name in ('api_master_medicines', 'api_master_tests'):
+            with self.subTest(name):
+                response = self.get(name)
+                self.assertEqual(response.status_code, 200)
+                etag = response.headers['ETag']
+                response = self.get(name, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_master_data_writes_bump_the_version(self):
+        version = catalog_version(self.clinic)
+        etag = self.get('api_master_medicines').headers['ETag']
+        medicine = MasterMedicine.objects.create(
+            clinic=self.clinic, medicine_name='Azithromycin', medicine_type='tablet', default_dosage='1',
+        )
+        self.assertEqual(catalog_version(self.clinic), version + 1)
+        response = self.get('api_master_medicines', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Azithromycin', [item['name'] for item in response.json()])
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        medicine.delete()
+        MasterTest.objects.filter(clinic=self.clinic, test_name='Chest X-Ray').update(is_active=False)
+        self.assertEqual(catalog_version(self.clinic), version + 2)
+        MasterTest.objects.get(clinic=self.clinic, test_name='Urine Routine').delete()
+        self.assertEqual(catalog_version(self.clinic), version + 3)
+
+    def test_etag_is_per_doctor(self):
+        etag = self.get('api_master_medicines').headers['ETag']
+        self.client.force_login(self.doctors[1].user)
+        response = self.get('api_master_medicines', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_versioned_snapshot_may_be_cached(self):
+        response = self.get('api_master_catalog')
+        version = response.json()['version']
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        self.assertEqual([test['test_name'] for test in response.json()['tests']],
+                         ['Chest X-Ray', 'Complete Blood Count', 'Urine Routine'])
+
+        response = self.get('api_master_catalog', {'v': version})
+        self.assertIn(f'max-age={SNAPSHOT_MAX_AGE}', response.headers['Cache-Control'])
+        self.assertEqual(self.get('api_master_catalog', HTTP_IF_NONE_MATCH=response.headers['ETag']).status_code, 304)
+
+
+class SameDayPrescriptionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.receptionist, cls.doctors = seed_clinic('checkin', patients=4)
+
+    def visits(self):
+        return list(PatientVisit.objects.filter(clinic=self.clinic).select_related('patient'))
+
+    def test_one_query_for_all_visits(self):
+        visits = self.visits()
+        with self.assertNumQueries(1):
+            found = get_same_day_prescriptions(visits)
+        # seed_clinic: only the first two patients got a prescription today
+        self.assertEqual(
+            {visit.patient.patient_name: found[visit.id].status for visit in visits if visit.id in found},
+            {'Ramesh Patil0': 'pending', 'Ramesh Patil1': 'pending'},
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual({pres.doctor.user for pres in found.values()}, {self.doctors[0].user})
+        self.assertEqual(get_same_day_prescriptions([]), {})
+
+    def test_latest_prescription_of_the_visit_day(self):
+        patient = Patient.objects.get(clinic=self.clinic, patient_name='Ramesh Patil0')
+        latest = add_prescription(self.clinic, patient, self.doctors[1])
+        old_visit = PatientVisit.objects.create(clinic=self.clinic, patient=patient, purpose='Cough')
+        PatientVisit.objects.filter(pk=old_visit.pk).update(check_in_date=timezone.now() - timedelta(days=7))
+
+        found = get_same_day_prescriptions(PatientVisit.objects.filter(patient=patient))
+        self.assertEqual(len(found), 2)
+        self.assertEqual(found.pop(old_visit.pk).status, 'completed')
+        self.assertEqual(list(found.values()), [latest])
+
+    def test_search_query_count_does_not_grow_with_rows(self):
+        self.client.force_login(self.receptionist)
+        url = reverse('checkin_dashboard_search', kwargs={'clinic_slug': self.clinic.slug})
+        counts = []
+        for limit in (1, 1, 4):  # the first request fills the clinic cache
+            with CaptureQueriesContext(connection) as queries, contextlib.redirect_stdout(io.StringIO()):
+                response = self.client.get(url, {'q': 'Ramesh', 'limit': limit})
+            self.assertEqual(response.json()['count'], limit)
+            counts.append(len(queries))
+        self.assertEqual(counts[1], counts[2])
+        doctors = {row['patient_name']: row['doctor_name'] for row in response.json()['results']}
+        self.assertEqual(doctors['Ramesh Patil3'], '')
+        self.assertEqual(doctors['Ramesh Patil0'], 'Dr.')  # the seeded doctors have no names
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, _, cls.doctors = seed_clinic('bench', patients=3)
+
+    def setUp(self):
+        clear_medicine_indexes()
+
+    def test_every_scenario_runs_and_posts_are_rolled_back(self):
+        medicines = Medicine.objects.filter(clinic=self.clinic).count()
+        report = run_benchmarks(self.clinic, iterations=2, warmup=1)
+        self.assertEqual(list(report['scenarios']), SCENARIO_NAMES)
+        for name, result in report['scenarios'].items():
+            with self.subTest(name):
+                self.assertEqual(result['status'], [200])
+                self.assertEqual(result['requests'], 2)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['queries'], 0)
+        self.assertEqual(report['dataset'], {'patients': 3, 'prescriptions': 5, 'admissions': False})
+        self.assertEqual(Medicine.objects.filter(clinic=self.clinic).count(), medicines)
+
+    def test_clinic_without_a_doctor(self):
+        clinic = Clinic.objects.create(name="Empty", slug='empty', registration_number='EMPTY-REG')
+        with self.assertRaisesMessage(BenchmarkError, "needs a receptionist and a doctor"):
+            run_benchmarks(clinic, only=['patient_search'])
+
+    def test_regressions_against_a_baseline(self):
+        def report(p95, queries):
+            return {'scenarios': {'patient_search': {'p95_ms': p95, 'queries': queries}}}
+
+        baseline = report(10.0, 4)
+        self.assertEqual(compare_to_baseline(report(11.9, 4), baseline), [])
+        # Within the tolerance in relative terms is not enough for tiny timings, and vice versa
+        self.assertEqual(compare_to_baseline(report(1.5, 4), report(1.0, 4)), [])
+        self.assertEqual(len(compare_to_baseline(report(12.5, 4), baseline)), 1)
+        self.assertEqual(compare_to_baseline(report(10.0, 5), baseline), ['patient_search: 5 queries, baseline 4'])
+        self.assertEqual(compare_to_baseline(report(50.0, 9), {'scenarios': {}}), [])
+
+    def test_command_fails_on_a_regression(self):
+        baseline = run_benchmarks(self.clinic, iterations=1, warmup=0, only=['patient_search'])
+        baseline['scenarios']['patient_search']['queries'] = 1
+        path = f"{self.tmp_dir()}/baseline.json"
+        with open(path, 'w') as fileobj:
+            json.dump(baseline, fileobj)
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "patient_search:"):
+            call_command('benchmark', clinic='bench', iterations=1, warmup=0, only=['patient_search'],
+                         baseline=path, stdout=out, stderr=io.StringIO())
+        self.assertEqual(list(json.loads(out.getvalue())['scenarios']), ['patient_search'])
+        with self.assertRaisesMessage(CommandError, "Clinic 'missing' not found"):
+            call_command('benchmark', clinic='missing')
+
+    def tmp_dir(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+
+# No login worker thread: it would open a second connection to the in-memory SQLite database
+@override_settings(PATIENT_LOGIN_WORKER='command')
+class LoadTestTests(LiveServerTestCase):
+    def test_one_clinic_day_workflow(self):
+        clinic, receptionist, doctors = seed_clinic('load', patients=1)
+        # Views still print debug output (in the server thread; sys.stdout is global)
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run_load_test(
+                self.live_server_url, clinic.slug, [receptionist.username], [doctors[0].user.username], 'pw',
+                users=1, duration=120, iterations=1, medicines_per_prescription=2, seed=1,
+            )
+        self.assertEqual((report['workflows_completed'], report['workflows_failed']), (1, 0), report)
+        self.assertEqual(report['error_rate'], 0)
+        self.assertEqual(report['steps']['add_medicine']['requests'], 2)
+        self.assertEqual(report['steps']['login']['requests'], 2)
+        # Nothing created the patient's login, so the doctor downloaded the PDF
+        self.assertEqual(report['patient_login_pending'], 1)
+        self.assertEqual(report['steps']['download_prescription']['status'], {'200': 1})
+        prescription = Prescription.objects.filter(clinic=clinic, patient__address='Load test').get()
+        self.assertEqual((prescription.status, prescription.medicines_count), ('completed', 2))
+
+    def test_unreachable_server_fails_the_workflow(self):
+        stats = LoadStats()
+        ClinicDay('http://127.0.0.1:9', 'load', 'reception', 'doctor', 'pw', stats).run(
+            time.monotonic() + 30, iterations=1,
+        )
+        report = stats.report(1.0)
+        self.assertEqual((report['workflows_completed'], report['workflows_failed']), (0, 1))
+        self.assertEqual(report['steps']['login']['status'], {'0': 1})
+        self.assertEqual(report['error_rate'], 1)
+
+    def test_lock_errors_are_counted(self):
+        stats = LoadStats()
+        stats.record('patient_search', LoadResponse(500, b'OperationalError: database is locked', '/', 0.01), False)
+        stats.record('patient_search', LoadResponse(200, b'{}', '/', 0.03), True)
+        row = stats.report(2.0)['steps']['patient_search']
+        self.assertEqual((row['requests'], row['errors'], row['locked']), (2, 1, 1))
+        self.assertEqual((row['p50_ms'], row['p99_ms']), (10.0, 30.0))
+
+
+class SQLiteProductionTests(TestCase):
+    def test_connections_get_the_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite pragmas")
+        connection.ensure_connection()
+        with connection.cursor() as cursor:
+            # 1 = NORMAL, 2 = MEMORY (the test database is in memory, so no WAL here)
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(cursor.execute('PRAGMA temp_store').fetchone()[0], 2)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_benchmark_configured_options(self):
+        options = settings.DATABASES['default'].get('OPTIONS', {})
+        if 'init_command' not in options:
+            self.skipTest("SQLite production mode options are not configured")
+        result = benchmark_sqlite(options, writers=3, readers=2, duration=0.3, write_queue=True)
+        self.assertEqual((result['journal_mode'], result['transaction']), ('wal', 'BEGIN IMMEDIATE'))
+        self.assertEqual(result['lock_errors'], 0)
+        self.assertGreater(result['writes_per_s'], 0)
+        self.assertGreater(result['reads_per_s'], 0)
+
+        result = benchmark_sqlite(DJANGO_DEFAULT_OPTIONS, writers=1, readers=0, duration=0.1)
+        self.assertEqual((result['journal_mode'], result['transaction']), ('delete', 'BEGIN'))
+        self.assertIsNone(result['read_p50_ms'])
+
+    def test_write_queue_is_off_by_default(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            SerializedWritesMiddleware(lambda request: HttpResponse())
+
+    @override_settings(SQLITE_WRITE_QUEUE=True)
+    def test_write_queue_serializes_unsafe_requests(self):
+        def view(request):
+            # A second write of this process must not get in now
+            return HttpResponse(str(not sqlite_production._write_lock.acquire(blocking=False)))
+
+        middleware = SerializedWritesMiddleware(view)
+        factory = RequestFactory()
+        self.assertEqual(middleware(factory.post('/')).content, b'True')
+        self.assertEqual(middleware(factory.delete('/')).content, b'True')
+        response = middleware(factory.get('/'))
+        self.assertEqual(response.content, b'False')
+        sqlite_production._write_lock.release()  # the GET took it
+        self.assertFalse(sqlite_production._write_lock.locked())
@@ -2,21 +2,44 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.views.decorators.http import require_http_methods, require_POST
+from django.views.decorators.http import condition, require_http_methods, require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.crypto import get_random_string
+from django.utils.http import content_disposition_header, quote_etag
 from django.contrib.auth.hashers import make_password
 
-# Note: PDF generation now uses client-side html2pdf.js library
-# Server-side PDF libraries (weasyprint, reportlab) no longer needed
-# This ensures downloaded PDF matches print layout exactly
-# See: https://github.com/eKoopmans/html2pdf.js
+# Note: prescription PDFs are rendered on the server with reportlab
+# (see hospital.prescription_pdf), using the print_prescription.html layout
 
 import json
+from functools import wraps
 
+from asgiref.sync import sync_to_async
+
+from .clinic_cache import get_clinic_by_slug, clinic_cache_stats
+from .importers import PatientImporter, PatientImportError
+from .prescription_export import (
+    EXPORT_FORMATS, astream, prescriptions_for_export, stream_merged_pdf, stream_zip,
+)
+from .prescription_counts import prescription_items_atomic
+from .prescription_pdf import (
+    DEFAULT_PAGE_SIZE, PAGE_SIZES, build_prescription_context, get_prescription_pdf, prescription_queryset,
+)
+from .provisioning import enqueue_missing_logins, enqueue_patient_login, kick_worker, login_username
+from .metrics import query_budget, request_metrics, reset_request_metrics
+from .db_routers import replica_read
+from .live_queue import event_stream, live_queue_enabled
+from .master_catalog import SNAPSHOT_MAX_AGE, catalog_etag, catalog_snapshot, catalog_version, test_payload
+from .medicine_index import search_medicines
+from .pagination import ORDERINGS, InvalidCursor, KeysetPaginator, parse_per_page
+from .search import search_patients
+from .tenant_databases import clinic_context, delete_clinic_rows, forget_global_row, tenant_database
 from .models import (
     AssociatedMedical,
     Patient,
@@ -35,6 +58,7 @@ from .models import (
     PatientAdmission,
     TreatmentLog,
     Vitals,
+    VisitDailyStats,
     StandardPrescriptionTemplate,
     StandardTemplateMedicine,
     StandardTemplateTest,
@@ -66,17 +90,18 @@ def get_clinic_from_slug_or_middleware(clinic_slug, request):
     Helper function to get clinic from URL slug or middleware context.
     
     Priority:
-    1. clinic_slug parameter (if provided)
+    1. clinic_slug parameter (if provided), via the per-process clinic cache
     2. request.clinic from middleware
     3. user.clinic (if authenticated)
     
     Returns: Clinic object or None
     """
     if clinic_slug:
-        try:
-            return Clinic.objects.get(slug=clinic_slug)
-        except Clinic.DoesNotExist:
-            return None
+        # Middleware already resolved this slug (served from the clinic cache)
+        clinic = getattr(request, 'clinic', None)
+        if clinic and clinic.slug == clinic_slug:
+            return clinic
+        return get_clinic_by_slug(clinic_slug)
     
     # Try request clinic from middleware
     if hasattr(request, 'clinic') and request.clinic:
@@ -88,6 +113,98 @@ def get_clinic_from_slug_or_middleware(clinic_slug, request):
     
     return None
 
+
+async def aget_clinic_from_slug_or_middleware(clinic_slug, request, user):
+    """get_clinic_from_slug_or_middleware() for async views; ``user`` is await request.auser()"""
+    clinic = getattr(request, 'clinic', None)
+    if clinic and (not clinic_slug or clinic.slug == clinic_slug):
+        return clinic
+    if clinic_slug:
+        return await sync_to_async(get_clinic_by_slug)(clinic_slug)
+    # The auth backend loads the clinic along with the user
+    return user.clinic if user.is_authenticated else None
+
+
+def get_same_day_prescriptions(visits):
+    """
+    Resolve each visit's prescription in one query.
+
+    Returns {visit.id: Prescription} holding the latest prescription written
+    for the visit's patient on the visit's (local) date, with doctor__user
+    already loaded. Visits without a same-day prescription are left out.
+    """
+    from django.utils import timezone
+
+    visits = list(visits)
+    if not visits:
+        return {}
+
+    visit_days = {v.id: (v.patient_id, timezone.localtime(v.check_in_date).date()) for v in visits}
+    patient_ids = {patient_id for patient_id, _ in visit_days.values()}
+    days = {day for _, day in visit_days.values()}
+
+    latest = {}
+    prescriptions = Prescription.objects.filter(
+        patient_id__in=patient_ids,
+        prescription_date__date__in=days,
+    ).select_related('doctor__user').order_by('-prescription_date')
+    for pres in prescriptions:
+        key = (pres.patient_id, timezone.localtime(pres.prescription_date).date())
+        latest.setdefault(key, pres)
+
+    return {
+        visit_id: latest[key]
+        for visit_id, key in visit_days.items()
+        if key in latest
+    }
+
+def get_doctor_patients(clinic, search_query=''):
+    """Patients listed on the doctor dashboard, optionally filtered by name"""
+    patients = Patient.objects.filter(clinic=clinic) if clinic else Patient.objects.all()
+    if search_query:
+        patients = patients.filter(patient_name__icontains=search_query)
+    return patients
+
+
+def get_patients_prescribed_today(doctor, clinic):
+    """IDs of patients this doctor already wrote a prescription for today"""
+    from django.utils import timezone
+    today = timezone.now().date()
+    return set(Prescription.objects.filter(doctor=doctor, clinic=clinic, prescription_date=today).values_list('patient_id', flat=True))
+
+
+def paginate_patients(request, queryset, default_ordering='recent'):
+    """
+    Keyset-paginate a Patient queryset from ?cursor=, ?order= and ?limit=.
+    Raises InvalidCursor for a bad cursor.
+    """
+    ordering = request.GET.get('order', default_ordering)
+    if ordering not in ORDERINGS:
+        ordering = default_ordering
+    paginator = KeysetPaginator(queryset, ordering, parse_per_page(request.GET.get('limit')))
+    return paginator.page(request.GET.get('cursor'))
+
+
+def patient_page_json(request, queryset, row_template, context=None, default_ordering='recent'):
+    """
+    JSON response for infinite scroll: the next page of patients rendered
+    with the same row template the full page uses, plus the next cursor.
+    """
+    try:
+        page = paginate_patients(request, queryset, default_ordering)
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+
+    row_context = dict(context or {}, patients=page.items)
+    return JsonResponse({
+        'success': True,
+        'html': render_to_string(row_template, row_context, request=request),
+        'count': len(page),
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    })
+
+
 # ==================== AUTHENTICATION VIEWS ====================
 
 @require_http_methods(["GET", "POST"])
@@ -231,11 +348,13 @@ def homepage(request):
 #===================== SUPERADMIN VIEWS =====================
 
 @login_required(login_url='login')
+@replica_read
 def superadmin_dashboard(request):
     """Platform superadmin dashboard - Manage all clinics"""
     if request.user.role != 'super_admin':
         return redirect('homepage')
     
+    # Clinic rows are global (always in 'default'), so no clinic_context here
     clinics = Clinic.objects.all().order_by('name')
     
     context = {
@@ -247,6 +366,36 @@ def superadmin_dashboard(request):
     return render(request, 'hospital/superadmin/dashboard.html', context)
 
 
+@login_required(login_url='login')
+def superadmin_clinic_cache_stats(request):
+    """Superadmin - Hit/miss counters for the per-process clinic cache (JSON)"""
+    if request.user.role != 'super_admin':
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    return JsonResponse(clinic_cache_stats())
+
+
+@login_required(login_url='login')
+def ops_metrics(request):
+    """Superadmin - Per-view query counts and latency percentiles (this process)"""
+    if request.user.role != 'super_admin':
+        return redirect('homepage')
+
+    rows = request_metrics()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'views': rows, 'clinic_cache': clinic_cache_stats()})
+
+    if request.method == 'POST':
+        reset_request_metrics()
+        messages.success(request, "Request metrics reset.")
+        return redirect('ops_metrics')
+
+    context = {
+        'rows': rows,
+        'clinic_cache': clinic_cache_stats(),
+    }
+    return render(request, 'hospital/superadmin/ops_metrics.html', context)
+
+
 @login_required(login_url='login')
 def delete_clinic(request, clinic_id):
     """Superadmin - Delete a clinic"""
@@ -257,6 +406,12 @@ def delete_clinic(request, clinic_id):
     
     if request.method == 'POST':
         clinic_name = clinic.name
+        alias = tenant_database(clinic)
+        if alias:
+            # The cascade below only reaches 'default'; clear the clinic's own
+            # database first (the Clinic copy takes its users' copies with it)
+            delete_clinic_rows(clinic, alias)
+            forget_global_row(clinic, alias)
         clinic.delete()
         messages.success(request, f"Clinic '{clinic_name}' has been deleted successfully!")
         return redirect('superadmin_dashboard')
@@ -266,61 +421,87 @@ def delete_clinic(request, clinic_id):
 
 
 @login_required(login_url='login')
+@replica_read
 def superadmin_clinic_patients(request, clinic_id):
     """Superadmin - View all patients in a specific clinic"""
     if request.user.role != 'super_admin':
         return redirect('homepage')
     
     clinic = get_object_or_404(Clinic, id=clinic_id)
-    patients = Patient.objects.filter(clinic=clinic).order_by('-registration_date')
-    
-    context = {
-        'clinic': clinic,
-        'patients': patients,
-        'total_patients': patients.count(),
-    }
-    return render(request, 'hospital/superadmin/clinic_patients.html', context)
+    with clinic_context(clinic):
+        patients = Patient.objects.filter(clinic=clinic)
+        page = KeysetPaginator(patients, 'recent').page()
+
+        context = {
+            'clinic': clinic,
+            'patients': page.items,
+            'next_cursor': page.next_cursor,
+            'total_patients': patients.count(),
+        }
+        return render(request, 'hospital/superadmin/clinic_patients.html', context)
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+@replica_read
+def superadmin_clinic_patients_page(request, clinic_id):
+    """AJAX endpoint: next page of a clinic's patients for the superadmin list"""
+    if request.user.role != 'super_admin':
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+
+    clinic = get_object_or_404(Clinic, id=clinic_id)
+    with clinic_context(clinic):
+        return patient_page_json(
+            request,
+            Patient.objects.filter(clinic=clinic),
+            'hospital/superadmin/clinic_patient_rows.html',
+            {'clinic': clinic},
+        )
 
 
 @login_required(login_url='login')
+@replica_read
 def superadmin_clinic_doctors(request, clinic_id):
     """Superadmin - View all doctors in a specific clinic"""
     if request.user.role != 'super_admin':
         return redirect('homepage')
     
     clinic = get_object_or_404(Clinic, id=clinic_id)
-    doctors = Doctor.objects.filter(clinic=clinic).order_by('user__first_name')
-    
-    context = {
-        'clinic': clinic,
-        'doctors': doctors,
-        'total_doctors': doctors.count(),
-    }
-    return render(request, 'hospital/superadmin/clinic_doctors.html', context)
+    with clinic_context(clinic):
+        doctors = Doctor.objects.filter(clinic=clinic).order_by('user__first_name')
+
+        context = {
+            'clinic': clinic,
+            'doctors': doctors,
+            'total_doctors': doctors.count(),
+        }
+        return render(request, 'hospital/superadmin/clinic_doctors.html', context)
 
 
 @login_required(login_url='login')
+@replica_read
 def superadmin_clinic_prescriptions(request, clinic_id):
     """Superadmin - View all prescriptions in a specific clinic"""
     if request.user.role != 'super_admin':
         return redirect('homepage')
     
     clinic = get_object_or_404(Clinic, id=clinic_id)
-    prescriptions = Prescription.objects.filter(clinic=clinic).order_by('-prescription_date')
-    
-    # Get filter options
-    status_filter = request.GET.get('status', '')
-    if status_filter:
-        prescriptions = prescriptions.filter(status=status_filter)
-    
-    context = {
-        'clinic': clinic,
-        'prescriptions': prescriptions,
-        'total_prescriptions': prescriptions.count(),
-        'status_choices': Prescription.STATUS_CHOICES if hasattr(Prescription, 'STATUS_CHOICES') else [],
-        'selected_status': status_filter,
-    }
-    return render(request, 'hospital/superadmin/clinic_prescriptions.html', context)
+    with clinic_context(clinic):
+        prescriptions = Prescription.objects.filter(clinic=clinic).order_by('-prescription_date')
+
+        # Get filter options
+        status_filter = request.GET.get('status', '')
+        if status_filter:
+            prescriptions = prescriptions.filter(status=status_filter)
+
+        context = {
+            'clinic': clinic,
+            'prescriptions': prescriptions,
+            'total_prescriptions': prescriptions.count(),
+            'status_choices': Prescription.STATUS_CHOICES if hasattr(Prescription, 'STATUS_CHOICES') else [],
+            'selected_status': status_filter,
+        }
+        return render(request, 'hospital/superadmin/clinic_prescriptions.html', context)
 
 
 @require_http_methods(["GET", "POST"])
@@ -510,6 +691,7 @@ def receptionist_upload_medical_report(request, clinic_slug, patient_id):
 
 @login_required(login_url='login')
 @require_http_methods(["GET", "POST"])
+@query_budget(8)
 def reception_dashboard(request, clinic_slug=None):
     """Reception person dashboard"""
     if request.user.role != 'receptionist':
@@ -518,15 +700,14 @@ def reception_dashboard(request, clinic_slug=None):
     # Resolve clinic: URL slug -> middleware -> user's clinic
     clinic = getattr(request, 'clinic', None)
     if not clinic and clinic_slug:
-        try:
-            clinic = Clinic.objects.get(slug=clinic_slug)
-        except Clinic.DoesNotExist:
-            clinic = None
+        clinic = get_clinic_by_slug(clinic_slug)
     if not clinic and getattr(request.user, 'clinic', None):
         clinic = request.user.clinic
     
-    # Get clinic-specific patients
-    patients = Patient.objects.filter(clinic=clinic).order_by('-registration_date') if clinic else Patient.objects.all().order_by('-registration_date')
+    # Get clinic-specific patients; only the first page is rendered,
+    # the rest is loaded on scroll from reception_patients_page
+    patients = Patient.objects.filter(clinic=clinic) if clinic else Patient.objects.all()
+    page = KeysetPaginator(patients, 'recent').page()
     
     # Get today's check-ins (from PatientVisit)
     from django.utils import timezone
@@ -538,7 +719,8 @@ def reception_dashboard(request, clinic_slug=None):
     
     context = {
         'clinic': clinic,
-        'patients': patients,
+        'patients': page.items,
+        'next_cursor': page.next_cursor,
         'total_patients': patients.count(),
         'todays_visits': todays_visits,
         'pending_prescriptions': pending_prescriptions,
@@ -546,6 +728,34 @@ def reception_dashboard(request, clinic_slug=None):
     return render(request, 'hospital/reception/dashboard.html', context)
 
 
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def reception_patients_page(request, clinic_slug=None):
+    """
+    AJAX endpoint: next page of the reception patient table.
+    With ?q= the table is filtered through the patient search index instead.
+    """
+    if request.user.role != 'receptionist':
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+
+    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
+    row_template = 'hospital/reception/patient_rows.html'
+
+    q = request.GET.get('q', '').strip()
+    if q:
+        matches = search_patients(clinic, q, parse_per_page(request.GET.get('limit')))
+        return JsonResponse({
+            'success': True,
+            'html': render_to_string(row_template, {'clinic': clinic, 'patients': matches}, request=request),
+            'count': len(matches),
+            'next_cursor': None,
+            'has_next': False,
+        })
+
+    patients = Patient.objects.filter(clinic=clinic) if clinic else Patient.objects.all()
+    return patient_page_json(request, patients, row_template, {'clinic': clinic})
+
+
 @login_required(login_url='login')
 @require_http_methods(["GET", "POST"])
 def register_patient(request, clinic_slug=None):
@@ -585,25 +795,10 @@ def register_patient(request, clinic_slug=None):
                 patient.clinic = clinic
             patient.save()
 
-            # ✅ CREATE USER ACCOUNT FOR PATIENT LOGIN
-            # Use patient_id as username for easy login
-            username = patient.patient_id.lower()
-            
-            # Check if user already exists
-            if not User.objects.filter(username=username).exists():
-                # Create User account
-                patient_user = User.objects.create_user(
-                    username=username,  # patient_id becomes username
-                    password=patient.default_password,  # Use generated password
-                    email=f"{patient.phone_number}@patient.local",  # Auto-generated email
-                    clinic=clinic,
-                    role='patient',
-                )
-                # Link user to patient
-                patient.user = patient_user
-                patient.save()
-                
-                print(f"✅ Patient user account created: username='{username}'")
+            # ✅ QUEUE USER ACCOUNT FOR PATIENT LOGIN
+            # Password hashing is slow, so the login is created in the background
+            # (username = patient_id, password = default_password)
+            enqueue_patient_login(patient)
             
             messages.success(
                 request,
@@ -660,7 +855,7 @@ def patient_checkin(request, clinic_slug=None):
     if request.method == 'POST':
         patient_id = request.POST.get('patient_id')
         try:
-            patient = Patient.objects.get(patient_id=patient_id)
+            patient = Patient.objects.get(patient_id=patient_id, clinic=clinic) if clinic else Patient.objects.get(patient_id=patient_id)
             form = PatientVisitForm(request.POST)
             if form.is_valid():
                 visit = form.save(commit=False)
@@ -675,7 +870,10 @@ def patient_checkin(request, clinic_slug=None):
         except Patient.DoesNotExist:
             messages.error(request, "Patient ID not found!")
     
-    patients = Patient.objects.all().order_by('patient_name')
+    # Seed the datalist with one page of this clinic's patients; the
+    # autocomplete (patient_search) covers everyone else
+    patients = Patient.objects.filter(clinic=clinic) if clinic else Patient.objects.all()
+    patients = KeysetPaginator(patients.only('id', 'patient_id', 'patient_name'), 'name').page().items
     form = PatientVisitForm()
     
     context = {
@@ -688,30 +886,24 @@ def patient_checkin(request, clinic_slug=None):
 
 
 @login_required(login_url='login')
-def patient_search(request, clinic_slug=None):
+@query_budget(5)
+async def patient_search(request, clinic_slug=None):
     """AJAX endpoint: search patients by name, patient_id or phone number."""
-
-    if request.user.role != 'receptionist':
+    user = await request.auser()
+    if user.role != 'receptionist':
         return JsonResponse({'error': 'unauthorized'}, status=403)
 
     q = request.GET.get('q', '').strip()
-    limit = int(request.GET.get('limit', 15))
+    limit = parse_per_page(request.GET.get('limit'), default=15, maximum=50)
 
-    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
+    clinic = await aget_clinic_from_slug_or_middleware(clinic_slug, request, user)
 
     if not q:
         return JsonResponse({'results': []})
 
-    qs = Patient.objects.all()
-
-    if clinic:
-        qs = qs.filter(clinic=clinic)
-
-    matches = qs.filter(
-        Q(patient_name__icontains=q) |
-        Q(patient_id__icontains=q) |
-        Q(phone_number__icontains=q)
-    ).order_by('patient_name')[:limit]
+    # Indexed lookup: name prefixes, phone suffixes, patient IDs (ranked).
+    # The search backends use raw cursors, which have no async API.
+    matches = await sync_to_async(search_patients)(clinic, q, limit)
 
     results = [
         {
@@ -727,6 +919,8 @@ def patient_search(request, clinic_slug=None):
 
 
 @login_required(login_url='login')
+@query_budget(8)
+@replica_read
 def checkin_dashboard(request, clinic_slug=None):
     """Aggregated check-in dashboard supporting day/month/year granularity.
 
@@ -741,12 +935,15 @@ def checkin_dashboard(request, clinic_slug=None):
 
     # Determine granularity
     gran = request.GET.get('granularity', 'day')  # 'day' | 'month' | 'year'
-    from django.db.models.functions import TruncDay, TruncMonth, TruncYear
-    from django.db.models import Count
+    from django.db.models.functions import TruncMonth, TruncYear
+    from django.db.models import F, Sum
 
     qs = PatientVisit.objects.all_clinics() if hasattr(PatientVisit.objects, 'all_clinics') else PatientVisit.objects.all()
+    # Chart aggregates come from the VisitDailyStats rollup, not raw visits
+    stats = VisitDailyStats.objects.all_clinics()
     if clinic:
         qs = qs.filter(clinic=clinic)
+        stats = stats.filter(clinic=clinic)
 
     # Optional date filters
     period = request.GET.get('period', '')  # e.g., 'today', 'this_month', 'this_year'
@@ -754,40 +951,46 @@ def checkin_dashboard(request, clinic_slug=None):
     specific_month = request.GET.get('specific_month', '')
     
     from django.utils import timezone
-    now = timezone.now()
+    today = timezone.localdate()
     if specific_date:
         qs = qs.filter(check_in_date__date=specific_date)
+        stats = stats.filter(date=specific_date)
     elif specific_month:
         try:
             year, month = specific_month.split('-')
             qs = qs.filter(check_in_date__year=year, check_in_date__month=month)
+            stats = stats.filter(date__year=year, date__month=month)
         except ValueError:
             pass
     elif period == 'today':
-        qs = qs.filter(check_in_date__date=now.date())
+        qs = qs.filter(check_in_date__date=today)
+        stats = stats.filter(date=today)
     elif period == 'this_month':
-        qs = qs.filter(check_in_date__year=now.year, check_in_date__month=now.month)
+        qs = qs.filter(check_in_date__year=today.year, check_in_date__month=today.month)
+        stats = stats.filter(date__year=today.year, date__month=today.month)
     elif period == 'this_year':
-        qs = qs.filter(check_in_date__year=now.year)
+        qs = qs.filter(check_in_date__year=today.year)
+        stats = stats.filter(date__year=today.year)
 
     if gran == 'month':
-        annotated = qs.annotate(period=TruncMonth('check_in_date')).values('period').annotate(count=Count('id')).order_by('period')
+        annotated = stats.annotate(period=TruncMonth('date')).values('period').annotate(count=Sum('count')).order_by('period')
     elif gran == 'year':
-        annotated = qs.annotate(period=TruncYear('check_in_date')).values('period').annotate(count=Count('id')).order_by('period')
+        annotated = stats.annotate(period=TruncYear('date')).values('period').annotate(count=Sum('count')).order_by('period')
     else:
-        annotated = qs.annotate(period=TruncDay('check_in_date')).values('period').annotate(count=Count('id')).order_by('period')
+        annotated = stats.annotate(period=F('date')).values('period').annotate(count=Sum('count')).order_by('period')
 
     # Prepare results for template
 
-    results = [{'period': a['period'], 'count': a['count']} for a in annotated]
+    results = [{'period': a['period'], 'count': a['count']} for a in annotated if a['count']]
 
     # Tabular visits for admin view (Date, Patient ID, Doctor Name, Patient Name, Prescription)
     visits_qs = qs.select_related('patient', 'checked_in_by').order_by('-check_in_date')
     tabular_visits = []
-    from .models import Prescription
-    for v in visits_qs[:500]:
-        # find prescription(s) for this patient on the same day (if any)
-        pres = Prescription.objects.filter(patient=v.patient, prescription_date__date=v.check_in_date.date()).order_by('-prescription_date').first()
+    visits = list(visits_qs[:500])
+    # prescription(s) for each patient on the same day, resolved in one query
+    same_day_prescriptions = get_same_day_prescriptions(visits)
+    for v in visits:
+        pres = same_day_prescriptions.get(v.id)
         if pres and pres.doctor:
             doctor_name = f"Dr. {pres.doctor.user.first_name} {pres.doctor.user.last_name}".strip()
             prescription_link = pres.id
@@ -803,6 +1006,7 @@ def checkin_dashboard(request, clinic_slug=None):
             'doctor_name': doctor_name,
             'prescription_id': prescription_link,
             'visit_id': v.id,
+            'status': v.status,
         })
 
     # Recent visits list (kept for backward compatibility)
@@ -817,20 +1021,23 @@ def checkin_dashboard(request, clinic_slug=None):
         'results': results,
         'recent_visits': recent_visits,
         'tabular_visits': tabular_visits,
-        'total_visits': qs.count(),
+        'total_visits': stats.aggregate(total=Sum('count'))['total'] or 0,
+        'live_queue': live_queue_enabled(request),
     }
     return render(request, 'hospital/reception/checkin_dashboard.html', context)
 
 
 @login_required(login_url='login')
 @require_http_methods(["GET"])
-def checkin_dashboard_search(request, clinic_slug=None):
+@replica_read
+async def checkin_dashboard_search(request, clinic_slug=None):
     """AJAX endpoint for searching check-in records"""
-    if request.user.role not in ['super_admin', 'admin', 'receptionist']:
+    user = await request.auser()
+    if user.role not in ['super_admin', 'admin', 'receptionist']:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
 
     # Resolve clinic context
-    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
+    clinic = await aget_clinic_from_slug_or_middleware(clinic_slug, request, user)
     
     # Get search parameters
     search_q = request.GET.get('q', '').strip()
@@ -853,10 +1060,12 @@ def checkin_dashboard_search(request, clinic_slug=None):
     # Order by recent and limit results
     visits = qs.select_related('patient', 'checked_in_by').order_by('-check_in_date')[:limit]
     
-    # Format results with prescription info
+    # Format results with prescription info (one query for all rows)
+    visits = [v async for v in visits]
+    same_day_prescriptions = await sync_to_async(get_same_day_prescriptions)(visits)
     results = []
     for v in visits:
-        pres = Prescription.objects.filter(patient=v.patient, prescription_date__date=v.check_in_date.date()).order_by('-prescription_date').first()
+        pres = same_day_prescriptions.get(v.id)
         
         results.append({
             'id': v.id,
@@ -938,7 +1147,11 @@ def patients_without_login(request, clinic_slug=None):
     clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
     
     # Get patients without user accounts
-    patients_without_login = Patient.objects.filter(clinic=clinic, user__isnull=True).order_by('-registration_date')
+    patients_without_login = (
+        Patient.objects.filter(clinic=clinic, user__isnull=True)
+        .select_related('login_job')
+        .order_by('-registration_date')
+    )
     
     context = {
         'clinic': clinic,
@@ -949,6 +1162,26 @@ def patients_without_login(request, clinic_slug=None):
     return render(request, 'hospital/reception/patients_without_login.html', context)
 
 
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def enable_all_patient_logins(request, clinic_slug=None):
+    """Reception - Queue login creation for every patient without one"""
+    if request.user.role != 'receptionist':
+        return redirect('homepage')
+    
+    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
+    if not clinic:
+        return redirect('homepage')
+    
+    queued = enqueue_missing_logins(clinic=clinic)
+    if queued:
+        kick_worker()
+        messages.success(request, f"✅ Login creation queued for {queued} patient(s).")
+    else:
+        messages.info(request, "No patients are waiting for a login.")
+    return redirect('patients_without_login', clinic_slug=clinic.slug)
+
+
 @login_required(login_url='login')
 @require_http_methods(["GET", "POST"])
 def enable_patient_login(request, patient_id, clinic_slug=None):
@@ -972,28 +1205,18 @@ def enable_patient_login(request, patient_id, clinic_slug=None):
             patient.default_password = patient.generate_default_password()
             patient.save()
         
-        username = patient.patient_id.lower()
+        username = login_username(patient)
         password = patient.default_password
         
-        # Create User account
-        patient_user = User.objects.create_user(
-            username=username,
-            password=password,
-            email=f"{patient.phone_number}@patient.local",
-            clinic=clinic,
-            role='patient',
-        )
-        
-        # Link user to patient
-        patient.user = patient_user
-        patient.save()
+        # Queue the User account; it is created in the background
+        enqueue_patient_login(patient)
         
         messages.success(
             request,
-            f"✅ Login enabled for {patient.patient_name}!\n"
+            f"✅ Login is being set up for {patient.patient_name}!\n"
             f"Username: {username}\n"
             f"Password: {password}\n"
-            f"Patient can now login with these credentials!"
+            f"Patient can login with these credentials in a few moments."
         )
         
         if clinic_slug:
@@ -1112,10 +1335,33 @@ def update_checkin_status(request, visit_id, clinic_slug=None):
     return render(request, 'hospital/reception/update_checkin_status.html', context)
 
 
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+async def checkin_queue_stream(request, clinic_slug=None):
+    """Server-sent events: today's check-in queue, then live updates (see hospital.live_queue)"""
+    user = await request.auser()
+    if user.role not in ['doctor', 'receptionist', 'admin']:
+        return JsonResponse({'error': 'unauthorized'}, status=403)
+    # Under WSGI a stream would hold a worker thread for minutes
+    if not live_queue_enabled(request):
+        return JsonResponse({'error': 'live queue disabled'}, status=404)
+    # Resolved by TenantMiddleware; the cache lookup may hit the database
+    clinic = getattr(request, 'clinic', None) or await sync_to_async(get_clinic_by_slug)(clinic_slug)
+    if not clinic or clinic.pk != user.clinic_id:
+        return JsonResponse({'error': 'unknown clinic'}, status=404)
+
+    response = StreamingHttpResponse(event_stream(clinic), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # ==================== DOCTOR VIEWS ====================
 
 @login_required(login_url='login')
 @require_http_methods(["GET", "POST"])
+@query_budget(14)
 def doctor_dashboard(request, clinic_slug=None):
     """Doctor dashboard - View patients for prescription"""
     if request.user.role != 'doctor':
@@ -1130,28 +1376,20 @@ def doctor_dashboard(request, clinic_slug=None):
     # Resolve clinic: URL slug -> middleware -> user's clinic -> doctor's clinic
     clinic = getattr(request, 'clinic', None)
     if not clinic and clinic_slug:
-        try:
-            clinic = Clinic.objects.get(slug=clinic_slug)
-        except Clinic.DoesNotExist:
-            clinic = None
+        clinic = get_clinic_by_slug(clinic_slug)
     if not clinic and getattr(request.user, 'clinic', None):
         clinic = request.user.clinic
     if not clinic and getattr(doctor, 'clinic', None):
         clinic = doctor.clinic
     
-    # Get clinic-specific patients
+    # Get clinic-specific patients (optionally filtered by name)
+    search_query = request.GET.get('search', '').strip()
+    patients = get_doctor_patients(clinic, search_query)
     if clinic:
-        patients = Patient.objects.filter(clinic=clinic).order_by('-registration_date')
         prescriptions = Prescription.objects.filter(doctor=doctor, clinic=clinic).order_by('-prescription_date')
     else:
-        patients = Patient.objects.all().order_by('-registration_date')
         prescriptions = Prescription.objects.filter(doctor=doctor).order_by('-prescription_date')
     
-    # Search filter for patients
-    search_query = request.GET.get('search', '').strip()
-    if search_query:
-        patients = patients.filter(patient_name__icontains=search_query)
-    
     pending_prescriptions = prescriptions.filter(status='pending')
     pending_test_results = Test.objects.filter(prescription__doctor=doctor, clinic=clinic, is_completed=False) if clinic else Test.objects.filter(prescription__doctor=doctor, is_completed=False)
     
@@ -1177,17 +1415,21 @@ def doctor_dashboard(request, clinic_slug=None):
         todays_consultations = todays_consultations.filter(patient__patient_name__icontains=checkin_search)
     
     # Get patients who already have prescriptions (hide from list)
-    patients_with_prescriptions = set(Prescription.objects.filter(doctor=doctor, clinic=clinic, prescription_date=today).values_list('patient_id', flat=True))
+    patients_with_prescriptions = get_patients_prescribed_today(doctor, clinic)
     print(f"Doctor Dashboard: Patients with prescriptions today: {patients_with_prescriptions}")
-    available_patients = patients.exclude(id__in=patients_with_prescriptions)
+    # First page only; the rest is loaded on scroll from doctor_dashboard_patients_ajax
+    available_patients = KeysetPaginator(patients.exclude(id__in=patients_with_prescriptions), 'recent').page()
     
-    # Get today's check-ins without prescriptions
-    todays_checkins_without_prescription = todays_consultations.exclude(patient_id__in=patients_with_prescriptions)
+    # Get today's check-ins without prescriptions (the cards show the patient)
+    todays_checkins_without_prescription = (
+        todays_consultations.exclude(patient_id__in=patients_with_prescriptions).select_related('patient')
+    )
     
     context = {
         'doctor': doctor,
         'clinic': clinic,
-        'patients': available_patients,
+        'patients': available_patients.items,
+        'next_cursor': available_patients.next_cursor,
         'prescriptions': prescriptions,
         'pending_prescriptions': pending_prescriptions,
         'pending_test_results': pending_test_results,
@@ -1195,32 +1437,53 @@ def doctor_dashboard(request, clinic_slug=None):
         'total_patients': patients.count(),
         'search_query': search_query,
         'checkin_search': checkin_search,
+        'live_queue': live_queue_enabled(request),
     }
     return render(request, 'hospital/doctor/dashboard.html', context)
 
 
 @login_required(login_url='login')
 @require_http_methods(["GET"])
-def doctor_dashboard_prescriptions_ajax(request, clinic_slug=None):
-    """AJAX endpoint for prescription pagination and search in dashboard"""
+@query_budget(6)
+def doctor_dashboard_patients_ajax(request, clinic_slug=None):
+    """AJAX endpoint: next page of the doctor dashboard patient cards"""
     if request.user.role != 'doctor':
         return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
-    
+
     try:
         doctor = Doctor.objects.get(user=request.user)
     except Doctor.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Doctor profile not found'}, status=404)
+
+    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request) or doctor.clinic
+    search_query = request.GET.get('search', '').strip()
+    patients = get_doctor_patients(clinic, search_query).exclude(
+        id__in=get_patients_prescribed_today(doctor, clinic)
+    )
+    return patient_page_json(request, patients, 'hospital/doctor/patient_cards.html', {'clinic': clinic})
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+@query_budget(6)
+async def doctor_dashboard_prescriptions_ajax(request, clinic_slug=None):
+    """AJAX endpoint for prescription pagination and search in dashboard"""
+    user = await request.auser()
+    if user.role != 'doctor':
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+    
+    try:
+        doctor = await Doctor.objects.select_related('clinic').aget(user=user)
+    except Doctor.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Doctor profile not found'}, status=404)
     
     # Resolve clinic
     clinic = getattr(request, 'clinic', None)
     if not clinic and clinic_slug:
-        try:
-            clinic = Clinic.objects.get(slug=clinic_slug)
-        except Clinic.DoesNotExist:
-            clinic = None
-    if not clinic and getattr(request.user, 'clinic', None):
-        clinic = request.user.clinic
-    if not clinic and getattr(doctor, 'clinic', None):
+        clinic = await sync_to_async(get_clinic_by_slug)(clinic_slug)
+    if not clinic and user.clinic:
+        clinic = user.clinic
+    if not clinic and doctor.clinic:
         clinic = doctor.clinic
     
     # Get prescriptions
@@ -1241,17 +1504,19 @@ def doctor_dashboard_prescriptions_ajax(request, clinic_slug=None):
     if status_filter in ['pending', 'completed', 'cancelled']:
         prescriptions = prescriptions.filter(status=status_filter)
     
-    # Pagination
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    page = request.GET.get('page', 1)
-    paginator = Paginator(prescriptions, 10)  # 10 items per page
-    
+    # Pagination (Paginator counts synchronously; same rules: 10 per page,
+    # a non-numeric page -> 1, out of range -> the last page)
+    per_page = 10
+    total_count = await prescriptions.acount()
+    total_pages = max(1, -(-total_count // per_page))
     try:
-        page_obj = paginator.page(page)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+        page = int(request.GET.get('page', 1))
+    except (TypeError, ValueError):
+        page = 1
+    if page < 1 or page > total_pages:
+        page = total_pages
+    offset = (page - 1) * per_page
+    page_rows = prescriptions.select_related('patient')[offset:offset + per_page]
     
     # Build prescription data
     prescriptions_data = []
@@ -1259,7 +1524,7 @@ def doctor_dashboard_prescriptions_ajax(request, clinic_slug=None):
     from django.utils import timezone
     ist_tz = pytz.timezone('Asia/Kolkata')
     
-    for rx in page_obj:
+    async for rx in page_rows:
         # Convert prescription_date to IST
         rx_date = rx.prescription_date
         if timezone.is_naive(rx_date):
@@ -1274,8 +1539,8 @@ def doctor_dashboard_prescriptions_ajax(request, clinic_slug=None):
             'date_short': rx_date_ist.strftime('%d %b %Y'),
             'status': rx.get_status_display(),
             'status_value': rx.status,
-            'tests_count': rx.tests.count(),
-            'medicines_count': rx.medicines.count(),
+            'tests_count': rx.tests_count,
+            'medicines_count': rx.medicines_count,
             'clinic_slug': clinic.slug if clinic else '',
         })
     
@@ -1283,11 +1548,11 @@ def doctor_dashboard_prescriptions_ajax(request, clinic_slug=None):
         'success': True,
         'prescriptions': prescriptions_data,
         'pagination': {
-            'current_page': page_obj.number,
-            'total_pages': paginator.num_pages,
-            'total_count': paginator.count,
-            'has_next': page_obj.has_next(),
-            'has_previous': page_obj.has_previous(),
+            'current_page': page,
+            'total_pages': total_pages,
+            'total_count': total_count,
+            'has_next': page < total_pages,
+            'has_previous': page > 1,
         }
     })
 
@@ -1360,35 +1625,58 @@ def create_prescription(request, patient_id, clinic_slug=None):
     context = {'patient': patient, 'clinic': clinic}
     return render(request, 'hospital/doctor/create_prescription.html', context)
 
+# AJAX actions of add_prescription_details -> the one-to-one row they edit
+PRESCRIPTION_ACTIONS = {
+    'add_medicine': None,
+    'add_test': None,
+    'save_vitals': 'vitals',
+    'save_notes': 'doctor_notes',
+}
+
+
+def load_prescription_workspace(prescription_id):
+    """
+    The prescription with everything the add-details page shows: patient,
+    doctor, vitals and notes in one query, medicines and tests in one each.
+    """
+    return get_object_or_404(
+        Prescription.objects.select_related('patient', 'doctor__user', 'vitals', 'doctor_notes')
+        .prefetch_related('medicines', 'tests'),
+        id=prescription_id,
+    )
+
+
+def latest_patient_visit(prescription, clinic):
+    return PatientVisit.objects.filter(
+        patient_id=prescription.patient_id,
+        clinic=clinic
+    ).order_by("-check_in_date").first()
+
+
 @login_required(login_url='login')
 @require_http_methods(["GET", "POST"])
+@query_budget(10)
 def add_prescription_details(request, prescription_id, clinic_slug=None):
 
     if request.user.role != 'doctor':
         return redirect('homepage')
 
     clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
-    prescription = get_object_or_404(Prescription, id=prescription_id)
-    doctor = Doctor.objects.get(user=request.user)
+    action = request.POST.get("action") if request.method == "POST" else None
 
-    if prescription.doctor != doctor:
-        return redirect('doctor_dashboard')
-
-    tests = prescription.tests.all()
-    medicines = prescription.medicines.all()
-    doctor_notes = getattr(prescription, "doctor_notes", None)
-
-    latest_visit = PatientVisit.objects.filter(
-        patient=prescription.patient,
-        clinic=clinic
-    ).order_by("-check_in_date").first()
+    if action in PRESCRIPTION_ACTIONS:
+        # A doctor fires dozens of these per consultation: load only the
+        # prescription, its doctor (ownership) and the row the action edits
+        related = ['doctor'] + ([PRESCRIPTION_ACTIONS[action]] if PRESCRIPTION_ACTIONS[action] else [])
+        prescription = get_object_or_404(Prescription.objects.select_related(*related), id=prescription_id)
+    else:
+        prescription = load_prescription_workspace(prescription_id)
 
-    vitals = Vitals.objects.filter(prescription=prescription).first()
+    if prescription.doctor.user_id != request.user.pk:
+        return redirect('doctor_dashboard')
 
     if request.method == "POST":
 
-        action = request.POST.get("action")
-
         # ---------------- ADD MEDICINE (AJAX)
         if action == "add_medicine":
 
@@ -1397,8 +1685,9 @@ def add_prescription_details(request, prescription_id, clinic_slug=None):
             if form.is_valid():
                 med = form.save(commit=False)
                 med.prescription = prescription
-                med.clinic = prescription.clinic
-                med.save()
+                med.clinic_id = prescription.clinic_id
+                with prescription_items_atomic():
+                    med.save()
 
                 # ✅ ADD THIS BLOCK
                 MasterMedicine.objects.get_or_create(
@@ -1438,7 +1727,8 @@ def add_prescription_details(request, prescription_id, clinic_slug=None):
                 test = form.save(commit=False)
                 test.prescription = prescription
                 test.clinic = clinic
-                test.save()
+                with prescription_items_atomic():
+                    test.save()
 
                 # Auto-create master test if not exist
                 master_test = MasterTest.objects.filter(
@@ -1510,8 +1800,10 @@ def add_prescription_details(request, prescription_id, clinic_slug=None):
                 notes = notes_form.save(commit=False)
                 notes.prescription = prescription
                 notes.clinic = clinic
-                if not notes.checkin_purpose and latest_visit:
-                    notes.checkin_purpose = latest_visit.purpose
+                if not notes.checkin_purpose:
+                    latest_visit = latest_patient_visit(prescription, clinic)
+                    if latest_visit:
+                        notes.checkin_purpose = latest_visit.purpose
                 notes.save()
 
                 return JsonResponse({
@@ -1532,6 +1824,13 @@ def add_prescription_details(request, prescription_id, clinic_slug=None):
             })
     # ---------------- GET REQUEST (PAGE LOAD)
 
+    tests = prescription.tests.all()
+    medicines = prescription.medicines.all()
+    doctor_notes = getattr(prescription, "doctor_notes", None)
+    vitals = getattr(prescription, "vitals", None)
+    # Only needed to prefill the check-in purpose of new notes
+    latest_visit = None if doctor_notes else latest_patient_visit(prescription, clinic)
+
     test_form = TestForm()
     medicine_form = MedicineForm()
     if doctor_notes:
@@ -1556,6 +1855,7 @@ def add_prescription_details(request, prescription_id, clinic_slug=None):
         "notes_form": notes_form,
         "vitals": vitals,
         "latest_visit": latest_visit,
+        "catalog_version": catalog_version(clinic) if clinic else 0,
     }
 
     return render(request, "hospital/doctor/add_prescription_details.html", context)
@@ -1617,153 +1917,69 @@ def complete_prescription(request, prescription_id, clinic_slug=None):
     return render(request, 'hospital/doctor/complete_prescription.html', context)
 
 
-@login_required(login_url='login')
-def print_prescription(request, prescription_id, clinic_slug=None):
-    """Print prescription as PDF/printable format"""
-    # prescription = get_object_or_404(Prescription, id=prescription_id)
-    prescription = get_object_or_404(
-        Prescription.objects.select_related(
-            'patient', 'doctor__user', 'clinic'
-        ).prefetch_related('medicines', 'tests'),
-        id=prescription_id
-    )
-    
-    # Check if user is the doctor who created it or the patient
+def prescription_access_redirect(request, prescription, clinic_slug=None):
+    """Redirect unless the user is the prescribing doctor or the patient"""
     if request.user.role == 'doctor':
         doctor = Doctor.objects.get(user=request.user)
-        if prescription.doctor != doctor:
+        if prescription.doctor_id != doctor.id:
             if clinic_slug:
                 return redirect('doctor_dashboard', clinic_slug=clinic_slug)
             return redirect('doctor_dashboard')
     elif request.user.role == 'patient':
         patient = Patient.objects.get(user=request.user)
-        if prescription.patient != patient:
+        if prescription.patient_id != patient.id:
             return redirect('patient_dashboard')
     else:
         return redirect('homepage')
-    
-    tests = prescription.tests.all()
-    medicines = prescription.medicines.all()
-    doctor_notes = prescription.doctor_notes if hasattr(prescription, 'doctor_notes') else None
-    vitals = getattr(prescription, 'vitals', None)
-    all_doctors = Doctor.objects.filter(clinic=prescription.clinic)
-    primary_medical = prescription.clinic.associated_medicals.filter(
-            is_primary=True,
-            is_active=True
-        ).first()
-
-    schedule_map = {
-        "morning": (1, 0, 0),
-        "afternoon": (0, 1, 0),
-        "night": (0, 0, 1),
-        "morning_evening": (1, 0, 1),
-        "morning_night": (1, 0, 1),
-        "afternoon_night": (0, 1, 1),
-        "morning_afternoon_night": (1, 1, 1),
-        "sos": (0, 0, 0),
-    }
-
-    for med in medicines:
-        # ✅ Core fix
-        med.schedule_counts = schedule_map.get(med.schedule, (0, 0, 0))
-
-        # ✅ Display helpers
-        med.frequency_display = (med.frequency_per_day or "")
-        med.food_instruction = (med.food_instruction or "-").title()
+    return None
 
-        # ✅ Doctor-friendly format (1-0-1)
-        med.dose_pattern = f"{med.schedule_counts[0]}-{med.schedule_counts[1]}-{med.schedule_counts[2]}"
 
-        # ✅ Duration safe handling
-        med.duration_display = med.duration or "-"
-        
+@login_required(login_url='login')
+def print_prescription(request, prescription_id, clinic_slug=None):
+    """Print prescription as PDF/printable format"""
+    prescription = get_object_or_404(prescription_queryset(), id=prescription_id)
     
-    context = {
-        'prescription': prescription,
-        'tests': tests,
-        'medicines': medicines,
-        'doctor_notes': doctor_notes,
-        'vitals': vitals,
-        'doctors': all_doctors,
-        'primary_medical': primary_medical,
-    }
+    # Check if user is the doctor who created it or the patient
+    denied = prescription_access_redirect(request, prescription, clinic_slug)
+    if denied:
+        return denied
+    
+    download_name = 'download_prescription_patient' if request.user.role == 'patient' else 'download_prescription'
+    context = build_prescription_context(prescription)
+    context['download_url'] = reverse(download_name, kwargs={
+        'clinic_slug': clinic_slug or prescription.clinic.slug,
+        'prescription_id': prescription.id,
+    })
     return render(request, 'hospital/print_prescription.html', context)
 
 
 @login_required(login_url='login')
 def download_prescription(request, prescription_id, clinic_slug=None):
-    """Download prescription as PDF with same format as print view"""
-    prescription = get_object_or_404(
-        Prescription.objects.select_related(
-            'patient', 'doctor__user', 'clinic'
-        ).prefetch_related('medicines', 'tests'),
-        id=prescription_id
-    )
+    """Download prescription as a server-rendered PDF with the print layout"""
+    prescription = get_object_or_404(Prescription.objects.select_related('patient'), id=prescription_id)
     
     # Check if user is the doctor who created it or the patient
-    if request.user.role == 'doctor':
-        doctor = Doctor.objects.get(user=request.user)
-        if prescription.doctor != doctor:
-            if clinic_slug:
-                return redirect('doctor_dashboard', clinic_slug=clinic_slug)
-            return redirect('doctor_dashboard')
-    elif request.user.role == 'patient':
-        patient = Patient.objects.get(user=request.user)
-        if prescription.patient != patient:
-            return redirect('patient_dashboard')
-    else:
-        return redirect('homepage')
-    
-    tests = prescription.tests.all()
-    medicines = prescription.medicines.all()
-    doctor_notes = prescription.doctor_notes if hasattr(prescription, 'doctor_notes') else None
-    vitals = getattr(prescription, 'vitals', None)
-    all_doctors = Doctor.objects.filter(clinic=prescription.clinic)
-    primary_medical = prescription.clinic.associated_medicals.filter(
-            is_primary=True,
-            is_active=True
-        ).first()
-
-    schedule_map = {
-        "morning": (1, 0, 0),
-        "afternoon": (0, 1, 0),
-        "night": (0, 0, 1),
-        "morning_evening": (1, 0, 1),
-        "morning_night": (1, 0, 1),
-        "afternoon_night": (0, 1, 1),
-        "morning_afternoon_night": (1, 1, 1),
-        "sos": (0, 0, 0),
-    }
-
-    for med in medicines:
-        med.schedule_counts = schedule_map.get(med.schedule, (0, 0, 0))
-        med.frequency_display = (med.frequency_per_day or "")
-        med.food_instruction = (med.food_instruction or "-").title()
-        med.dose_pattern = f"{med.schedule_counts[0]}-{med.schedule_counts[1]}-{med.schedule_counts[2]}"
-        med.duration_display = med.duration or "-"
-        
-    context = {
-        'prescription': prescription,
-        'tests': tests,
-        'medicines': medicines,
-        'doctor_notes': doctor_notes,
-        'vitals': vitals,
-        'doctors': all_doctors,
-        'primary_medical': primary_medical,
-        'hide_controls': True,  # Hide print controls in downloaded PDF
-    }
+    denied = prescription_access_redirect(request, prescription, clinic_slug)
+    if denied:
+        return denied
     
-    # Render the same template used for printing
-    # The client-side html2pdf.js library will convert this to PDF
-    # This ensures the PDF looks exactly like the print preview
-    html_string = render_to_string('hospital/print_prescription.html', context)
+    size = request.GET.get('size', DEFAULT_PAGE_SIZE).upper()
+    if size not in PAGE_SIZES:
+        size = DEFAULT_PAGE_SIZE
     
-    # Return as HTML for client-side PDF generation
-    # This lets html2pdf.js on the frontend convert it to PDF with exact formatting
-    response = HttpResponse(html_string, content_type='text/html; charset=utf-8')
-    response['Content-Disposition'] = f'inline; filename="prescription_{prescription.id}.html"'
+    # Served from the PDF cache unless the prescription changed since the last render
+    pdf, digest = get_prescription_pdf(prescription, size)
     
-    print(f"✅ Prescription {prescription.id} prepared for PDF download (client-side generation)")
+    etag = f'"{digest}-{size}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(pdf, content_type='application/pdf')
+        filename = f"prescription_{prescription.id}_{prescription.patient.patient_name.replace(' ', '_')}.pdf"
+        # Quotes, semicolons and non-Latin-1 names (Devanagari) need RFC 6266 encoding
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
     return response
 
 
@@ -1806,8 +2022,8 @@ def share_prescription(request, prescription_id, clinic_slug=None):
         patient_name = prescription.patient.patient_name
         doctor_name = f"Dr. {prescription.doctor.user.first_name} {prescription.doctor.user.last_name}"
         prescription_date = prescription.prescription_date.strftime("%d %B %Y")
-        medicines_count = prescription.medicines.count()
-        tests_count = prescription.tests.count()
+        medicines_count = prescription.medicines_count
+        tests_count = prescription.tests_count
         
         message = (
             f"Hello {patient_name},\n\n"
@@ -1870,7 +2086,8 @@ def delete_medicine(request, medicine_id, clinic_slug=None):
         return JsonResponse({"success": False})
 
     medicine = get_object_or_404(Medicine, id=medicine_id)
-    medicine.delete()
+    with prescription_items_atomic():
+        medicine.delete()
 
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
         return JsonResponse({
@@ -1896,7 +2113,8 @@ def delete_test(request, test_id, clinic_slug=None):
         return JsonResponse({"success": False})
 
     test = get_object_or_404(Test, id=test_id)
-    test.delete()
+    with prescription_items_atomic():
+        test.delete()
 
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
         return JsonResponse({
@@ -1916,6 +2134,7 @@ def delete_test(request, test_id, clinic_slug=None):
 
 
 @login_required(login_url='login')
+@replica_read
 def patient_history(request, patient_id, clinic_slug=None):
     """Doctor - View patient's complete history"""
     # Allow doctors, clinic admins, and superadmins to view patient history
@@ -1959,10 +2178,7 @@ def patient_dashboard(request, clinic_slug=None):
     # Resolve clinic: URL slug -> middleware -> user's clinic -> patient's clinic
     clinic = getattr(request, 'clinic', None)
     if not clinic and clinic_slug:
-        try:
-            clinic = Clinic.objects.get(slug=clinic_slug)
-        except Clinic.DoesNotExist:
-            clinic = None
+        clinic = get_clinic_by_slug(clinic_slug)
     if not clinic and getattr(request.user, 'clinic', None):
         clinic = request.user.clinic
     if not clinic and getattr(patient, 'clinic', None):
@@ -2260,7 +2476,9 @@ def add_master_test(request, clinic_slug):
         if not test_name or not test_type:
             return JsonResponse({"success": False, "error": "Missing test name or type"})
 
-        clinic = Clinic.objects.get(slug=clinic_slug)
+        clinic = get_clinic_by_slug(clinic_slug)
+        if not clinic:
+            return JsonResponse({"success": False, "error": "Clinic not found"})
 
         # Check if test already exists
         if MasterTest.objects.filter(clinic=clinic, test_name=test_name).exists():
@@ -2343,43 +2561,58 @@ def edit_master_test(request, clinic_slug, test_id):
 # ---------------------------- #
 # Medicine API
 # ---------------------------- #
+def _master_catalog_etag(request, clinic_slug=None):
+    """ETag for the master data APIs; remembers the version for the view"""
+    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request) or getattr(request.user, 'clinic', None)
+    if not clinic:
+        return None
+    request.catalog_version = catalog_version(clinic)
+    return catalog_etag(clinic, request.catalog_version, request.user.id)
+
+
+def async_condition(etag_func):
+    """condition(etag_func=...) for async views; the ETag function runs in a thread (it queries)"""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def inner(request, *args, **kwargs):
+            # Load the user once, for the ETag function and the view
+            request.user = await request.auser()
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view_func(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
 @login_required
 @require_http_methods(["GET"])
-def api_master_medicines(request, clinic_slug=None):
+@async_condition(_master_catalog_etag)
+@query_budget(6)
+async def api_master_medicines(request, clinic_slug=None):
     """
     AJAX API - Get medicines for autocomplete
     """
+    user = await request.auser()
     # Resolve clinic
-    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request) or getattr(request.user, 'clinic', None)
+    clinic = await aget_clinic_from_slug_or_middleware(clinic_slug, request, user) or user.clinic
     if not clinic:
         return JsonResponse({'error': 'Clinic not found'}, status=400)
 
     # Search query
     q = request.GET.get('q', '').strip()
 
-    # Query medicines
-    medicines = MasterMedicine.objects.filter(clinic=clinic, is_active=True)
-    if q:
-        medicines = medicines.filter(medicine_name__icontains=q)
+    # Answered from the in-memory index, this doctor's usual medicines first
+    # (a thread: building a missing or stale index queries the database)
+    data = await sync_to_async(search_medicines)(clinic, q, user_id=user.id, version=request.catalog_version)
 
-    # Prepare JSON
-    data = [
-        {
-            "id": m.id,
-            "name": m.medicine_name,
-            "type": m.medicine_type,
-            "default_dosage": m.default_dosage,
-            "frequency_per_day": m.frequency_per_day,
-            "default_schedule": m.default_schedule,
-            "default_duration": m.default_duration,
-            "food_instruction": m.food_instruction,
-            "display": f"{m.medicine_name} ({m.default_dosage}) - {m.medicine_type}"
-        }
-        for m in medicines[:20]
-    ]
-    print("MEDICINE DATA:" , data)
-
-    return JsonResponse(data, safe=False)
+    response = JsonResponse(data, safe=False)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 # ---------------------------- #
 # Test API
@@ -2387,8 +2620,11 @@ def api_master_medicines(request, clinic_slug=None):
 
 @login_required
 @require_http_methods(["GET"])
-def api_master_tests(request, clinic_slug=None):
-    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request) or getattr(request.user, 'clinic', None)
+@async_condition(_master_catalog_etag)
+@query_budget(5)
+async def api_master_tests(request, clinic_slug=None):
+    user = await request.auser()
+    clinic = await aget_clinic_from_slug_or_middleware(clinic_slug, request, user) or user.clinic
     if not clinic:
         return JsonResponse({"error": "Clinic not found"}, status=400)
     test_type = request.GET.get("test_type")
@@ -2400,26 +2636,45 @@ def api_master_tests(request, clinic_slug=None):
 
     if test_type:
         tests = tests.filter(test_type=test_type)
-        print(f"Filtering tests by type: {test_type}")
     tests = tests.order_by("test_name")[:50]
 
-    data = [
-        {
-            "id": t.id,
-            "test_name": t.test_name,
-            "test_type": t.get_test_type_display(),
-        }
-        for t in tests
-    ]
+    data = [test_payload(t) async for t in tests]
 
-    print("TEST DATA:", data)
+    response = JsonResponse(data, safe=False)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-    return JsonResponse(data, safe=False)
+# ---------------------------- #
+# Catalog snapshot API
+# ---------------------------- #
+
+@login_required
+@require_http_methods(["GET"])
+@condition(etag_func=_master_catalog_etag)
+@query_budget(6)
+def api_master_catalog(request, clinic_slug=None):
+    """
+    All active medicines and tests in one response, filtered in the browser.
+    Requested as ?v=<catalog version>; that URL may be reused until the
+    version changes.
+    """
+    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request) or getattr(request.user, 'clinic', None)
+    if not clinic:
+        return JsonResponse({"error": "Clinic not found"}, status=400)
+
+    version = request.catalog_version
+    response = JsonResponse(catalog_snapshot(clinic, version, user_id=request.user.id))
+    if request.GET.get('v') == str(version):
+        patch_cache_control(response, private=True, max_age=SNAPSHOT_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 # ==================== ADMIN VIEWS ====================
 
 @login_required(login_url='login')
 @login_required(login_url='login')
+@replica_read
 def admin_dashboard(request, clinic_slug=None):
     """Admin dashboard"""
     if request.user.role != 'admin':
@@ -2428,10 +2683,7 @@ def admin_dashboard(request, clinic_slug=None):
     # Resolve clinic: URL slug -> middleware -> user's clinic
     clinic = getattr(request, 'clinic', None)
     if not clinic and clinic_slug:
-        try:
-            clinic = Clinic.objects.get(slug=clinic_slug)
-        except Clinic.DoesNotExist:
-            clinic = None
+        clinic = get_clinic_by_slug(clinic_slug)
     if not clinic and getattr(request.user, 'clinic', None):
         clinic = request.user.clinic
     
@@ -2479,10 +2731,7 @@ def create_doctor(request, clinic_slug=None):
     # Resolve clinic: URL slug -> middleware -> user's clinic
     clinic = getattr(request, 'clinic', None)
     if not clinic and clinic_slug:
-        try:
-            clinic = Clinic.objects.get(slug=clinic_slug)
-        except Clinic.DoesNotExist:
-            clinic = None
+        clinic = get_clinic_by_slug(clinic_slug)
     if not clinic and getattr(request.user, 'clinic', None):
         clinic = request.user.clinic
     
@@ -2573,11 +2822,133 @@ def view_all_patients(request, clinic_slug=None):
     if not clinic:
         return redirect('homepage')
     
-    patients = Patient.objects.all_clinics().filter(clinic=clinic).order_by('-registration_date')
-    context = {'patients': patients, 'clinic': clinic}
+    patients = Patient.objects.all_clinics().filter(clinic=clinic)
+    page = KeysetPaginator(patients.select_related('registered_by'), 'recent').page()
+    context = {
+        'patients': page.items,
+        'next_cursor': page.next_cursor,
+        'total_patients': patients.count(),
+        'clinic': clinic,
+    }
     return render(request, 'hospital/admin/view_all_patients.html', context)
 
 
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def view_all_patients_page(request, clinic_slug=None):
+    """AJAX endpoint: next page of the admin patient list"""
+    if request.user.role != 'admin':
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+
+    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
+    if not clinic:
+        return JsonResponse({'success': False, 'error': 'Clinic not found'}, status=404)
+
+    patients = Patient.objects.all_clinics().filter(clinic=clinic).select_related('registered_by')
+    return patient_page_json(request, patients, 'hospital/admin/patient_rows.html', {'clinic': clinic})
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET", "POST"])
+def import_patients(request, clinic_slug=None):
+    """Admin - Bulk import patients from a CSV/XLSX upload"""
+    if request.user.role != 'admin':
+        return redirect('homepage')
+    
+    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
+    if not clinic:
+        return redirect('homepage')
+    
+    result = None
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, "Please choose a CSV or XLSX file to import.")
+        else:
+            importer = PatientImporter(
+                clinic,
+                registered_by=request.user,
+                create_logins=bool(request.POST.get('create_logins')),
+            )
+            try:
+                result = importer.import_file(upload.file, upload.name)
+            except PatientImportError as e:
+                messages.error(request, str(e))
+            else:
+                if result.logins_queued:
+                    kick_worker()
+                messages.success(request, f"Import finished: {result}")
+    
+    context = {
+        'clinic': clinic,
+        'result': result,
+        'errors': result.errors[:100] if result else [],
+    }
+    return render(request, 'hospital/admin/import_patients.html', context)
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET", "POST"])
+def export_prescriptions(request, clinic_slug=None):
+    """Admin - Download every prescription in a date range as a ZIP or merged PDF"""
+    if request.user.role != 'admin':
+        return redirect('homepage')
+    
+    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
+    if not clinic:
+        return redirect('homepage')
+    
+    from datetime import datetime
+    from django.utils import timezone
+    
+    doctors = Doctor.objects.filter(clinic=clinic).select_related('user')
+    today = timezone.localdate()
+    form_values = {
+        'date_from': request.POST.get('date_from', today.replace(day=1).isoformat()),
+        'date_to': request.POST.get('date_to', today.isoformat()),
+        'doctor': request.POST.get('doctor', ''),
+        'format': request.POST.get('format', EXPORT_FORMATS[0]),
+        'size': request.POST.get('size', DEFAULT_PAGE_SIZE),
+    }
+    
+    if request.method == 'POST':
+        try:
+            date_from = datetime.strptime(form_values['date_from'], '%Y-%m-%d').date()
+            date_to = datetime.strptime(form_values['date_to'], '%Y-%m-%d').date()
+        except ValueError:
+            date_from = date_to = None
+        doctor = doctors.filter(id=form_values['doctor']).first() if form_values['doctor'].isdigit() else None
+        size = form_values['size'] if form_values['size'] in PAGE_SIZES else DEFAULT_PAGE_SIZE
+        
+        if not date_from or not date_to or date_from > date_to:
+            messages.error(request, "Please choose a valid date range.")
+        else:
+            items = prescriptions_for_export(clinic, date_from, date_to, doctor=doctor)
+            name = f"prescriptions_{clinic.slug}_{date_from:%Y%m%d}-{date_to:%Y%m%d}"
+            if not items.exists():
+                messages.warning(request, "No prescriptions found for this range.")
+            else:
+                if form_values['format'] == 'pdf':
+                    chunks = stream_merged_pdf(items.iterator(), size)
+                    filename, content_type = f"{name}.pdf", 'application/pdf'
+                else:
+                    chunks = stream_zip(items.iterator(), size)
+                    filename, content_type = f"{name}.zip", 'application/zip'
+                if isinstance(request, ASGIRequest):
+                    chunks = astream(chunks)
+                response = StreamingHttpResponse(chunks, content_type=content_type)
+                response['Content-Disposition'] = content_disposition_header(True, filename)
+                return response
+    
+    context = {
+        'clinic': clinic,
+        'doctors': doctors,
+        'values': form_values,
+        'page_sizes': list(PAGE_SIZES),
+    }
+    return render(request, 'hospital/admin/export_prescriptions.html', context)
+
+
 @login_required(login_url='login')
 def view_all_doctors(request, clinic_slug=None):
     """Admin - View all doctors"""
@@ -3001,6 +3372,7 @@ def upload_admission_report(request, admission_id, clinic_slug=None):
 # ============================================================================
 
 @login_required
+@query_budget(8)
 def list_prescription_templates(request, clinic_slug=None):
     """List all prescription templates for the doctor"""
     if request.user.role != 'doctor':
@@ -3012,7 +3384,10 @@ def list_prescription_templates(request, clinic_slug=None):
     templates = StandardPrescriptionTemplate.objects.filter(
         clinic=clinic, 
         doctor=doctor
-    ).prefetch_related('medicines', 'tests')
+    ).annotate(
+        medicines_count=Count('medicines', distinct=True),
+        tests_count=Count('tests', distinct=True),
+    )
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         # AJAX request - return JSON
@@ -3022,8 +3397,8 @@ def list_prescription_templates(request, clinic_slug=None):
                     'id': t.id,
                     'name': t.name,
                     'description': t.description,
-                    'medicines_count': t.medicines.count(),
-                    'tests_count': t.tests.count(),
+                    'medicines_count': t.medicines_count,
+                    'tests_count': t.tests_count,
                     'is_active': t.is_active,
                     'created_at': t.created_at.strftime('%Y-%m-%d %H:%M'),
                 }
@@ -3242,13 +3617,14 @@ def delete_prescription_template(request, template_id, clinic_slug=None):
 
 
 @login_required
-def search_prescription_templates(request, clinic_slug=None):
+async def search_prescription_templates(request, clinic_slug=None):
     """Search prescription templates by keyword (AJAX)"""
-    if request.user.role != 'doctor':
+    user = await request.auser()
+    if user.role != 'doctor':
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
-    clinic = get_clinic_from_slug_or_middleware(clinic_slug, request)
-    doctor = Doctor.objects.get(user=request.user)
+    clinic = await aget_clinic_from_slug_or_middleware(clinic_slug, request, user)
+    doctor = await Doctor.objects.aget(user=user)
     
     query = request.GET.get('q', '').strip()
     
@@ -3258,6 +3634,9 @@ def search_prescription_templates(request, clinic_slug=None):
         is_active=True
     ).filter(
         Q(name__icontains=query) | Q(keyword__icontains=query) | Q(description__icontains=query)
+    ).annotate(
+        medicines_count=Count('medicines', distinct=True),
+        tests_count=Count('tests', distinct=True),
     )
     
     data = {
@@ -3267,10 +3646,10 @@ def search_prescription_templates(request, clinic_slug=None):
                 'name': t.name,
                 'description': t.description,
                 'keyword': t.keyword,
-                'medicines_count': t.medicines.count(),
-                'tests_count': t.tests.count(),
+                'medicines_count': t.medicines_count,
+                'tests_count': t.tests_count,
             }
-            for t in templates[:10]  # Limit to 10 results
+            async for t in templates[:10]  # Limit to 10 results
         ]
     }
     return JsonResponse(data)
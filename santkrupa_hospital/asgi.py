@@ -3,6 +3,12 @@ ASGI config for santkrupa_hospital project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the site through this module (e.g. ``uvicorn santkrupa_hospital.asgi:application``)
+to use the live check-in queue: its event streams (hospital.live_queue) are
+async views that stay open without holding a worker thread. The JSON search
+and autocomplete endpoints are async views too; `manage.py handler_benchmark`
+compares their throughput under WSGI and ASGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
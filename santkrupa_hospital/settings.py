@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,11 +45,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'hospital.metrics.RequestMetricsMiddleware',  # Per-view query count / latency (/ops/metrics/)
+    'hospital.sqlite_production.SerializedWritesMiddleware',  # Only with SQLITE_WRITE_QUEUE = True
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'hospital.middleware.TenantMiddleware',  # Multi-tenant context management
+    'hospital.db_routers.ReplicaRoutingMiddleware',  # Replica reads for @replica_read views
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +61,8 @@ ROOT_URLCONF = 'santkrupa_hospital.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also reports render time to hospital.metrics
+        'BACKEND': 'hospital.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,12 +81,88 @@ WSGI_APPLICATION = 'santkrupa_hospital.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Chosen from the environment (unset: SQLite in BASE_DIR, as before):
+#   DB_ENGINE          sqlite | postgresql
+#   DB_NAME            SQLite file path, or PostgreSQL database name
+#   DB_USER, DB_PASSWORD, DB_HOST, DB_PORT   (PostgreSQL)
+#   DB_CONN_MAX_AGE    seconds a connection is reused (0 = per request)
+# psycopg (requirements.txt) is the PostgreSQL driver. `python manage.py
+# test` runs against whichever engine is selected; CI runs it on both
+# (.github/workflows/tests.yml).
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'santkrupa_hospital'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Persistent connections, checked before reuse so a restarted
+            # server or dropped connection does not fail the next request
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': 10},
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # SQLite production mode (see hospital.sqlite_production): WAL and
+            # tuned pragmas on every connection; IMMEDIATE transactions so
+            # concurrent writers wait up to `timeout` seconds for the lock
+            # instead of failing with "database is locked"
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=134217728;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgresql', not '{DB_ENGINE}'")
+
+# Optional read replica for the dashboards and reports (see
+# hospital.db_routers): DB_REPLICA_NAME (SQLite file or database name),
+# DB_REPLICA_HOST, DB_REPLICA_PORT; the rest is taken from 'default'
+if os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default'].get('HOST', '')),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+        'TEST': {'MIRROR': 'default'},
     }
-}
+
+
+# Clinics that keep their rows in a database of their own (see
+# hospital.tenant_databases): DB_CLINIC_DATABASES="<slug>=<SQLite file or
+# database name>,..." adds a 'clinic_<slug>' alias (same server settings as
+# 'default') and routes that clinic's requests to it
+TENANT_DATABASES = {}
+for _entry in filter(None, os.environ.get('DB_CLINIC_DATABASES', '').split(',')):
+    _slug, _, _name = _entry.strip().partition('=')
+    if not _slug or not _name:
+        raise ImproperlyConfigured(f"DB_CLINIC_DATABASES entry '{_entry}' is not <slug>=<name>")
+    DATABASES[f'clinic_{_slug}'] = {**DATABASES['default'], 'NAME': _name}
+    TENANT_DATABASES[_slug] = f'clinic_{_slug}'
+
+# The tenant router goes first: it claims the rows of clinics with their
+# own database, the replica router handles the rest
+DATABASE_ROUTERS = ['hospital.tenant_databases.TenantRouter', 'hospital.db_routers.ReplicaRouter']
 
 
 # Password validation
@@ -132,5 +215,92 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Specify the custom user model
 AUTH_USER_MODEL = 'hospital.User'
 
+# ClinicUserBackend loads request.user with its clinic in one query (see
+# hospital.auth_backends) and handles every new login. ModelBackend stays
+# listed so sessions saved by it before the switch keep resolving; it can go
+# once those have expired (SESSION_COOKIE_AGE).
+AUTHENTICATION_BACKENDS = [
+    'hospital.auth_backends.ClinicUserBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # Login URL
 LOGIN_URL = 'login'
+
+# Seconds a slug -> Clinic lookup stays in the per-process clinic cache
+# (entries are also dropped whenever a Clinic is saved or deleted)
+CLINIC_CACHE_TTL = 300
+
+# Seconds a clinic's in-memory medicine autocomplete index lives before it
+# is rebuilt (local writes update it immediately; see hospital.medicine_index)
+MEDICINE_INDEX_TTL = 600
+
+# Who creates queued patient logins (see hospital.provisioning):
+# 'thread' - a background thread in the web process, 'command' - only
+# `manage.py process_login_jobs` (run it from cron or a supervisor)
+PATIENT_LOGIN_WORKER = 'thread'
+
+# Rendered prescription PDFs (see hospital.prescription_pdf) live in a
+# file cache so every worker process shares them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'prescription_pdfs': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'prescription_pdfs',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # Per-process LRU in front of django_session (see hospital.sessions)
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+PRESCRIPTION_PDF_CACHE = 'prescription_pdfs'
+
+# Sessions are written through to the database and read from the 'sessions'
+# cache; a cached session lives at most SESSION_CACHE_MAX_AGE seconds, which
+# bounds how long other worker processes may still accept a logged-out
+# session (None for a cache shared by all processes)
+SESSION_ENGINE = 'hospital.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_CACHE_MAX_AGE = 60
+
+# Optional TTF fonts for prescription PDFs, e.g.
+# {'regular': '/usr/share/fonts/NotoSans-Regular.ttf', 'bold': ..., 'devanagari': ...}
+PRESCRIPTION_PDF_FONTS = {}
+
+# Request metrics (see hospital.metrics): requests kept per URL name for the
+# /ops/metrics/ percentiles, per-URL-name query budget overrides, and whether
+# a request over budget raises (turn on in tests) instead of logging
+METRICS_WINDOW = 1000
+QUERY_BUDGETS = {}
+QUERY_BUDGET_STRICT = False
+
+# Make the POST/PUT/PATCH/DELETE requests of each process take turns on an
+# in-process lock (see hospital.sqlite_production) so bursts of SQLite
+# writes queue up instead of failing; `manage.py sqlite_benchmark` shows
+# the effect
+SQLITE_WRITE_QUEUE = False
+
+# Read replica routing (see hospital.db_routers): fall back to the primary
+# when the replica is more than REPLICA_MAX_LAG seconds behind (checked at
+# most every REPLICA_LAG_CHECK_INTERVAL seconds); read from the primary for
+# REPLICA_STICKY_SECONDS after a browser's own write; extra URL names that
+# may read from the replica
+REPLICA_MAX_LAG = 10
+REPLICA_LAG_CHECK_INTERVAL = 5
+REPLICA_STICKY_SECONDS = 15
+REPLICA_VIEWS = []
+
+# Live check-in queue (see hospital.live_queue): whether the dashboards open
+# event streams (None = only when served through ASGI, where a stream does
+# not hold a worker thread; True / False to force), the pub/sub class behind
+# them (the default only reaches streams in the same process), the keepalive
+# interval and how long one stream stays open before the browser reconnects
+LIVE_QUEUE_ENABLED = None
+LIVE_QUEUE_BROKER = 'hospital.live_queue.InProcessBroker'
+LIVE_QUEUE_HEARTBEAT = 15
+LIVE_QUEUE_STREAM_SECONDS = 300
@@ -15,6 +15,9 @@ clinic_urlpatterns = [
     path('admin-dashboard/create-doctor/', views.create_doctor, name='create_doctor'),
     path('admin-dashboard/create-receptionist/', views.create_receptionist, name='create_receptionist'),
     path('admin-dashboard/all-patients/', views.view_all_patients, name='view_all_patients'),
+    path('admin-dashboard/all-patients/page/', views.view_all_patients_page, name='view_all_patients_page'),
+    path('admin-dashboard/import-patients/', views.import_patients, name='import_patients'),
+    path('admin-dashboard/export-prescriptions/', views.export_prescriptions, name='export_prescriptions'),
     path('admin-dashboard/all-doctors/', views.view_all_doctors, name='view_all_doctors'),
     path('admin-dashboard/all-receptionists/', views.view_all_receptionists, name='view_all_receptionists'),
     path('admin-dashboard/doctor/<int:doctor_id>/delete/', views.delete_doctor, name='delete_doctor'),
@@ -22,16 +25,19 @@ clinic_urlpatterns = [
 
     # Reception
     path('reception/dashboard/', views.reception_dashboard, name='reception_dashboard'),
+    path('reception/patients-page/', views.reception_patients_page, name='reception_patients_page'),
     path('reception/register-patient/', views.register_patient, name='register_patient'),
     path('reception/patient-search/', views.patient_search, name='patient_search'),
     path('reception/checkin-dashboard/', views.checkin_dashboard, name='checkin_dashboard'),
     path('reception/checkin-dashboard/search/', views.checkin_dashboard_search, name='checkin_dashboard_search'),
     path('reception/checkin/<int:visit_id>/', views.checkin_patient_details, name='checkin_patient_details'),
     path('reception/checkin/<int:visit_id>/update-status/', views.update_checkin_status, name='update_checkin_status'),
+    path('reception/checkin-queue/stream/', views.checkin_queue_stream, name='checkin_queue_stream'),
     path('reception/patient/<int:patient_id>/', views.view_patient_details, name='patient_details'),
     path('reception/patient/<int:patient_id>/edit/', views.edit_patient, name='edit_patient'),
     path('reception/patients-without-login/', views.patients_without_login, name='patients_without_login'),
     path('reception/patient/<int:patient_id>/enable-login/', views.enable_patient_login, name='enable_patient_login'),
+    path('reception/patients-without-login/enable-all/', views.enable_all_patient_logins, name='enable_all_patient_logins'),
     path('reception/patient/<int:patient_id>/upload-report/', views.receptionist_upload_medical_report, name='receptionist_upload_medical_report'),
     path('reception/patient-checkin/', views.patient_checkin, name='patient_checkin'),
     path('reception/patient/<int:patient_id>/delete/', views.delete_patient, name='delete_patient'),
@@ -39,6 +45,7 @@ clinic_urlpatterns = [
     # Doctor
     path('doctor/dashboard/', views.doctor_dashboard, name='doctor_dashboard'),
     path('doctor/dashboard/prescriptions-ajax/', views.doctor_dashboard_prescriptions_ajax, name='doctor_dashboard_prescriptions_ajax'),
+    path('doctor/dashboard/patients-ajax/', views.doctor_dashboard_patients_ajax, name='doctor_dashboard_patients_ajax'),
     path('doctor/prescription-tracking/', views.doctor_prescription_tracking, name='doctor_prescription_tracking'),
     path('doctor/create-prescription/<int:patient_id>/', views.create_prescription, name='create_prescription'),
     path('doctor/prescription/<int:prescription_id>/', views.add_prescription_details, name='add_prescription_details'),
@@ -90,6 +97,7 @@ clinic_urlpatterns = [
     path('admin-dashboard/manage-tests/', views.manage_master_tests, name='manage_master_tests'),
     path('admin-dashboard/delete-test/<int:test_id>/', views.delete_master_test, name='delete_master_test'),
     path('api/master-medicines/', views.api_master_medicines, name='api_master_medicines'),
+    path('api/master-catalog/', views.api_master_catalog, name='api_master_catalog'),
 
     # path('api/master-tests/', views.api_master_tests, name='api_master_tests'),
     path("api/master-tests/", views.api_master_tests, name="api_master_tests"),
@@ -117,8 +125,11 @@ urlpatterns = [
     path('superadmin/dashboard/', views.superadmin_dashboard, name='superadmin_dashboard'),
     path('superadmin/clinic/<int:clinic_id>/delete/', views.delete_clinic, name='delete_clinic'),
     path('superadmin/clinic/<int:clinic_id>/patients/', views.superadmin_clinic_patients, name='superadmin_clinic_patients'),
+    path('superadmin/clinic/<int:clinic_id>/patients/page/', views.superadmin_clinic_patients_page, name='superadmin_clinic_patients_page'),
     path('superadmin/clinic/<int:clinic_id>/doctors/', views.superadmin_clinic_doctors, name='superadmin_clinic_doctors'),
     path('superadmin/clinic/<int:clinic_id>/prescriptions/', views.superadmin_clinic_prescriptions, name='superadmin_clinic_prescriptions'),
+    path('superadmin/clinic-cache-stats/', views.superadmin_clinic_cache_stats, name='superadmin_clinic_cache_stats'),
+    path('ops/metrics/', views.ops_metrics, name='ops_metrics'),
 
     # Public pages (Global)
     path('', views.homepage, name='homepage'),